@@ -0,0 +1,66 @@
+"""
+Compara los renderers de gráficos (Pillow vs matplotlib).
+
+    python bench_charts.py [--runs 20]
+
+Genera historiales sintéticos de PRICE_HISTORY_POINTS puntos y mide, para cada renderer, el
+tiempo del primer gráfico (incluye importar la librería), el promedio de los siguientes y el
+tamaño del PNG, con los mismos tamaños que usa /cryptostatus.
+"""
+import argparse
+import random
+import statistics
+import time
+from array import array
+
+import charts
+
+PUNTOS = 288
+CHART_SIZE_SINGLE = (8, 3, 220)
+CHART_SIZE_MARKET = (10, 5, 220)
+
+
+def serie(rng, inicio):
+    valores = array("d")
+    precio = inicio
+    for _ in range(PUNTOS):
+        precio = max(1, precio * (1 + rng.uniform(-0.05, 0.05)))
+        valores.append(round(precio, 2))
+    return valores.tobytes()
+
+
+def medir(render, args, runs):
+    t0 = time.perf_counter()
+    png = render(*args)
+    primero = time.perf_counter() - t0
+    tiempos = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        png = render(*args)
+        tiempos.append(time.perf_counter() - t0)
+    return primero, statistics.mean(tiempos), len(png)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de renderers de gráficos")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    series = {"RSC": serie(rng, 100), "CTC": serie(rng, 200), "MMC": serie(rng, 50)}
+    print(f"{'renderer':<12} {'gráfico':<8} {'primero':>10} {'promedio':>10} {'PNG':>10}")
+    for nombre, (render_price, render_market) in charts.RENDERERS.items():
+        if not charts.renderer_available(nombre):
+            print(f"{nombre:<12} (no instalado)")
+            continue
+        casos = (
+            ("RSC", render_price, ("RSC", series["RSC"], CHART_SIZE_SINGLE)),
+            ("todas", render_market, (series, CHART_SIZE_MARKET)),
+        )
+        for grafico, render, render_args in casos:
+            primero, promedio, tamano = medir(render, render_args, args.runs)
+            print(f"{nombre:<12} {grafico:<8} {primero * 1e3:>8.1f}ms {promedio * 1e3:>8.1f}ms {tamano / 1024:>8.1f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark del tick de precios de las cryptos.
+
+    python bench_tick.py [--coins 500] [--runs 200]
+
+Mide compute_tick sola (la pasada vectorizada sobre los arrays) y el tick completo de
+MarketEngine (juntar precios y volúmenes, calcular y escribirlos en cryptos y en el historial)
+con --coins monedas sintéticas. Corre en un directorio temporal, así que no toca los datos reales.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="bench_tick_"))
+import bot  # noqa: E402
+
+
+def medir(fn, runs):
+    tiempos = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    return statistics.median(tiempos) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del tick de precios")
+    parser.add_argument("--coins", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    bot.journal.suspended = True
+    rng = random.Random(1234)
+    for i in range(args.coins):
+        bot.coin_registry.configure(f"C{i:05d}", precio_inicial=rng.uniform(1, 1000), volatilidad=rng.uniform(0.01, 0.1))
+    bot.sync_coins()
+    for sym in bot.CRYPTO_SYMBOLS:
+        bot.cryptos[sym]["volumen_24h"] = rng.uniform(-50_000, 50_000)
+
+    engine = bot.market_engine
+    n = len(engine.symbols)
+    prices = bot._vector(bot.cryptos[s]["price"] for s in engine.symbols)
+    volumes = bot._vector(bot.cryptos[s]["volumen_24h"] for s in engine.symbols)
+    rand = engine._random(n)
+    calculo = medir(lambda: bot.compute_tick(prices, volumes, engine.volatility, engine.max_change, rand), args.runs)
+    paso = medir(lambda: engine.step(bot.cryptos), args.runs)
+    reloj = iter(range(10**9))
+    tick = medir(lambda: engine.tick(1_700_000_000 + next(reloj) * bot.PRICE_TICK_SECONDS), args.runs)
+
+    print(f"Monedas:        {n:,} ({'NumPy' if bot.np is not None else 'sin NumPy'})")
+    print(f"compute_tick:   {calculo:.3f} ms")
+    print(f"step:           {paso:.3f} ms (junta precios/volúmenes + compute_tick)")
+    print(f"tick completo:  {tick:.3f} ms (incluye escribir cryptos e historial)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Prueba de carga de la liquidación de trades de crypto.
+
+    python bench_trades.py [--trades 1000] [--users 200]
+
+Lanza --trades compras y ventas concurrentes (usuarios y monedas al azar, algunas con saldo
+insuficiente a propósito) contra trade_settlement.submit con el consumidor corriendo, igual
+que los comandos. Mide la latencia de cada trade y cuántos batches hicieron falta, y verifica
+que no se creó ni se perdió plata: USD + crypto valuada al precio fijo, menos las comisiones,
+tiene que dar lo mismo antes y después. Corre en un directorio temporal, así que no toca los
+datos reales.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="bench_trades_"))
+import bot  # noqa: E402
+
+
+def patrimonio(uids):
+    precios = bot.crypto_prices()
+    holders = bot.cryptos["holders"]
+    usd = math.fsum(bot.balances.get(uid, 0) for uid in uids)
+    cripto = math.fsum(holders.get(uid, {}).get(sym, 0) * precio for uid in uids for sym, precio in precios.items())
+    return usd + cripto
+
+
+async def correr(args):
+    rng = random.Random(1234)
+    uids = [str(10**17 + i) for i in range(args.users)]
+    for uid in uids:
+        bot.balances[uid] = rng.randrange(0, 50_000)
+        for sym in bot.CRYPTO_SYMBOLS:
+            bot.set_holding(uid, sym, rng.choice((0, rng.uniform(0, 200))))
+    antes = patrimonio(uids)
+    registros_antes = bot.journal.records
+
+    consumidor = asyncio.create_task(bot.trade_settlement.run())
+    latencias = []
+
+    async def trade(uid, sym, lado, cantidad):
+        t0 = time.perf_counter()
+        resultado = await bot.trade_settlement.submit(uid, sym, lado, cantidad)
+        latencias.append(time.perf_counter() - t0)
+        return resultado
+
+    trades = []
+    for _ in range(args.trades):
+        lado = rng.choice(("buy", "sell"))
+        cantidad = None if rng.random() < 0.1 else (rng.uniform(1, 20_000) if lado == "buy" else rng.uniform(0.01, 150))
+        trades.append(trade(rng.choice(uids), rng.choice(bot.CRYPTO_SYMBOLS), lado, cantidad))
+    t0 = time.perf_counter()
+    resultados = await asyncio.gather(*trades)
+    total = time.perf_counter() - t0
+    consumidor.cancel()
+
+    comisiones = math.fsum(r["comision"] for r in resultados if "error" not in r)
+    despues = patrimonio(uids)
+    ok = math.isclose(antes, despues + comisiones, rel_tol=1e-9, abs_tol=1e-6)
+    stats = bot.trade_settlement.stats
+    latencias.sort()
+    print(f"Trades:      {args.trades:,} concurrentes ({stats['trades']:,} ejecutados, {stats['rechazados']:,} rechazados)")
+    print(f"Batches:     {stats['batches']:,} (máximo {stats['max_batch']:,} trades)")
+    print(f"Tiempo:      {total * 1000:.1f} ms en total • {args.trades / total:,.0f} trades/s")
+    print(f"Latencia:    p50 {statistics.median(latencias) * 1000:.1f} ms • p99 {latencias[int(len(latencias) * 0.99) - 1] * 1000:.1f} ms")
+    print(f"Journal:     {bot.journal.records - registros_antes:,} registro(s)")
+    print(f"Patrimonio:  {antes:,.2f} antes • {despues:,.2f} + {comisiones:,.2f} de comisiones después {'✅' if ok else '❌'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la liquidación de trades")
+    parser.add_argument("--trades", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args(argv)
+    return 0 if asyncio.run(correr(args)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Benchmark del camino de XP de on_message.
+
+    python bench_xp.py [--messages 500000] [--users 5000] [--rate 200]
+
+Reproduce un stream sintético de mensajes (usuarios al azar, reloj simulado a --rate mensajes
+por segundo) contra award_message_xp y aplica el buffer cada XP_BATCH_SECONDS de reloj simulado,
+igual que la tarea de fondo. Corre en un directorio temporal con el journal suspendido,
+así que no toca los datos reales.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="bench_xp_"))
+import bot  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del XP por mensajes")
+    parser.add_argument("--messages", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--rate", type=float, default=200.0, help="mensajes por segundo simulados")
+    args = parser.parse_args(argv)
+
+    bot.journal.suspended = True
+    rng = random.Random(1234)
+    stream = [(str(10**17 + rng.randrange(args.users)), rng.randrange(4)) for _ in range(args.messages)]
+    nombres = {uid: f"user{uid[-5:]}" for uid, _ in stream}
+
+    reloj = time.time()
+    paso = 1 / args.rate
+    proximo_batch = reloj + bot.XP_BATCH_SECONDS
+    tiempo_mensajes = 0.0
+    tiempo_batches = 0.0
+    otorgados = 0
+    batches = 0
+    for uid, canal in stream:
+        reloj += paso
+        t0 = time.perf_counter()
+        otorgados += bot.award_message_xp(uid, nombres[uid], canal, reloj)
+        t1 = time.perf_counter()
+        tiempo_mensajes += t1 - t0
+        if reloj >= proximo_batch:
+            bot.xp_batcher.apply()
+            tiempo_batches += time.perf_counter() - t1
+            proximo_batch += bot.XP_BATCH_SECONDS
+            batches += 1
+    t0 = time.perf_counter()
+    bot.xp_batcher.apply()
+    tiempo_batches += time.perf_counter() - t0
+
+    total = tiempo_mensajes + tiempo_batches
+    print(f"Mensajes:        {args.messages:,} ({otorgados:,} con XP, {args.users:,} usuarios)")
+    print(f"on_message:      {args.messages / tiempo_mensajes:,.0f} msg/s ({tiempo_mensajes / args.messages * 1e6:.2f} µs/msg)")
+    print(f"Batches:         {batches + 1:,} en {tiempo_batches:.3f}s")
+    print(f"Total:           {args.messages / total:,.0f} msg/s")
+    stats = bot.level_up_announcer.stats
+    print(f"Subidas de nivel: {stats['encolados']:,} encoladas, {stats['combinados']:,} combinadas, {stats['descartados']:,} descartadas")
+    print(f"Cola de anuncios: {bot.level_up_announcer.depth:,} en {len(bot.level_up_announcer.pending):,} canales")
+
+
+if __name__ == "__main__":
+    main()
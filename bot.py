@@ -1,15 +1,33 @@
 import os
+import abc
 import json
+import sqlite3
+import atexit
+import struct
+import bisect
+import heapq
+import hashlib
+import zipfile
+import math
+import sys
 import random
 import asyncio
 import io
-from datetime import datetime, time, timedelta
+import time
+import itertools
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from array import array
 from threading import Thread
 from typing import Optional
+import charts
 try:
-    import matplotlib.pyplot as plt
+    import numpy as np
 except Exception:
-    plt = None
+    np = None
 
 from dotenv import load_dotenv
 from flask import Flask
@@ -65,7 +83,7 @@ TRANSACTIONS_FILE = os.path.join(DATA_DIR, "transactions.json")
 LEVELS_FILE = os.path.join(DATA_DIR, "levels.json")
 XP_CONFIG_FILE = os.path.join(DATA_DIR, "xp_config.json")
 LEVEL_PRICE_FILE = os.path.join(DATA_DIR, "level_price.json")
-PRICE_HISTORY_FILE = os.path.join(DATA_DIR, "price_history.json")
+PRICE_HISTORY_FILE = os.path.join(DATA_DIR, "price_history.bin")
 BUFFS_FILE = os.path.join(DATA_DIR, "buffs.json")
 CASINO_STOCK_FILE = os.path.join(DATA_DIR, "casino_stock.json")
 
@@ -75,35 +93,322 @@ def load_json(path, default=None):
         try:
             with open(path, "r", encoding="utf-8") as f:
                 return json.load(f)
-        except:
-            return default or {}
-    return default or {}
+        except Exception as e:
+            # No pisamos el archivo roto con {}: lo apartamos para poder recuperarlo a mano
+            corrupto = f"{path}.corrupto"
+            print(f"⚠️ No se pudo leer {path} ({e}). Se movió a {corrupto}")
+            try:
+                os.replace(path, corrupto)
+            except OSError:
+                pass
+    return dict(default) if default else {}
+
+def write_atomic(path, text):
+    """Escribe en un temporal, fsync y rename: nunca queda un archivo a medio escribir."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
 def save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    write_atomic(path, json.dumps(data, indent=4, ensure_ascii=False))
+
+def _copy_json(data):
+    """Copia de dicts y listas anidados (lo que cabe en un JSON); los valores sueltos son inmutables."""
+    if isinstance(data, dict):
+        return {k: _copy_json(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_copy_json(v) for v in data]
+    return data
+
+
+# ========== PERSISTENCIA DIFERIDA (write-behind) ==========
+FLUSH_INTERVAL_MS = 500
+
+persistent_stores = []
+flush_lock = asyncio.Lock()
+
+class PersistentStore(abc.ABC):
+    """
+    Base de los stores residentes en memoria. save() solo marca cambios;
+    persistence_loop() junta todos los cambios de FLUSH_INTERVAL_MS y los baja a disco de una vez.
+    """
+
+    dirty = False
+
+    def register(self):
+        persistent_stores.append(self)
+
+    def save(self):
+        self.dirty = True
+
+    @abc.abstractmethod
+    def prepare_flush(self):
+        """
+        Corre en el event loop: toma una copia consistente de lo pendiente y devuelve
+        una función que hace la escritura (se ejecuta en un hilo), o None si no hay cambios.
+        Serializar va en esa función, no acá: en el loop solo se copia.
+        """
+
+    def flush_failed(self):
+        """El último flush no llegó a disco: vuelve a marcar lo pendiente para el próximo."""
+        self.dirty = True
+
+class JsonStore(PersistentStore, dict):
+    """dict residente respaldado por un archivo JSON que se escribe de forma atómica."""
+
+    def __init__(self, path, default=None):
+        dict.__init__(self, load_json(path, default))
+        self.path = path
+        self.register()
+
+    def save(self, data=None):
+        if data is not None and data is not self:
+            self.clear()
+            self.update(data)
+        self.dirty = True
+
+    def snapshot(self):
+        return _copy_json(self)
+
+    def prepare_flush(self):
+        if not self.dirty:
+            return None
+        self.dirty = False
+        data = self.snapshot()
+        return lambda: save_json(self.path, data)
+
+def _run_flush_jobs(jobs):
+    for job in jobs:
+        job()
+
+def _collect_flush_jobs():
+    """Devuelve (stores, jobs). Si falla un prepare_flush, los que ya soltaron sus cambios los recuperan."""
+    stores = []
+    jobs = []
+    for store in persistent_stores:
+        try:
+            job = store.prepare_flush()
+        except Exception:
+            _flush_failed(stores + [store])
+            raise
+        if job is not None:
+            stores.append(store)
+            jobs.append(job)
+    return stores, jobs
+
+def _flush_failed(stores):
+    # Marcarlos a todos otra vez: reescribir los que sí llegaron a disco no hace daño
+    for store in stores:
+        store.flush_failed()
+
+async def flush_stores():
+    async with flush_lock:
+        segmentos = journal.rotate()
+        stores, jobs = _collect_flush_jobs()
+        if jobs or segmentos:
+            try:
+                await asyncio.to_thread(_run_flush_jobs, jobs)
+            except Exception:
+                _flush_failed(stores)
+                raise
+        # Los stores ya están en disco: el journal hasta acá sobra
+        journal.discard(segmentos)
+
+def flush_stores_sync():
+    """Flush bloqueante para el arranque y el apagado (fuera del event loop)."""
+    segmentos = journal.rotate()
+    stores, jobs = _collect_flush_jobs()
+    try:
+        _run_flush_jobs(jobs)
+    except Exception:
+        _flush_failed(stores)
+        raise
+    journal.discard(segmentos)
+
+# ========== JOURNAL DE LA ECONOMÍA ==========
+JOURNAL_DIR = os.path.join(DATA_DIR, "journal")
+
+class EconomyJournal:
+    """
+    Log append-only de eventos de la economía (débitos, créditos, trades de crypto, niveles).
+    Cada registro es un largo de 4 bytes + JSON y guarda el valor final, así que reaplicarlo
+    es idempotente. Los archivos en disco de los stores son el snapshot: cuando un flush
+    termina, los segmentos que ya quedaron reflejados se borran (compactación), y al arrancar
+    solo se reaplica lo que quedó en el journal después del último flush.
+    """
+
+    HEADER = struct.Struct(">I")
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.seq = 0
+        self.suspended = False
+        self.pending = None
+        self.segment_id = max(self._segment_ids(), default=0) + 1
+        self.fd = None
+        self.records = 0
+        self.closed = []   # segmentos cerrados que todavía no se compactaron (en orden)
+
+    def _segment_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".log"):
+                try:
+                    ids.append(int(name[:-4]))
+                except ValueError:
+                    pass
+        return sorted(ids)
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"{segment_id:08d}.log")
+
+    def append(self, kind, **fields):
+        if self.suspended:
+            return
+        if self.pending is not None:
+            fields["k"] = kind
+            self.pending.append(fields)
+            return
+        if self.fd is None:
+            self.fd = os.open(self._segment_path(self.segment_id), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.seq += 1
+        fields["k"] = kind
+        fields["seq"] = self.seq
+        payload = json.dumps(fields, separators=(",", ":")).encode("utf-8")
+        # Una sola escritura por registro: sobrevive a un crash del proceso sin esperar al flush
+        os.write(self.fd, self.HEADER.pack(len(payload)) + payload)
+        self.records += 1
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Junta todos los registros del bloque en uno solo ("batch"): se escribe con un único
+        write, así que al recuperar se reaplican todos o ninguno. Si el bloque falla no se
+        escribe nada; deshacer lo que se alcanzó a cambiar en memoria queda a cargo de quien llama.
+        """
+        if self.pending is not None:
+            yield
+            return
+        self.pending = []
+        try:
+            yield
+        except BaseException:
+            self.pending = None
+            raise
+        registros, self.pending = self.pending, None
+        if registros:
+            self.append("batch", r=registros)
+
+    def rotate(self):
+        """
+        Cierra el segmento actual (si tiene registros) y devuelve todos los cerrados que se
+        compactan si este flush termina bien. Los de un flush que falló siguen en la lista
+        hasta que uno funcione: si se borrara solo el último, al arrancar se reaplicarían los
+        anteriores (con valores finales viejos) encima de datos más nuevos.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self.closed.append(self.segment_id)
+            self.segment_id += 1
+            self.records = 0
+        return list(self.closed)
+
+    def discard(self, segment_ids):
+        for segment_id in segment_ids:
+            try:
+                os.remove(self._segment_path(segment_id))
+            except FileNotFoundError:
+                pass
+        borrados = set(segment_ids)
+        self.closed = [i for i in self.closed if i not in borrados]
+
+    def read_segment(self, segment_id):
+        path = self._segment_path(segment_id)
+        with open(path, "rb") as f:
+            data = f.read()
+        pos = 0
+        size = self.HEADER.size
+        while pos + size <= len(data):
+            (length,) = self.HEADER.unpack_from(data, pos)
+            end = pos + size + length
+            if end > len(data):
+                break  # registro cortado por un crash
+            try:
+                yield json.loads(data[pos + size:end])
+            except ValueError:
+                break
+            pos = end
+
+    def recover(self, apply):
+        """Reaplica los segmentos pendientes en orden y los compacta en los stores."""
+        pendientes = [i for i in self._segment_ids() if i < self.segment_id]
+        if not pendientes:
+            return 0
+        aplicados = 0
+        self.suspended = True
+        try:
+            for segment_id in pendientes:
+                for record in self.read_segment(segment_id):
+                    apply(record)
+                    aplicados += 1
+        finally:
+            self.suspended = False
+        flush_stores_sync()
+        self.discard(pendientes)
+        print(f"♻️ Journal: {aplicados} eventos recuperados de {len(pendientes)} segmento(s)")
+        return aplicados
+
+journal = EconomyJournal(JOURNAL_DIR)
+
+async def persistence_loop():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_MS / 1000)
+        try:
+            await flush_stores()
+        except Exception as e:
+            print(f"Error guardando datos: {e}")
 
 
 # ========== CASINO STOCK ==========
 CASINO_STOCK_INICIAL = 5000000  # 5,000,000 USD
 CASINO_STOCK_MINIMO = 50000      # 50,000 USD
 
-def load_casino_stock():
-    data = load_json(CASINO_STOCK_FILE, {"stock": CASINO_STOCK_INICIAL})
-    return data.get("stock", CASINO_STOCK_INICIAL)
+class CasinoBankroll(JsonStore):
+    """
+    Stock del casino residente en memoria con totales por juego (apostado, pagado, manos).
+    Las actualizaciones son síncronas dentro del event loop, así que dos apuestas
+    concurrentes no pueden pisarse; el flush diferido las baja a disco.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, {"stock": CASINO_STOCK_INICIAL})
+        self.setdefault("juegos", {})
 
-def save_casino_stock(stock):
-    save_json(CASINO_STOCK_FILE, {"stock": stock})
+    @property
+    def stock(self):
+        return self.get("stock", CASINO_STOCK_INICIAL)
 
-def update_casino_stock(cambio):
-    stock = load_casino_stock()
-    nuevo_stock = stock + cambio
-    if nuevo_stock < 0:
-        nuevo_stock = 0
-    save_casino_stock(nuevo_stock)
-    return nuevo_stock
+    def record(self, game, wagered, paid):
+        """Registra una mano: el casino cobra lo apostado y paga el premio (incluye la apuesta devuelta)."""
+        self["stock"] = max(0, self.stock + wagered - paid)
+        totales = self["juegos"].setdefault(game, {"apostado": 0, "pagado": 0, "manos": 0})
+        totales["apostado"] += wagered
+        totales["pagado"] += paid
+        totales["manos"] += 1
+        self.save()
+        return self["stock"]
 
-casino_stock = load_casino_stock()
+    def adjust(self, cambio):
+        self["stock"] = max(0, self.stock + cambio)
+        self.save()
+        return self["stock"]
+
+casino_bankroll = CasinoBankroll(CASINO_STOCK_FILE)
 
 
 # ========== FUNCIONES DE NIVELES ==========
@@ -112,21 +417,51 @@ def xp_required_for_level(level):
         return 5 * (1 ** 2)
     return 5 * ((level + 1) ** 2)
 
+# Tabla de XP acumulada: LEVEL_XP_TABLE[n] = XP total para llegar al nivel n.
+# Se precalcula una vez y crece al doble si alguien la supera.
+LEVEL_XP_TABLE = [0]
+_level_xp_array = None
+
+def _extend_level_table(hasta_nivel):
+    global _level_xp_array
+    total = LEVEL_XP_TABLE[-1]
+    for lvl in range(len(LEVEL_XP_TABLE), hasta_nivel + 1):
+        total += xp_required_for_level(lvl - 1)
+        LEVEL_XP_TABLE.append(total)
+    _level_xp_array = None
+
+def _ensure_level_table(xp):
+    while LEVEL_XP_TABLE[-1] <= xp:
+        _extend_level_table(max(1000, 2 * len(LEVEL_XP_TABLE)))
+
+_extend_level_table(1000)
+
 def total_xp_for_level(level):
     if level <= 0:
         return 0
-    total = 0
-    for lvl in range(1, level + 1):
-        total += xp_required_for_level(lvl - 1)
-    return total
+    if level >= len(LEVEL_XP_TABLE):
+        _extend_level_table(max(level, 2 * len(LEVEL_XP_TABLE)))
+    return LEVEL_XP_TABLE[level]
 
 def level_from_xp(xp):
     if xp <= 0:
         return 0
-    level = 0
-    while total_xp_for_level(level + 1) <= xp:
-        level += 1
-    return level
+    _ensure_level_table(xp)
+    return bisect.bisect_right(LEVEL_XP_TABLE, xp) - 1
+
+def levels_from_xp_batch(xps):
+    """Convierte muchas XP a niveles de una sola vez (vectorizado con NumPy si está disponible)."""
+    global _level_xp_array
+    if np is None:
+        return [level_from_xp(xp) for xp in xps]
+    xps = np.asarray(xps, dtype=np.float64)
+    if xps.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    _ensure_level_table(float(xps.max()))
+    if _level_xp_array is None:
+        _level_xp_array = np.asarray(LEVEL_XP_TABLE, dtype=np.float64)
+    niveles = np.searchsorted(_level_xp_array, xps, side="right") - 1
+    return np.maximum(niveles, 0)
 
 def xp_progress(level, xp):
     if level == 0:
@@ -137,24 +472,261 @@ def xp_progress(level, xp):
         xp_in_current = xp - total_xp_for_level(level)
         return xp_in_current, xp_needed
 
+# ========== AGREGADOS DE LA ECONOMÍA ==========
+class EconomyAggregates:
+    """
+    Totales de la economía mantenidos en cada cambio (balances, XP, tenencias), para que
+    /info, /profile y el precio del nivel los lean en O(1) en vez de recorrer todo.
+    rebuild() los recalcula desde cero: se usa al arrancar y después de un /restore.
+    El dinero total se acumula sin error de redondeo (sumas parciales, como math.fsum), así
+    no se va corriendo de sum(balances) con millones de cambios en floats.
+    """
+
+    def __init__(self):
+        self._money_partials = []
+        self.positive_users = 0
+        self.crypto_holders = 0
+        self.total_levels = 0
+        self.users_with_level = 0
+
+    @property
+    def money_supply(self):
+        total = math.fsum(self._money_partials)
+        return int(total) if total.is_integer() else total
+
+    def _add_money(self, x):
+        # Suma exacta de Shewchuk: cada parcial guarda el error de redondeo de la anterior
+        i = 0
+        for y in self._money_partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                self._money_partials[i] = lo
+                i += 1
+            x = hi
+        self._money_partials[i:] = [x]
+
+    def balance_changed(self, anterior, nuevo):
+        self._add_money(float(nuevo))
+        self._add_money(-float(anterior))
+        self.positive_users += (nuevo > 0) - (anterior > 0)
+
+    def level_changed(self, xp_anterior, xp_nueva):
+        anterior, nuevo = level_from_xp(xp_anterior), level_from_xp(xp_nueva)
+        self.total_levels += nuevo - anterior
+        self.users_with_level += (nuevo > 0) - (anterior > 0)
+
+    def holding_changed(self, total_anterior, total_nuevo):
+        self.crypto_holders += (total_nuevo > 0) - (total_anterior > 0)
+
+    def rebuild_balances(self):
+        self._money_partials = []
+        for b in balances.values():
+            self._add_money(float(b))
+        self.positive_users = sum(1 for b in balances.values() if b > 0)
+
+    def rebuild(self):
+        self.rebuild_balances()
+        niveles = levels_from_xp_batch([data.get("xp", 0) for data in levels_store.values()])
+        self.total_levels = int(sum(niveles))
+        self.users_with_level = sum(1 for n in niveles if n > 0)
+        self.crypto_holders = sum(1 for h in cryptos.get("holders", {}).values() if sum(h.values()) > 0)
+
+economy_stats = EconomyAggregates()
+
+class RankIndex:
+    """
+    Ranking de balances positivos siempre ordenado: una lista ordenada partida en buckets de
+    ~LOAD claves (-balance, uid) más un árbol de Fenwick con el tamaño de cada bucket.
+    Actualizar, la posición de un usuario y ubicar el k-ésimo son O(log n), así que el
+    leaderboard, /rank y "cerca mío" no ordenan a todos los usuarios en cada consulta.
+    Los usuarios que se fueron del servidor quedan en `excluded` y no rankean hasta que vuelvan.
+    """
+
+    LOAD = 256
+
+    def __init__(self):
+        self.keys: dict[str, tuple] = {}
+        self.excluded: set[str] = set()
+        self.buckets: list[list] = []
+        self.maxes: list[tuple] = []
+        self.tree: list[int] = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build_tree(self):
+        n = len(self.buckets)
+        self.tree = [len(b) for b in self.buckets]
+        for i in range(n):
+            j = i | (i + 1)
+            if j < n:
+                self.tree[j] += self.tree[i]
+
+    def _tree_add(self, i, delta):
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i |= i + 1
+
+    def _prefix(self, i):
+        """Cantidad de claves en los buckets [0, i)."""
+        total = 0
+        while i > 0:
+            total += self.tree[i - 1]
+            i &= i - 1
+        return total
+
+    def _find(self, k):
+        """Bucket y offset de la clave en la posición k (0-based)."""
+        pos = 0
+        bit = 1 << len(self.tree).bit_length()
+        while bit:
+            nxt = pos + bit
+            if nxt <= len(self.tree) and self.tree[nxt - 1] <= k:
+                k -= self.tree[nxt - 1]
+                pos = nxt
+            bit >>= 1
+        return pos, k
+
+    def rebuild(self, items):
+        self.keys = {uid: (-b, uid) for uid, b in items if b > 0 and uid not in self.excluded}
+        ordenadas = sorted(self.keys.values())
+        self.buckets = [ordenadas[i:i + self.LOAD] for i in range(0, len(ordenadas), self.LOAD)]
+        self.maxes = [b[-1] for b in self.buckets]
+        self._build_tree()
+
+    def update(self, uid, balance):
+        self.remove(uid)
+        if balance <= 0 or uid in self.excluded:
+            return
+        key = self.keys[uid] = (-balance, uid)
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self._build_tree()
+            return
+        i = min(bisect.bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        bisect.insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.LOAD:
+            self.buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self.maxes[i:i + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+            self._build_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, uid):
+        key = self.keys.pop(uid, None)
+        if key is None:
+            return
+        i = bisect.bisect_left(self.maxes, key)
+        bucket = self.buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            self.maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+            self._build_tree()
+
+    def exclude(self, uid):
+        self.excluded.add(uid)
+        self.remove(uid)
+
+    def include(self, uid, balance):
+        if uid in self.excluded:
+            self.excluded.discard(uid)
+            self.update(uid, balance)
+
+    def rank(self, uid):
+        """Posición 1-based del usuario, o None si no tiene balance positivo."""
+        key = self.keys.get(uid)
+        if key is None:
+            return None
+        i = bisect.bisect_left(self.maxes, key)
+        return self._prefix(i) + bisect.bisect_left(self.buckets[i], key) + 1
+
+    def range(self, start, count):
+        """Lista de (uid, balance) desde la posición start (0-based)."""
+        resultado = []
+        if start >= len(self.keys) or count <= 0:
+            return resultado
+        i, j = self._find(max(0, start))
+        while i < len(self.buckets) and len(resultado) < count:
+            for neg, uid in self.buckets[i][j:j + count - len(resultado)]:
+                resultado.append((uid, -neg))
+            i, j = i + 1, 0
+        return resultado
+
+    def top(self, k):
+        return self.range(0, k)
+
+    def around(self, uid, radio=5):
+        """Los usuarios alrededor de uid: (posición del primero, lista) o None si no rankea."""
+        posicion = self.rank(uid)
+        if posicion is None:
+            return None
+        inicio = max(0, min(posicion - 1 - radio, len(self.keys) - (2 * radio + 1)))
+        return inicio + 1, self.range(inicio, 2 * radio + 1)
+
+balance_rank = RankIndex()
+
+class LevelStore(JsonStore):
+    """
+    XP de todos los usuarios residente en memoria: se carga una sola vez, se modifica
+    en el lugar y se persiste con el flush diferido como el resto de los stores.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.changed_since_backup = set()
+
+    def get_xp(self, uid):
+        entry = self.get(uid)
+        return entry.get("xp", 0) if entry else 0
+
+    def set_xp(self, uid, xp, nombre=None):
+        entry = self.setdefault(uid, {})
+        economy_stats.level_changed(entry.get("xp", 0), xp)
+        entry["xp"] = xp
+        if nombre is not None:
+            entry["nombre"] = nombre
+        self.changed_since_backup.add(uid)
+        self.save()
+        journal.append("level", u=uid, xp=xp)
+
+    def add_xp(self, uid, amount, nombre=None):
+        """Suma XP y devuelve (xp_anterior, xp_nueva)."""
+        anterior = self.get_xp(uid)
+        self.set_xp(uid, anterior + amount, nombre)
+        return anterior, anterior + amount
+
+levels_store = LevelStore(LEVELS_FILE)
+xp_config_store = JsonStore(XP_CONFIG_FILE, {"cooldown": 60, "base_xp": 15, "max_xp": 25})
+level_price_store = JsonStore(LEVEL_PRICE_FILE, {"price": 122})
+
 def load_levels():
-    return load_json(LEVELS_FILE, {})
+    return levels_store
 
 def save_levels(data):
-    save_json(LEVELS_FILE, data)
+    levels_store.save(data)
 
 def load_xp_config():
-    return load_json(XP_CONFIG_FILE, {"cooldown": 60, "base_xp": 15, "max_xp": 25})
+    return xp_config_store
 
 def save_xp_config(data):
-    save_json(XP_CONFIG_FILE, data)
+    xp_config_store.save(data)
 
 def load_level_price():
-    data = load_json(LEVEL_PRICE_FILE, {"price": 122})
-    return data.get("price", 122)
+    return level_price_store.get("price", 122)
 
 def save_level_price(price):
-    save_json(LEVEL_PRICE_FILE, {"price": price})
+    level_price_store["price"] = price
+    level_price_store.save()
 
 def calcular_precio_nivel(dinero_total):
     if dinero_total <= 0:
@@ -164,17 +736,157 @@ def calcular_precio_nivel(dinero_total):
     return max(50, min(precio, 5000))
 
 def update_level_price_auto():
-    balances_data = load_json(BALANCES_FILE, {})
-    dinero_total = sum(balances_data.values())
+    dinero_total = economy_stats.money_supply
     nuevo_precio = calcular_precio_nivel(dinero_total)
     precio_actual = load_level_price()
     if nuevo_precio != precio_actual:
         save_level_price(nuevo_precio)
         print(f"💰 Precio de nivel actualizado: {precio_actual} → {nuevo_precio}")
     return nuevo_precio
+# ========== BALANCES (SQLite) ==========
+DB_FILE = "resona.db"
+
+class BalanceStore(PersistentStore, dict):
+    """
+    Balances en memoria (caché de lectura) respaldados por la tabla `users` de resona.db.
+    Cada escritura marca al usuario como modificado y el flush persiste solo esas filas
+    con un UPSERT por fila, así que el costo no depende de cuántos usuarios haya.
+    """
+
+    UPSERT_SQL = (
+        "INSERT INTO users (user_id, balance) VALUES (?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET balance = excluded.balance"
+    )
+    DELETE_SQL = "DELETE FROM users WHERE user_id = ?"
+
+    def __init__(self, db_path):
+        dict.__init__(self)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, balance REAL DEFAULT 0)")
+        self._dirty = set()
+        self._deleted = set()
+        self._inflight = set()   # lo que soltó el último prepare_flush
+        self.changed_since_backup = set()
+        for user_id, balance in self.db.execute("SELECT user_id, balance FROM users"):
+            dict.__setitem__(self, str(user_id), self._from_db(balance))
+        self.register()
+
+    @staticmethod
+    def _from_db(balance):
+        # SQLite devuelve REAL; mantenemos enteros como int igual que el JSON viejo
+        if isinstance(balance, float) and balance.is_integer():
+            return int(balance)
+        return balance
+
+    def __setitem__(self, uid, amount):
+        anterior = self.get(uid, 0)
+        dict.__setitem__(self, uid, amount)
+        economy_stats.balance_changed(anterior, amount)
+        balance_rank.update(uid, amount)
+        self._dirty.add(uid)
+        self._deleted.discard(uid)
+        self.changed_since_backup.add(uid)
+        journal.append("debit" if amount < anterior else "credit", u=uid, a=amount - anterior, b=amount)
+
+    def __delitem__(self, uid):
+        economy_stats.balance_changed(self[uid], 0)
+        balance_rank.remove(uid)
+        dict.__delitem__(self, uid)
+        self._dirty.discard(uid)
+        self._deleted.add(uid)
+        self.changed_since_backup.add(uid)
+        journal.append("delete", u=uid)
+
+    def setdefault(self, uid, default=0):
+        if uid not in self:
+            self[uid] = default
+        return self[uid]
+
+    def update(self, *args, **kwargs):
+        for uid, amount in dict(*args, **kwargs).items():
+            self[uid] = amount
+
+    def pop(self, uid, *default):
+        if uid in self:
+            amount = self[uid]
+            del self[uid]
+            return amount
+        if default:
+            return default[0]
+        raise KeyError(uid)
+
+    def clear(self):
+        for uid in list(self.keys()):
+            del self[uid]
+
+    def swap_contents(self, data):
+        """
+        Reemplaza todos los balances de una (usado por /restore). Son operaciones de dict/set
+        en C, así que no frena el event loop aunque sean muchos usuarios; no pasa por el journal
+        porque quien restaura hace un flush completo enseguida.
+        """
+        self._deleted.update(self.keys() - data.keys())
+        dict.clear(self)
+        dict.update(self, data)
+        self._deleted.difference_update(data.keys())
+        self._dirty = set(data.keys())
+        self.changed_since_backup.update(self._dirty, self._deleted)
+        economy_stats.rebuild_balances()
+        balance_rank.rebuild(self.items())
+
+    def import_json(self, path):
+        """
+        Migra balances.json a la tabla la primera vez que arranca con SQLite. Lo que diga el
+        JSON pisa lo que ya hubiera en la tabla (era la fuente de verdad hasta ahora), y después
+        se aparta como .migrado para no volver a importarlo.
+        """
+        data = load_json(path, {})
+        if data:
+            # La migración ya queda en SQLite de una: no hace falta pasarla por el journal
+            journal.suspended = True
+            try:
+                self.update(data)
+            finally:
+                journal.suspended = False
+            _run_flush_jobs([self.prepare_flush()])
+            print(f"📥 {len(data)} balances migrados de {path} a {DB_FILE}")
+        if os.path.exists(path):
+            os.replace(path, f"{path}.migrado")
+
+    def prepare_flush(self):
+        if not self._dirty and not self._deleted:
+            return None
+        rows = [(int(uid), self[uid]) for uid in self._dirty]
+        deleted = [(int(uid),) for uid in self._deleted]
+        self._inflight = self._dirty | self._deleted
+        self._dirty.clear()
+        self._deleted.clear()
+        return lambda: self._write(rows, deleted)
+
+    def flush_failed(self):
+        # Se vuelven a marcar según cómo están ahora, que puede no ser como estaban en el flush
+        for uid in self._inflight:
+            if uid in self:
+                self._dirty.add(uid)
+                self._deleted.discard(uid)
+            else:
+                self._deleted.add(uid)
+        self._inflight = set()
+
+    def _write(self, rows, deleted):
+        with self.db:
+            if rows:
+                self.db.executemany(self.UPSERT_SQL, rows)
+            if deleted:
+                self.db.executemany(self.DELETE_SQL, deleted)
+
 # ========== DATOS PERSISTENTES ==========
-balances = load_json(BALANCES_FILE, {})
-shared_accounts = load_json(SHARED_FILE, {})
+balances = BalanceStore(DB_FILE)
+if os.path.exists(BALANCES_FILE):
+    balances.import_json(BALANCES_FILE)
+shared_accounts = JsonStore(SHARED_FILE)
 PRECIO_NIVEL = load_level_price()
 
 def embed_card(title=None, description=None):
@@ -208,9 +920,25 @@ class MyBot(commands.Bot):
         super().__init__(**kwargs)
 
     async def setup_hook(self):
+        self.add_dynamic_items(LeaderboardButton)
+        self.loop.create_task(persistence_loop())
         self.loop.create_task(update_crypto_prices())
         self.loop.create_task(update_level_price_periodically())
         self.loop.create_task(keep_alive_ping())
+        self.loop.create_task(xp_batch_loop())
+        self.loop.create_task(level_up_announcer.run())
+        self.loop.create_task(trade_settlement.run())
+
+    async def close(self):
+        # Bajar a disco todo lo pendiente antes de cortar la conexión
+        try:
+            xp_batcher.apply()
+            await flush_stores()
+        except Exception as e:
+            print(f"Error guardando datos al cerrar: {e}")
+        if chart_pool is not None:
+            chart_pool.shutdown(wait=False, cancel_futures=True)
+        await super().close()
 
 bot_kwargs = {
     "command_prefix": "/",
@@ -231,10 +959,268 @@ async def keep_alive_ping():
         except Exception as e:
             print(f"Error en keep-alive: {e}")
 
+# ============================
+# COOLDOWNS
+# ============================
+COOLDOWNS_FILE = os.path.join(DATA_DIR, "cooldowns.json")
+POST_COOLDOWN_FILE = os.path.join(DATA_DIR, "post_cooldowns.json")
+
+XP_COOLDOWN = 60
+CRIME_COOLDOWN = 10 * 60
+DAILY_COOLDOWN = 24 * 60 * 60
+WORK_COOLDOWN = 7 * 60
+POST_COOLDOWN = 5 * 60 * 60
+
+class CooldownService(PersistentStore):
+    """
+    Todos los cooldowns en un solo lugar, con clave (usuario, acción) y la hora de vencimiento.
+    Consultar es O(1). Un heap ordenado por vencimiento va sacando las entradas vencidas,
+    así la memoria depende de los usuarios con cooldowns activos y no de todos los que alguna vez
+    usaron un comando. Las acciones de PERSISTENT_ACTIONS sobreviven a un reinicio.
+    """
+
+    PERSISTENT_ACTIONS = {"crime", "daily", "work", "post"}
+
+    def __init__(self, path):
+        self.path = path
+        self.expiry: dict[tuple[str, str], float] = {}
+        self.heap: list[tuple[float, str, str]] = []
+        ahora = time.time()
+        for key, vence in load_json(path, {}).items():
+            uid, _, action = key.partition(":")
+            if vence > ahora:
+                self._set(uid, action, vence)
+        self.register()
+
+    def _set(self, uid, action, vence):
+        self.expiry[(uid, action)] = vence
+        heapq.heappush(self.heap, (vence, uid, action))
+
+    def prune(self, now=None):
+        now = time.time() if now is None else now
+        while self.heap and self.heap[0][0] <= now:
+            vence, uid, action = heapq.heappop(self.heap)
+            # Si el cooldown se renovó, esta entrada del heap quedó vieja
+            if self.expiry.get((uid, action)) == vence:
+                del self.expiry[(uid, action)]
+                if action in self.PERSISTENT_ACTIONS:
+                    self.dirty = True
+
+    def remaining(self, uid, action, now=None):
+        """Segundos que faltan para poder volver a usar la acción (0 si ya se puede)."""
+        vence = self.expiry.get((uid, action))
+        if vence is None:
+            return 0
+        now = time.time() if now is None else now
+        return max(0, vence - now)
+
+    def start(self, uid, action, seconds, now=None):
+        now = time.time() if now is None else now
+        self.prune(now)
+        self._set(uid, action, now + seconds)
+        if action in self.PERSISTENT_ACTIONS:
+            self.dirty = True
+
+    def replace(self, data):
+        """Reemplaza los cooldowns persistentes (usado por /restore)."""
+        ahora = time.time()
+        self.expiry = {key: vence for key, vence in self.expiry.items() if key[1] not in self.PERSISTENT_ACTIONS}
+        for key, vence in data.items():
+            uid, _, action = key.partition(":")
+            if vence > ahora:
+                self.expiry[(uid, action)] = vence
+        self.heap = [(vence, uid, action) for (uid, action), vence in self.expiry.items()]
+        heapq.heapify(self.heap)
+        self.dirty = True
+
+    def import_post_cooldowns(self, path):
+        """Migra el post_cooldowns.json viejo (uid → último post)."""
+        data = load_json(path, {})
+        ahora = time.time()
+        for uid, ultimo in data.items():
+            if ultimo + POST_COOLDOWN > ahora:
+                self._set(uid, "post", ultimo + POST_COOLDOWN)
+        if data:
+            self.dirty = True
+        os.replace(path, f"{path}.migrado")
+
+    def prepare_flush(self):
+        if not self.dirty:
+            return None
+        self.dirty = False
+        data = {f"{uid}:{action}": vence for (uid, action), vence in self.expiry.items() if action in self.PERSISTENT_ACTIONS}
+        text = json.dumps(data, separators=(",", ":"))
+        return lambda: write_atomic(self.path, text)
+
+cooldowns = CooldownService(COOLDOWNS_FILE)
+if os.path.exists(POST_COOLDOWN_FILE):
+    cooldowns.import_post_cooldowns(POST_COOLDOWN_FILE)
+
 # ============================
 # SISTEMA DE XP POR MENSAJES
 # ============================
-xp_cooldowns = {}
+XP_BATCH_SECONDS = 2
+
+class XpBatcher:
+    """
+    Buffer de XP ganada por mensajes. on_message solo suma en un dict; cada XP_BATCH_SECONDS
+    una tarea aplica todo junto al LevelStore, detecta quién pasó de nivel y deja las subidas
+    en la cola de anuncios, así el manejo de un mensaje no toca disco ni la red.
+    """
+
+    def __init__(self, store, notify):
+        self.store = store
+        self.notify = notify
+        self.pending: dict[str, list] = {}
+
+    def add(self, uid, gain, nombre, channel_id):
+        entry = self.pending.get(uid)
+        if entry is None:
+            self.pending[uid] = [gain, nombre, channel_id]
+        else:
+            entry[0] += gain
+            entry[1] = nombre
+            entry[2] = channel_id
+
+    def apply(self):
+        """Aplica el buffer; devuelve cuántos usuarios se actualizaron."""
+        pending, self.pending = self.pending, {}
+        for uid, (gain, nombre, channel_id) in pending.items():
+            anterior, nueva = self.store.add_xp(uid, gain, nombre)
+            nivel = level_from_xp(nueva)
+            if nivel > level_from_xp(anterior):
+                self.notify(uid, nivel, channel_id)
+        return len(pending)
+
+# ============================
+# ANUNCIOS DE SUBIDA DE NIVEL
+# ============================
+LEVEL_UP_WINDOW_SECONDS = 3
+LEVEL_UP_MAX_PENDING = 500
+LEVEL_UP_MAX_PER_EMBED = 20
+CHANNEL_BUCKET_SIZE = 5
+CHANNEL_BUCKET_SECONDS = 5
+
+class LevelUpAnnouncer:
+    """
+    Cola de salida de los anuncios de nivel. Las subidas se juntan por canal durante
+    LEVEL_UP_WINDOW_SECONDS y salen en un solo embed. Cada canal tiene su bucket de envíos
+    (CHANNEL_BUCKET_SIZE cada CHANNEL_BUCKET_SECONDS, como el límite de Discord): si está vacío,
+    el canal sigue juntando en vez de esperar. Los envíos corren en tareas aparte, así un canal
+    limitado no frena ni a los demás ni al XP. Si la cola se llena, se descarta y se cuenta.
+    """
+
+    def __init__(self):
+        self.pending: dict[int, dict[str, int]] = {}
+        self.since: dict[int, float] = {}
+        self.buckets: dict[int, list] = {}
+        self.sending = set()
+        self.depth = 0
+        self.stats = {"encolados": 0, "combinados": 0, "enviados": 0, "embeds": 0, "descartados": 0, "rate_limited": 0}
+
+    def submit(self, uid, nivel, channel_id):
+        canal = self.pending.get(channel_id)
+        if canal is not None and uid in canal:
+            canal[uid] = max(canal[uid], nivel)
+            self.stats["combinados"] += 1
+            return
+        if self.depth >= LEVEL_UP_MAX_PENDING:
+            self.stats["descartados"] += 1
+            return
+        if canal is None:
+            canal = self.pending[channel_id] = {}
+            self.since[channel_id] = time.monotonic()
+        canal[uid] = nivel
+        self.depth += 1
+        self.stats["encolados"] += 1
+
+    def _take_token(self, channel_id, now):
+        bucket = self.buckets.get(channel_id)
+        if bucket is None:
+            bucket = self.buckets[channel_id] = [CHANNEL_BUCKET_SIZE, now]
+        tokens, ultimo = bucket
+        tokens = min(CHANNEL_BUCKET_SIZE, tokens + (now - ultimo) * CHANNEL_BUCKET_SIZE / CHANNEL_BUCKET_SECONDS)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def _prune_buckets(self, now):
+        # Un bucket lleno de nuevo es igual a no tenerlo
+        for channel_id in [c for c, (tokens, ultimo) in self.buckets.items() if now - ultimo > CHANNEL_BUCKET_SECONDS and c not in self.pending]:
+            del self.buckets[channel_id]
+
+    def dispatch(self, now=None):
+        """Saca los canales cuya ventana venció y tienen bucket disponible."""
+        now = time.monotonic() if now is None else now
+        listos = [c for c, t in self.since.items() if now - t >= LEVEL_UP_WINDOW_SECONDS]
+        for channel_id in listos:
+            if not self._take_token(channel_id, now):
+                continue
+            subidas = self.pending.pop(channel_id)
+            del self.since[channel_id]
+            self.depth -= len(subidas)
+            task = asyncio.create_task(self._send(channel_id, subidas))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+        self._prune_buckets(now)
+
+    async def _send(self, channel_id, subidas):
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            self.stats["descartados"] += len(subidas)
+            return
+        orden = sorted(subidas.items(), key=lambda x: x[1], reverse=True)
+        lineas = [f"<@{uid}> ahora eres nivel **{nivel}**" for uid, nivel in orden[:LEVEL_UP_MAX_PER_EMBED]]
+        if len(orden) > LEVEL_UP_MAX_PER_EMBED:
+            lineas.append(f"...y {len(orden) - LEVEL_UP_MAX_PER_EMBED} más")
+        embed = discord.Embed(
+            title="🎉 ¡SUBISTE DE NIVEL!" if len(orden) == 1 else f"🎉 ¡{len(orden)} SUBIDAS DE NIVEL!",
+            description="\n".join(lineas),
+            color=discord.Color.gold()
+        )
+        try:
+            await channel.send(embed=embed)
+            self.stats["enviados"] += len(subidas)
+            self.stats["embeds"] += 1
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self.stats["rate_limited"] += 1
+                bucket = self.buckets.get(channel_id)
+                if bucket is not None:
+                    bucket[0] = 0
+            self.stats["descartados"] += len(subidas)
+            print(f"Error anunciando niveles en {channel_id}: {e}")
+
+    async def run(self):
+        await bot.wait_until_ready()
+        while not bot.is_closed():
+            await asyncio.sleep(0.5)
+            try:
+                self.dispatch()
+            except Exception as e:
+                print(f"Error en la cola de anuncios: {e}")
+
+level_up_announcer = LevelUpAnnouncer()
+xp_batcher = XpBatcher(levels_store, level_up_announcer.submit)
+
+def award_message_xp(uid, nombre, channel_id, now):
+    """Camino caliente de on_message: chequea el cooldown y anota la XP en el buffer."""
+    if cooldowns.remaining(uid, "xp", now) > 0:
+        return False
+    xp_batcher.add(uid, random.randint(8, 15), nombre, channel_id)
+    cooldowns.start(uid, "xp", XP_COOLDOWN, now)
+    return True
+
+async def xp_batch_loop():
+    while not bot.is_closed():
+        await asyncio.sleep(XP_BATCH_SECONDS)
+        try:
+            xp_batcher.apply()
+        except Exception as e:
+            print(f"Error aplicando XP: {e}")
 
 @bot.event
 async def on_message(message):
@@ -245,40 +1231,7 @@ async def on_message(message):
     if message.guild.id != ALLOWED_GUILD_ID:
         return
     
-    uid = str(message.author.id)
-    now = int(time.time())
-    
-    last_xp = xp_cooldowns.get(uid, 0)
-    if now - last_xp < 60:
-        await bot.process_commands(message)
-        return
-    
-    xp_gain = random.randint(8, 15)
-    levels_data = load_levels()
-    current_xp = levels_data.get(uid, {}).get("xp", 0)
-    new_xp = current_xp + xp_gain
-    
-    if uid not in levels_data:
-        levels_data[uid] = {}
-    levels_data[uid]["xp"] = new_xp
-    levels_data[uid]["nombre"] = message.author.display_name
-    save_levels(levels_data)
-    
-    xp_cooldowns[uid] = now
-    
-    old_level = level_from_xp(current_xp)
-    new_level = level_from_xp(new_xp)
-    
-    if new_level > old_level:
-        try:
-            embed = discord.Embed(
-                title="🎉 ¡SUBISTE DE NIVEL!",
-                description=f"{message.author.mention} ahora eres nivel **{new_level}**",
-                color=discord.Color.gold()
-            )
-            await message.channel.send(embed=embed)
-        except:
-            pass
+    award_message_xp(str(message.author.id), message.author.display_name, message.channel.id, time.time())
     
     await bot.process_commands(message)
 
@@ -290,12 +1243,12 @@ balances_lock = asyncio.Lock()
 async def safe_add(user_id: str, amount: float):
     async with balances_lock:
         balances[user_id] = balances.get(user_id, 0) + amount
-        save_json(BALANCES_FILE, balances)
+        balances.save()
 
 async def safe_subtract(user_id: str, amount: float) -> bool:
     async with balances_lock:
         balances[user_id] = balances.get(user_id, 0) - amount
-        save_json(BALANCES_FILE, balances)
+        balances.save()
         return True
 
 def can_bet(user_id: str, amount: float) -> tuple[bool, str]:
@@ -322,17 +1275,198 @@ def fmt(n):
 def dark_embed(title="", desc="", color=0x2F3136):
     return discord.Embed(title=title, description=desc, color=color)
 
+# ========== HISTORIAL DE TRANSACCIONES ==========
+TRANSACTIONS_DIR = os.path.join(DATA_DIR, "transactions")
+TX_SEGMENT_MAX_BYTES = 4 * 1024 * 1024   # 4 MB por segmento
+TX_MAX_SEGMENTS = 16                     # segmentos que se conservan
+TX_HISTORY_PER_USER = 100                # entradas indexadas por usuario
+TX_INDEX_FLUSH_SECONDS = 60
+
+class TransactionLog(PersistentStore):
+    """
+    Log append-only de transacciones en segmentos NDJSON que rotan por tamaño.
+    Un índice compacto por usuario (array de posiciones segmento/offset) permite leer
+    el historial reciente de alguien con seek, sin tocar las entradas de los demás.
+    El índice se guarda cada TX_INDEX_FLUSH_SECONDS junto con hasta dónde cubre los
+    segmentos; al arrancar solo se escanea lo escrito después de esa marca.
+    """
+
+    INDEX_HEADER = struct.Struct(">4sIQ")   # magic, segmento, offset cubiertos
+    INDEX_ENTRY = struct.Struct(">QI")       # uid, cantidad de posiciones
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.bin")
+        self.index: dict[str, array] = {}
+        segmentos = self._segment_ids()
+        self.segment_id = segmentos[-1] if segmentos else 1
+        self.fd = os.open(self._segment_path(self.segment_id), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.offset = os.fstat(self.fd).st_size
+        self.last_index_flush = time.time()
+        self._load_index()
+        self.register()
+
+    @staticmethod
+    def _pack(segment_id, offset):
+        return (segment_id << 32) | offset
+
+    @staticmethod
+    def _unpack(pos):
+        return pos >> 32, pos & 0xFFFFFFFF
+
+    def _segment_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".ndjson"):
+                try:
+                    ids.append(int(name[:-7]))
+                except ValueError:
+                    pass
+        return sorted(ids)
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"{segment_id:08d}.ndjson")
+
+    def _index_add(self, uid, pos):
+        posiciones = self.index.get(uid)
+        if posiciones is None:
+            posiciones = self.index[uid] = array("Q")
+        posiciones.append(pos)
+        if len(posiciones) > TX_HISTORY_PER_USER * 2:
+            del posiciones[:-TX_HISTORY_PER_USER]
+
+    def _load_index(self):
+        desde_segmento, desde_offset = 0, 0
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            magic, desde_segmento, desde_offset = self.INDEX_HEADER.unpack_from(data, 0)
+            if magic != b"TXI1":
+                raise ValueError("índice inválido")
+            pos = self.INDEX_HEADER.size
+            while pos < len(data):
+                uid, count = self.INDEX_ENTRY.unpack_from(data, pos)
+                pos += self.INDEX_ENTRY.size
+                posiciones = array("Q")
+                posiciones.frombytes(data[pos:pos + 8 * count])
+                if sys.byteorder == "little":
+                    posiciones.byteswap()
+                pos += 8 * count
+                self.index[str(uid)] = posiciones
+        except FileNotFoundError:
+            pass
+        except (ValueError, struct.error) as e:
+            print(f"⚠️ Índice de transacciones inválido ({e}), se reconstruye")
+            self.index.clear()
+            desde_segmento, desde_offset = 0, 0
+        # Escanear solo lo que el índice guardado no cubre
+        for segment_id in self._segment_ids():
+            if segment_id < desde_segmento:
+                continue
+            inicio = desde_offset if segment_id == desde_segmento else 0
+            with open(self._segment_path(segment_id), "rb") as f:
+                f.seek(inicio)
+                offset = inicio
+                for line in f:
+                    if line.endswith(b"\n"):
+                        try:
+                            self._index_add(json.loads(line)["u"], self._pack(segment_id, offset))
+                        except (ValueError, KeyError):
+                            pass
+                    offset += len(line)
+
+    def append(self, uid, amount, reason):
+        line = json.dumps({"u": uid, "a": amount, "r": reason, "t": int(time.time())}, ensure_ascii=False).encode("utf-8") + b"\n"
+        if self.offset + len(line) > TX_SEGMENT_MAX_BYTES and self.offset > 0:
+            self._rotate()
+        os.write(self.fd, line)
+        self._index_add(uid, self._pack(self.segment_id, self.offset))
+        self.offset += len(line)
+        self.dirty = True
+
+    def _rotate(self):
+        os.close(self.fd)
+        self.segment_id += 1
+        self.fd = os.open(self._segment_path(self.segment_id), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.offset = 0
+        for segment_id in self._segment_ids()[:-TX_MAX_SEGMENTS]:
+            os.remove(self._segment_path(segment_id))
+
+    def count(self, uid):
+        return min(len(self.index.get(uid, ())), TX_HISTORY_PER_USER)
+
+    def recent(self, uid, page=0, per_page=10):
+        """Página `page` del historial de uid, de la más nueva a la más vieja."""
+        posiciones = self.index.get(uid)
+        if not posiciones:
+            return []
+        fin = len(posiciones) - page * per_page
+        inicio = max(fin - per_page, len(posiciones) - TX_HISTORY_PER_USER, 0)
+        entradas = []
+        abiertos = {}
+        try:
+            for pos in reversed(posiciones[inicio:max(fin, 0)]):
+                segment_id, offset = self._unpack(pos)
+                f = abiertos.get(segment_id)
+                if f is None:
+                    try:
+                        f = abiertos[segment_id] = open(self._segment_path(segment_id), "rb")
+                    except FileNotFoundError:
+                        continue  # segmento ya rotado
+                f.seek(offset)
+                try:
+                    entradas.append(json.loads(f.readline()))
+                except ValueError:
+                    continue
+        finally:
+            for f in abiertos.values():
+                f.close()
+        return entradas
+
+    def prepare_flush(self):
+        if not self.dirty or time.time() - self.last_index_flush < TX_INDEX_FLUSH_SECONDS:
+            return None
+        self.dirty = False
+        self.last_index_flush = time.time()
+        partes = [self.INDEX_HEADER.pack(b"TXI1", self.segment_id, self.offset)]
+        for uid, posiciones in self.index.items():
+            posiciones = posiciones[-TX_HISTORY_PER_USER:]
+            if sys.byteorder == "little":
+                posiciones.byteswap()
+            partes.append(self.INDEX_ENTRY.pack(int(uid), len(posiciones)))
+            partes.append(posiciones.tobytes())
+        data = b"".join(partes)
+        return lambda: self._write_index(data)
+
+    def _write_index(self, data):
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+
+    def import_json(self, path):
+        """Migra el transactions.json viejo al log la primera vez."""
+        data = load_json(path, {})
+        for uid, entradas in data.items():
+            for entrada in entradas:
+                line = json.dumps({"u": uid, "a": entrada.get("amount"), "r": entrada.get("reason"), "t": entrada.get("time")}, ensure_ascii=False).encode("utf-8") + b"\n"
+                os.write(self.fd, line)
+                self._index_add(uid, self._pack(self.segment_id, self.offset))
+                self.offset += len(line)
+        if data:
+            self.dirty = True
+            os.replace(path, f"{path}.migrado")
+            print(f"📥 Historial de {len(data)} usuarios migrado a {self.directory}")
+
+transaction_log = TransactionLog(TRANSACTIONS_DIR)
+if os.path.exists(TRANSACTIONS_FILE):
+    transaction_log.import_json(TRANSACTIONS_FILE)
+
 def log_transaction(uid, amount, reason):
-    data = load_json(TRANSACTIONS_FILE, {})
-    if uid not in data:
-        data[uid] = []
-    data[uid].append({
-        "amount": amount,
-        "reason": reason,
-        "time": int(time.time())
-    })
-    data[uid] = data[uid][-100:]
-    save_json(TRANSACTIONS_FILE, data)
+    transaction_log.append(uid, amount, reason)
 
 # -------------------------
 # Lucky system
@@ -412,8 +1546,10 @@ async def setcoins(interaction: discord.Interaction, usuario: discord.User, cant
         return
     uid = str(usuario.id)
     async with balances_lock:
+        anterior = balances.get(uid, 0)
         balances[uid] = cantidad
-        save_json(BALANCES_FILE, balances)
+        balances.save()
+    log_transaction(uid, cantidad - anterior, "⚙️ Balance fijado por admin")
     await interaction.response.send_message(f"⚙️ {usuario.mention} ahora tiene **{fmt(cantidad)} USD**.")
 
 @tree.command(name="add", description="(Admin) Agregar monedas a un usuario")
@@ -428,6 +1564,7 @@ async def add(interaction: discord.Interaction, usuario: discord.User, cantidad:
         await interaction.response.send_message("❌ Monto inválido.", ephemeral=True)
         return
     await safe_add(str(usuario.id), cantidad)
+    log_transaction(str(usuario.id), cantidad, "⚙️ Agregado por admin")
     await interaction.response.send_message(f"💸 Se agregaron **{fmt(cantidad)} USD** a {usuario.mention}")
 
 @tree.command(name="remove", description="(Admin) Quitar USD a un usuario (puede dejarlo en negativo)")
@@ -448,7 +1585,8 @@ async def remove(interaction: discord.Interaction, usuario: discord.User, cantid
             if cantidad_a_quitar <= 0:
                 return await interaction.response.send_message("❌ El usuario ya tiene saldo 0 o negativo.", ephemeral=True)
             balances[uid] = 0
-            save_json(BALANCES_FILE, balances)
+            balances.save()
+        log_transaction(uid, -cantidad_a_quitar, "⚙️ Quitado por admin")
         await interaction.response.send_message(f"💰 Se quitaron **{fmt(cantidad_a_quitar)} USD** a {usuario.mention} (saldo actual: 0 USD)")
     else:
         try:
@@ -460,7 +1598,8 @@ async def remove(interaction: discord.Interaction, usuario: discord.User, cantid
         
         async with balances_lock:
             balances[uid] = balances.get(uid, 0) - cantidad_a_quitar
-            save_json(BALANCES_FILE, balances)
+            balances.save()
+        log_transaction(uid, -cantidad_a_quitar, "⚙️ Quitado por admin")
         
         saldo_nuevo = balances.get(uid, 0)
         if saldo_nuevo < 0:
@@ -481,8 +1620,7 @@ async def profile(interaction: discord.Interaction, usuario: Optional[discord.Us
     uid = str(u.id)
     bal = balances.get(uid, 0)
     
-    levels_data = load_levels()
-    user_xp = levels_data.get(uid, {}).get("xp", 0)
+    user_xp = levels_store.get_xp(uid)
     user_level = level_from_xp(user_xp)
     xp_actual, xp_necesaria = xp_progress(user_level, user_xp)
     
@@ -492,8 +1630,7 @@ async def profile(interaction: discord.Interaction, usuario: Optional[discord.Us
     else:
         barra = "🟩" * 10
     
-    balances_data = load_json(BALANCES_FILE, {})
-    total_dinero = sum(balances_data.values())
+    total_dinero = economy_stats.money_supply
     porcentaje_plata = (bal / total_dinero * 100) if total_dinero > 0 else 0
     
     embed = dark_embed(f"💼 Perfil — {u.display_name}", "")
@@ -512,10 +1649,10 @@ async def profile(interaction: discord.Interaction, usuario: Optional[discord.Us
     
     cryptos_data = load_cryptos()
     holders = cryptos_data.get("holders", {})
-    user_cryptos = holders.get(uid, {"RSC": 0, "CTC": 0, "MMC": 0})
+    user_cryptos = holders.get(uid, {})
     
     cryptos_text = ""
-    for sym in ("RSC", "CTC", "MMC"):
+    for sym in CRYPTO_SYMBOLS:
         cant = user_cryptos.get(sym, 0)
         if cant > 0:
             valor = cant * cryptos_data[sym]["price"]
@@ -542,39 +1679,107 @@ async def transfer(interaction: discord.Interaction, usuario: discord.User, cant
             return
         balances[sender] -= cantidad
         balances[receiver] = balances.get(receiver, 0) + cantidad
-        save_json(BALANCES_FILE, balances)
+        balances.save()
+    log_transaction(sender, -cantidad, f"💸 Transferencia a {usuario.display_name}")
+    log_transaction(receiver, cantidad, f"💸 Transferencia de {interaction.user.display_name}")
     await interaction.response.send_message(f"💸 Transferiste **{fmt(cantidad)} USD** a {usuario.mention}")
 
 # -------------------------
-# CRIME
+# HISTORIAL
 # -------------------------
-crime_cooldowns: dict[str, datetime] = {}
+HISTORY_PER_PAGE = 10
+
+def crear_embed_historial(nombre, uid, pagina):
+    total = transaction_log.count(uid)
+    total_paginas = max(1, (total + HISTORY_PER_PAGE - 1) // HISTORY_PER_PAGE)
+    entradas = transaction_log.recent(uid, pagina, HISTORY_PER_PAGE)
+    lineas = []
+    for e in entradas:
+        monto = e.get("a") or 0
+        signo = "🟢 +" if monto >= 0 else "🔴 -"
+        lineas.append(f"`{format_timestamp(e.get('t') or 0)}` {signo}{fmt(abs(monto))} USD — {e.get('r')}")
+    embed = dark_embed(f"📜 Historial — {nombre}", "\n".join(lineas) or "No hay transacciones registradas.")
+    embed.set_footer(text=f"Página {pagina + 1}/{total_paginas} • Últimas {TX_HISTORY_PER_USER} transacciones")
+    return embed, total_paginas
+
+class HistoryView(discord.ui.View):
+    def __init__(self, owner_id, uid, nombre, pagina, total_paginas):
+        super().__init__(timeout=60)
+        self.owner_id = owner_id
+        self.uid = uid
+        self.nombre = nombre
+        self.pagina = pagina
+        self.total_paginas = total_paginas
+        self.actualizar_botones()
+
+    def actualizar_botones(self):
+        self.anterior.disabled = (self.pagina == 0)
+        self.siguiente.disabled = (self.pagina >= self.total_paginas - 1)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.primary)
+    async def anterior(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.pagina = max(0, self.pagina - 1)
+        await self.mostrar(interaction)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.primary)
+    async def siguiente(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.pagina += 1
+        await self.mostrar(interaction)
+
+    async def mostrar(self, interaction: discord.Interaction):
+        embed, self.total_paginas = crear_embed_historial(self.nombre, self.uid, self.pagina)
+        self.actualizar_botones()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+@tree.command(name="history", description="📜 Ver el historial de transacciones")
+@app_commands.describe(usuario="Usuario (opcional, solo admins)", pagina="Página a mostrar")
+async def history(interaction: discord.Interaction, usuario: Optional[discord.User] = None, pagina: int = 1):
+    if not await ensure_guild_or_reply(interaction):
+        return
+    if usuario and usuario.id != interaction.user.id and not interaction.user.guild_permissions.administrator:
+        return await interaction.response.send_message("❌ Solo admins pueden ver historiales ajenos.", ephemeral=True)
+    u = usuario or interaction.user
+    uid = str(u.id)
+    total_paginas = max(1, (transaction_log.count(uid) + HISTORY_PER_PAGE - 1) // HISTORY_PER_PAGE)
+    pagina_index = min(max(0, pagina - 1), total_paginas - 1)
+    embed, total_paginas = crear_embed_historial(u.display_name, uid, pagina_index)
+    if total_paginas > 1:
+        view = HistoryView(interaction.user.id, uid, u.display_name, pagina_index, total_paginas)
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
+# -------------------------
+# CRIME
+# -------------------------
 @tree.command(name="crime", description="Intentá cometer un crimen y ganá o perdé dinero 💰 (cooldown 10m)")
 async def crime(interaction: discord.Interaction):
     if not await ensure_guild_or_reply(interaction):
         return
     user_id = str(interaction.user.id)
-    now = datetime.utcnow()
-    cooldown = crime_cooldowns.get(user_id)
-    if cooldown and now < cooldown:
-        rem = int((cooldown - now).total_seconds())
+    rem = int(cooldowns.remaining(user_id, "crime"))
+    if rem > 0:
         m, s = divmod(rem, 60)
         await interaction.response.send_message(f"⏳ Volvé en {m}m {s}s.", ephemeral=True)
         return
-    crime_cooldowns[user_id] = now + timedelta(minutes=10)
+    cooldowns.start(user_id, "crime", CRIME_COOLDOWN)
 
     if random.random() < 0.4:
         reward = random.randint(800, 2000)
         async with balances_lock:
             balances[user_id] = balances.get(user_id, 0) + reward
-            save_json(BALANCES_FILE, balances)
+            balances.save()
+        log_transaction(user_id, reward, "🦹 Crimen")
         await interaction.response.send_message(f"💸 Crimen exitoso: ganaste **{fmt(reward)} USD**.")
     else:
         loss = 400
         async with balances_lock:
             balances[user_id] = balances.get(user_id, 0) - loss
-            save_json(BALANCES_FILE, balances)
+            balances.save()
+        log_transaction(user_id, -loss, "🚔 Crimen fallido")
         nuevo_saldo = balances.get(user_id, 0)
         if nuevo_saldo < 0:
             await interaction.response.send_message(f"🚔 Te atraparon: perdiste **{fmt(loss)} USD**. Ahora tenés deuda de **{fmt(abs(nuevo_saldo))} USD**.")
@@ -584,28 +1789,22 @@ async def crime(interaction: discord.Interaction):
 # -------------------------
 # DAILY / WORK
 # -------------------------
-last_daily: dict[str, str] = {}
-last_work: dict[str, str] = {}
-
 @tree.command(name="daily", description="Reclamá tu recompensa diaria")
 async def daily(interaction: discord.Interaction):
     if not await ensure_guild_or_reply(interaction):
         return
     uid = str(interaction.user.id)
-    now = datetime.utcnow()
-    last = last_daily.get(uid)
-    if last:
-        elapsed = (now - datetime.fromisoformat(last)).total_seconds()
-        if elapsed < 86400:
-            rem = int(86400 - elapsed)
-            h = rem // 3600
-            m = (rem % 3600) // 60
-            await interaction.response.send_message(f"⏳ Volvé en {h}h {m}m.", ephemeral=True)
-            return
+    rem = int(cooldowns.remaining(uid, "daily"))
+    if rem > 0:
+        h = rem // 3600
+        m = (rem % 3600) // 60
+        await interaction.response.send_message(f"⏳ Volvé en {h}h {m}m.", ephemeral=True)
+        return
     async with balances_lock:
         balances[uid] = balances.get(uid, 0) + DAILY_AMOUNT
-        save_json(BALANCES_FILE, balances)
-    last_daily[uid] = now.isoformat()
+        balances.save()
+    log_transaction(uid, DAILY_AMOUNT, "📅 Daily")
+    cooldowns.start(uid, "daily", DAILY_COOLDOWN)
     await interaction.response.send_message(f"💰 Reclamaste **{fmt(DAILY_AMOUNT)} USD**.")
 
 @tree.command(name="work", description="Trabajá para ganar monedas (cooldown 7m)")
@@ -613,20 +1812,17 @@ async def work(interaction: discord.Interaction):
     if not await ensure_guild_or_reply(interaction):
         return
     uid = str(interaction.user.id)
-    now = datetime.utcnow()
-    last = last_work.get(uid)
-    if last:
-        elapsed = (now - datetime.fromisoformat(last)).total_seconds()
-        if elapsed < 420:
-            rem = int(420 - elapsed)
-            m, s = divmod(rem, 60)
-            await interaction.response.send_message(f"⏳ Volvé en {m}m {s}s.", ephemeral=True)
-            return
+    rem = int(cooldowns.remaining(uid, "work"))
+    if rem > 0:
+        m, s = divmod(rem, 60)
+        await interaction.response.send_message(f"⏳ Volvé en {m}m {s}s.", ephemeral=True)
+        return
     amount = random.randint(WORK_MIN, WORK_MAX)
     async with balances_lock:
         balances[uid] = balances.get(uid, 0) + amount
-        save_json(BALANCES_FILE, balances)
-    last_work[uid] = now.isoformat()
+        balances.save()
+    log_transaction(uid, amount, "🧰 Trabajo")
+    cooldowns.start(uid, "work", WORK_COOLDOWN)
     
     saldo = balances.get(uid, 0)
     if saldo < 0:
@@ -665,22 +1861,8 @@ POST_DESCRIPTIONS = [
     "CHIC CHEVEEEEEN 6767677676767767676767676767676N UFYWEIGHORYESUOHG5U804W"
 ]
 
-# Archivo para cooldowns
-POST_COOLDOWN_FILE = os.path.join(DATA_DIR, "post_cooldowns.json")
-
-def load_post_cooldowns():
-    return load_json(POST_COOLDOWN_FILE, {})
-
-def save_post_cooldowns(data):
-    save_json(POST_COOLDOWN_FILE, data)
-
 def post_time_left(uid):
-    data = load_post_cooldowns()
-    now = int(time.time())
-    last = data.get(uid, 0)
-    cooldown = 5 * 60 * 60  # 5 horas
-    remaining = (last + cooldown) - now
-    return max(0, remaining)
+    return int(cooldowns.remaining(uid, "post"))
 
 
 @tree.command(name="post", description="📱 Subí un post a redes sociales y ganá USD (0-2500)")
@@ -737,13 +1919,12 @@ async def post(interaction: discord.Interaction):
         emoji = "💀"
 
     # Guardar cooldown
-    data = load_post_cooldowns()
-    data[uid] = int(time.time())
-    save_post_cooldowns(data)
+    cooldowns.start(uid, "post", POST_COOLDOWN)
 
     # Pagar si hay ganancia
     if ganancia > 0:
         await safe_add(uid, ganancia)
+        log_transaction(uid, ganancia, "📱 Post")
 
     # Crear embed
     embed = discord.Embed(
@@ -817,8 +1998,7 @@ async def flipcoin(interaction: discord.Interaction, apuesta: str, eleccion: str
             return await interaction.response.send_message("❌ Usá un número o 'a' para apostar todo.", ephemeral=True)
     
     # Límite de apuesta por nivel
-    niveles_data = load_levels()
-    user_xp = niveles_data.get(uid, {}).get("xp", 0)
+    user_xp = levels_store.get_xp(uid)
     user_level = level_from_xp(user_xp)
     
     if user_level <= 199:
@@ -843,7 +2023,7 @@ async def flipcoin(interaction: discord.Interaction, apuesta: str, eleccion: str
     # Descontar apuesta
     async with balances_lock:
         balances[uid] -= bet_val
-        save_json(BALANCES_FILE, balances)
+        balances.save()
     
     # Tirar moneda
     resultado = random.choice(["cara", "cruz"])
@@ -852,14 +2032,16 @@ async def flipcoin(interaction: discord.Interaction, apuesta: str, eleccion: str
     if gano:
         ganancia = int(bet_val * 2)
         await safe_add(uid, ganancia)
-        update_casino_stock(-ganancia)  # Casino paga
+        casino_bankroll.record("flipcoin", bet_val, ganancia)
+        log_transaction(uid, ganancia - bet_val, "🪙 Flipcoin")
         embed = discord.Embed(title="🪙 Cara o Cruz", description=f"🎉 **¡GANASTE!**", color=discord.Color.green())
         embed.add_field(name="💰 Apuesta", value=f"{fmt(bet_val)} USD", inline=True)
         embed.add_field(name="🎲 Elegiste", value=eleccion.upper(), inline=True)
         embed.add_field(name="🪙 Resultado", value=resultado.upper(), inline=True)
         embed.add_field(name="💵 Ganaste", value=f"{fmt(ganancia)} USD (x2)", inline=False)
     else:
-        update_casino_stock(bet_val)  # Casino gana
+        casino_bankroll.record("flipcoin", bet_val, 0)
+        log_transaction(uid, -bet_val, "🪙 Flipcoin")
         embed = discord.Embed(title="🪙 Cara o Cruz", description=f"💸 **PERDISTE**", color=discord.Color.red())
         embed.add_field(name="💰 Apuesta", value=f"{fmt(bet_val)} USD", inline=True)
         embed.add_field(name="🎲 Elegiste", value=eleccion.upper(), inline=True)
@@ -880,6 +2062,19 @@ class TowersView(discord.ui.View):
         self.multiplier = 1.0
         self.floor = 0
         self.active = True
+        self.message = None
+
+    async def on_timeout(self):
+        # Partida abandonada: la apuesta ya se descontó, queda para el casino
+        if not self.active:
+            return
+        self.active = False
+        casino_bankroll.record("towers", self.bet, 0)
+        log_transaction(self.uid, -self.bet, "🏰 Towers")
+        try:
+            await self.message.edit(content="⏰ Tiempo agotado. Perdiste la apuesta.", view=None)
+        except:
+            pass
 
     def get_saldo_actual(self):
         return balances.get(self.uid, 0)
@@ -914,7 +2109,8 @@ class TowersView(discord.ui.View):
         if perder:
             self.active = False
             self.clear_items()
-            update_casino_stock(self.bet)  # Casino gana la apuesta
+            casino_bankroll.record("towers", self.bet, 0)
+            log_transaction(self.uid, -self.bet, "🏰 Towers")
             embed = self.crear_embed_base(
                 "💥 La torre explotó",
                 f"Subiste hasta **x{self.multiplier:.2f}**\nPero explotó y perdiste **{fmt(self.bet)} USD**",
@@ -943,7 +2139,8 @@ class TowersView(discord.ui.View):
         self.clear_items()
         reward = int(self.bet * self.multiplier)
         await safe_add(self.uid, reward)
-        update_casino_stock(-reward)  # Casino paga
+        casino_bankroll.record("towers", self.bet, reward)
+        log_transaction(self.uid, reward - self.bet, "🏰 Towers")
         embed = self.crear_embed_base(
             "💰 Cash Out Exitoso",
             f"✅ **Cobraste tu recompensa!**\n\n💵 **Ganancia:** {fmt(reward)} USD\n📊 **Multiplicador final:** x{self.multiplier:.2f}",
@@ -981,8 +2178,7 @@ async def towers(interaction: discord.Interaction, cantidad: str):
             return await interaction.response.send_message(f"❌ La apuesta mínima es {MIN_BET} USD.", ephemeral=True)
     
     # Límite de apuesta por nivel
-    niveles_data = load_levels()
-    user_xp = niveles_data.get(uid, {}).get("xp", 0)
+    user_xp = levels_store.get_xp(uid)
     user_level = level_from_xp(user_xp)
     
     if user_level <= 199:
@@ -1010,7 +2206,7 @@ async def towers(interaction: discord.Interaction, cantidad: str):
         if saldo_antes < bet_val:
             return await interaction.response.send_message(f"❌ No tenés saldo suficiente. Tenés {fmt(saldo_antes)} USD.", ephemeral=True)
         balances[uid] -= bet_val
-        save_json(BALANCES_FILE, balances)
+        balances.save()
     
     # Crear embed inicial
     embed = discord.Embed(
@@ -1026,200 +2222,1272 @@ async def towers(interaction: discord.Interaction, cantidad: str):
     
     view = TowersView(uid, bet_val, saldo_antes)
     await interaction.response.send_message(embed=embed, view=view)
+    view.message = await interaction.original_response()
+# ============================
+# CRYPTOS - COMPLETO
+# ============================
+CRYPTO_FILE = os.path.join(DATA_DIR, "cryptos.json")
+
+class CryptoStore(JsonStore):
+    """
+    cryptos.json: el mercado (una entrada chica por moneda) más las tenencias de todos los
+    usuarios, que es lo pesado y se ensucia en cada trade. El snapshot del flush reusa la copia
+    de las tenencias del flush anterior y solo vuelve a copiar los usuarios que cambiaron.
+    """
+
+    def __init__(self, path, default=None):
+        self._holders = None   # el dict de tenencias que refleja _copia
+        self._copia = {}
+        self._cambiados = set()
+        super().__init__(path, default)
+
+    def holder_changed(self, uid):
+        self._cambiados.add(uid)
+        self.dirty = True
+
+    def holders_changed(self):
+        """
+        Para cambios en las tenencias que no pasan por set_holding (quitar una moneda,
+        /restore): la próxima copia se rearma entera.
+        """
+        self._holders = None
+        self.dirty = True
+
+    def save(self, data=None):
+        if data is not None and data is not self:
+            self._holders = None
+        super().save(data)
+
+    def snapshot(self):
+        holders = self.get("holders", {})
+        if holders is not self._holders:
+            self._holders = holders
+            self._copia = {uid: dict(tenencias) for uid, tenencias in holders.items()}
+        else:
+            for uid in self._cambiados:
+                if uid in holders:
+                    self._copia[uid] = dict(holders[uid])
+                else:
+                    self._copia.pop(uid, None)
+        self._cambiados.clear()
+        # Las entradas de _copia no se modifican nunca (se reemplazan), así que el hilo
+        # que escribe puede compartirlas: alcanza con copiar el dict de afuera
+        return {k: dict(self._copia) if k == "holders" else _copy_json(v) for k, v in self.items()}
+
+cryptos = CryptoStore(CRYPTO_FILE)
+
+COINS_FILE = os.path.join(DATA_DIR, "coins.json")
+COIN_SYMBOL_MAX = 8   # el historial de precios guarda el símbolo en 8 bytes
+DEFAULT_COINS = {
+    "RSC": {"precio_inicial": 100, "volatilidad": 0.05, "max_cambio": 0.08, "color": "#e74c3c"},
+    "CTC": {"precio_inicial": 200, "volatilidad": 0.05, "max_cambio": 0.08, "color": "#3498db"},
+    "MMC": {"precio_inicial": 50, "volatilidad": 0.05, "max_cambio": 0.08, "color": "#2ecc71"},
+}
+COIN_PARAMS = {"precio_inicial": 100, "volatilidad": 0.05, "max_cambio": 0.08, "color": "#ffffff"}
+
+class CoinRegistry(JsonStore):
+    """
+    Monedas configuradas (data/coins.json): símbolo → parámetros del tick y color del gráfico,
+    en el orden en que se muestran. `symbols` es la lista viva de símbolos (CRYPTO_SYMBOLS):
+    se modifica en el lugar, así que todos los que la referencian ven los cambios.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        if not self:
+            self.update(json.loads(json.dumps(DEFAULT_COINS)))
+            self.save()
+        self.symbols = list(self)
+
+    def configure(self, sym, **params):
+        """Crea la moneda (con los parámetros por defecto) o actualiza los que se pasen."""
+        conf = self.setdefault(sym, dict(COIN_PARAMS))
+        conf.update({k: v for k, v in params.items() if v is not None})
+        self.symbols[:] = list(self)
+        self.save()
+        return conf
+
+    def remove(self, sym):
+        del self[sym]
+        self.symbols[:] = list(self)
+        self.save()
+
+    def replace(self, data):
+        """Reemplaza todo el registro (usado por /restore)."""
+        self.save(data)
+        self.symbols[:] = list(self)
+
+coin_registry = CoinRegistry(COINS_FILE)
+
+CRYPTO_SYMBOLS = coin_registry.symbols
+
+# Contador global de versiones (series de precios y ranking de crypto): una versión nunca se
+# repite, ni siquiera si /restore reemplaza la serie o dos recálculos caen en el mismo segundo
+_series_versions = itertools.count(1)
+
+class HoldingsMatrix:
+    """
+    Copia de las tenencias como matriz usuarios × monedas (NumPy, o array('d') fila por fila
+    si no está), al lado del dict holders. Valuar todas las carteras es un solo producto
+    matriz-vector con los precios actuales; el ranking por valor en USD se recalcula en cada
+    tick de precios, y si entre ticks cambió alguna tenencia, la próxima vez que se lo pide.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self.col = {sym: j for j, sym in enumerate(self.symbols)}
+        self.row: dict[str, int] = {}
+        self.uids: list[str] = []
+        self.data = np.zeros((0, len(self.symbols))) if np is not None else array("d")
+        self.ranking: list[tuple[str, float]] = []
+        self.ranking_version = 0
+        self.stale = True   # cambió alguna tenencia desde el último ranking
+
+    def _add_row(self, uid):
+        i = self.row[uid] = len(self.uids)
+        self.uids.append(uid)
+        if np is not None:
+            if i >= len(self.data):
+                # Crece al doble para que agregar usuarios sea O(1) amortizado
+                nueva = np.zeros((max(64, 2 * len(self.data)), len(self.symbols)))
+                nueva[:i] = self.data[:i]
+                self.data = nueva
+        else:
+            self.data.extend([0.0] * len(self.symbols))
+        return i
+
+    def set(self, uid, sym, amount):
+        j = self.col.get(sym)
+        if j is None:
+            return
+        i = self.row.get(uid)
+        if i is None:
+            i = self._add_row(uid)
+        if np is not None:
+            self.data[i, j] = amount
+        else:
+            self.data[i * len(self.symbols) + j] = amount
+        self.stale = True
+
+    def set_symbols(self, symbols, holders):
+        """Cambia las columnas (se agregó o sacó una moneda) y rearma la matriz."""
+        self.symbols = list(symbols)
+        self.col = {sym: j for j, sym in enumerate(self.symbols)}
+        self.rebuild(holders)
+
+    def rebuild(self, holders):
+        self.row = {}
+        self.uids = []
+        self.data = np.zeros((0, len(self.symbols))) if np is not None else array("d")
+        for uid, tenencias in holders.items():
+            for sym, amount in tenencias.items():
+                self.set(uid, sym, amount)
+        self.stale = True
+
+    def values(self, prices):
+        """Valor en USD de la cartera de cada fila (en el orden de self.uids)."""
+        precios = [prices.get(sym, 0) for sym in self.symbols]
+        n = len(self.uids)
+        if np is not None:
+            return self.data[:n] @ np.array(precios)
+        k = len(self.symbols)
+        return [sum(self.data[i * k + j] * precios[j] for j in range(k)) for i in range(n)]
+
+    def refresh_ranking(self, prices):
+        valores = self.values(prices)
+        if np is not None:
+            orden = np.argsort(-valores, kind="stable")
+            orden = orden[valores[orden] > 0]
+            self.ranking = [(self.uids[i], float(valores[i])) for i in orden.tolist()]
+        else:
+            self.ranking = sorted(((self.uids[i], v) for i, v in enumerate(valores) if v > 0), key=lambda x: x[1], reverse=True)
+        self.ranking_version = next(_series_versions)
+        self.stale = False
+
+    def current_ranking(self, prices):
+        """Ranking al día: lo recalcula solo si alguien compró o vendió desde el último."""
+        if self.stale:
+            self.refresh_ranking(prices)
+        return self.ranking
+
+def crypto_prices():
+    return {sym: cryptos[sym]["price"] for sym in CRYPTO_SYMBOLS if sym in cryptos}
+
+holdings_matrix = HoldingsMatrix(CRYPTO_SYMBOLS)
+
+# Factor de demanda: cuánto empuja el volumen de 24h al precio
+DEMAND_THRESHOLD = 10000
+DEMAND_SCALE = 500000
+DEMAND_MAX = 0.02
+VOLUME_DECAY = 0.8
+
+def compute_tick(prices, volumes, volatility, max_change, rand):
+    """
+    Un tick de precios de todas las monedas en una pasada: cambio al azar (rand en [-1, 1)
+    escalado por la volatilidad de cada moneda), factor de demanda por volumen y recorte a
+    ±max_change. Devuelve (precios nuevos, volúmenes nuevos). Con NumPy es vectorizado;
+    sin NumPy hace la misma cuenta moneda por moneda.
+    """
+    if np is not None:
+        demand = np.where(np.abs(volumes) > DEMAND_THRESHOLD, np.clip(volumes / DEMAND_SCALE, -DEMAND_MAX, DEMAND_MAX), 0.0)
+        change = np.clip(rand * volatility * 0.9 + demand * 0.1, -max_change, max_change)
+        return np.round(np.maximum(1, prices * (1 + change)), 2), np.maximum(0, volumes * VOLUME_DECAY)
+    nuevos = array("d")
+    vols = array("d")
+    for price, volumen, vol, tope, r in zip(prices, volumes, volatility, max_change, rand):
+        demand = max(-DEMAND_MAX, min(volumen / DEMAND_SCALE, DEMAND_MAX)) if abs(volumen) > DEMAND_THRESHOLD else 0
+        change = max(-tope, min(r * vol * 0.9 + demand * 0.1, tope))
+        nuevos.append(round(max(1, price * (1 + change)), 2))
+        vols.append(max(0, volumen * VOLUME_DECAY))
+    return nuevos, vols
+
+def _vector(values):
+    return np.fromiter(values, dtype=float) if np is not None else array("d", values)
+
+class MarketEngine:
+    """
+    Tick de precios sobre arrays paralelos (uno por parámetro, una posición por moneda).
+    Los parámetros del registro se cargan una vez en reload(); en cada tick solo se juntan
+    precios y volúmenes, se calcula todo con compute_tick y se escriben los resultados.
+    """
+
+    def __init__(self):
+        self.rng = np.random.default_rng() if np is not None else random.Random()
+        self.reload()
+
+    def reload(self):
+        self.symbols = list(CRYPTO_SYMBOLS)
+        self.volatility = _vector(coin_registry[s]["volatilidad"] for s in self.symbols)
+        self.max_change = _vector(coin_registry[s]["max_cambio"] for s in self.symbols)
+
+    def _random(self, n):
+        if np is not None:
+            return self.rng.uniform(-1, 1, n)
+        return array("d", (self.rng.uniform(-1, 1) for _ in range(n)))
+
+    def step(self, market):
+        """Calcula el tick para market ({símbolo: {"price", "volumen_24h"}}); devuelve [(símbolo, precio, volumen)]."""
+        prices = _vector(market[s]["price"] for s in self.symbols)
+        volumes = _vector(market[s].get("volumen_24h", 0) for s in self.symbols)
+        nuevos, vols = compute_tick(prices, volumes, self.volatility, self.max_change, self._random(len(self.symbols)))
+        return list(zip(self.symbols, nuevos.tolist(), vols.tolist()))
+
+    def tick(self, timestamp=None):
+        """Aplica un tick a cryptos y al historial de precios."""
+        timestamp = time.time() if timestamp is None else timestamp
+        for sym, price, volumen in self.step(cryptos):
+            info = cryptos[sym]
+            info["price"] = price
+            info["volumen_24h"] = volumen
+            price_history.append(sym, price, timestamp)
+
+market_engine = MarketEngine()
+
+holdings_changed_since_backup = set()
+
+def set_holding(uid, sym, amount):
+    """Único punto de escritura de tenencias: actualiza holders y registra el trade en el journal."""
+    holders = cryptos.setdefault("holders", {})
+    if uid not in holders:
+        holders[uid] = dict.fromkeys(CRYPTO_SYMBOLS, 0)
+    anterior = holders[uid].get(sym, 0)
+    total_anterior = sum(holders[uid].values())
+    holders[uid][sym] = amount
+    holdings_matrix.set(uid, sym, amount)
+    economy_stats.holding_changed(total_anterior, total_anterior - anterior + amount)
+    holdings_changed_since_backup.add(uid)
+    cryptos.holder_changed(uid)
+    journal.append("crypto", u=uid, s=sym, a=amount - anterior, h=amount)
+
+def load_cryptos():
+    if "holders" not in cryptos or any(sym not in cryptos for sym in CRYPTO_SYMBOLS):
+        cryptos.setdefault("holders", {})
+        for sym in CRYPTO_SYMBOLS:
+            if sym not in cryptos:
+                cryptos[sym] = {"price": coin_registry[sym]["precio_inicial"], "volumen_24h": 0}
+        save_cryptos(cryptos)
+    return cryptos
+
+def sync_coins():
+    """Deja el mercado, la matriz de tenencias y el motor de precios al día con el registro."""
+    load_cryptos()
+    holdings_matrix.set_symbols(CRYPTO_SYMBOLS, cryptos["holders"])
+    market_engine.reload()
+
+def save_cryptos(data):
+    cryptos.save(data)
+
+load_cryptos()
+
+# ========== HISTORIAL DE PRECIOS (ring buffers) ==========
+PRICE_HISTORY_POINTS = 288   # 24h a 5m por punto
+PRICE_TICK_SECONDS = 300
+
+class PriceSeries:
+    """
+    Buffer circular de tamaño fijo (array('d')) con precio y timestamp por punto.
+    Cada valor se escribe dos veces (en i y en i + capacidad), así la ventana de los
+    últimos `count` puntos siempre es contigua y se puede devolver como memoryview sin copiar.
+    """
+
+    def __init__(self, capacity=PRICE_HISTORY_POINTS):
+        self.capacity = capacity
+        self.prices = array("d", bytes(16 * capacity))
+        self.times = array("d", bytes(16 * capacity))
+        self.head = 0
+        self.count = 0
+        self.version = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, price, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        i = self.head
+        self.prices[i] = self.prices[i + self.capacity] = price
+        self.times[i] = self.times[i + self.capacity] = timestamp
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.version = next(_series_versions)
+
+    def _window(self):
+        inicio = self.head + self.capacity - self.count
+        return inicio, inicio + self.count
+
+    def values(self):
+        """Precios del más viejo al más nuevo, como memoryview (sin copia)."""
+        inicio, fin = self._window()
+        return memoryview(self.prices)[inicio:fin]
+
+    def timestamps(self):
+        inicio, fin = self._window()
+        return memoryview(self.times)[inicio:fin]
+
+    def last(self):
+        if not self.count:
+            return None
+        return self.prices[(self.head - 1) % self.capacity]
+
+# Velas OHLC: resolución → (segundos por vela, velas guardadas)
+CANDLE_RESOLUTIONS = {"1h": (3600, 24 * 30), "1d": (86400, 366)}
+
+class CandleSeries:
+    """
+    Velas OHLC de tamaño fijo para una resolución, con el mismo buffer circular espejado que
+    PriceSeries. Cada tick se pliega en la última vela (o abre una nueva), así que guardar
+    meses de historia cuesta lo mismo que guardar un día.
+    """
+
+    FIELDS = ("start", "open", "high", "low", "close")
+
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.arrays = {f: array("d", bytes(16 * capacity)) for f in self.FIELDS}
+        self.head = 0
+        self.count = 0
+        self.version = 0
+
+    def __len__(self):
+        return self.count
+
+    def _write(self, i, **valores):
+        for f, v in valores.items():
+            a = self.arrays[f]
+            a[i] = a[i + self.capacity] = v
+
+    def add(self, price, timestamp):
+        inicio = timestamp - timestamp % self.seconds
+        ultimo = (self.head - 1) % self.capacity
+        if self.count and self.arrays["start"][ultimo] == inicio:
+            self._write(
+                ultimo,
+                high=max(self.arrays["high"][ultimo], price),
+                low=min(self.arrays["low"][ultimo], price),
+                close=price,
+            )
+        else:
+            self._write(self.head, start=inicio, open=price, high=price, low=price, close=price)
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        self.version = next(_series_versions)
+
+    def field(self, name, n=None):
+        """Las últimas n velas (todas si n es None) de un campo, como memoryview sin copia."""
+        n = self.count if n is None else min(n, self.count)
+        fin = self.head + self.capacity
+        return memoryview(self.arrays[name])[fin - n:fin]
+
+class PriceHistoryStore(PersistentStore):
+    """Historial de precios (puntos de 5m y velas de 1h/1d) de todas las cryptos en un archivo binario propio."""
+
+    MAGIC = b"RPH2"
+    MAGIC_V1 = b"RPH1"
+    HEADER = struct.Struct(">4sI")
+    SERIES_HEADER = struct.Struct(">8sII")   # símbolo, capacidad, puntos
+    CANDLES_HEADER = struct.Struct(">I")
+    CANDLE_HEADER = struct.Struct(">8s4sII")  # símbolo, resolución, capacidad, velas
+
+    def __init__(self, path):
+        self.path = path
+        self.series: dict[str, PriceSeries] = {}
+        self.candles: dict[tuple[str, str], CandleSeries] = {}
+        self._load()
+        self.register()
+
+    def candle_series(self, sym, resolucion):
+        velas = self.candles.get((sym, resolucion))
+        if velas is None:
+            velas = self.candles[(sym, resolucion)] = CandleSeries(*CANDLE_RESOLUTIONS[resolucion])
+        return velas
+
+    @staticmethod
+    def _fold(candles, sym, price, timestamp):
+        for resolucion, (segundos, capacidad) in CANDLE_RESOLUTIONS.items():
+            velas = candles.get((sym, resolucion))
+            if velas is None:
+                velas = candles[(sym, resolucion)] = CandleSeries(segundos, capacidad)
+            velas.add(price, timestamp)
+
+    def __getitem__(self, sym):
+        serie = self.series.get(sym)
+        if serie is None:
+            serie = self.series[sym] = PriceSeries()
+        return serie
+
+    def append(self, sym, price, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self[sym].append(price, timestamp)
+        self._fold(self.candles, sym, price, timestamp)
+        self.dirty = True
+
+    @classmethod
+    def parse(cls, data):
+        """Lee el formato binario y devuelve ({símbolo: PriceSeries}, {(símbolo, resolución): CandleSeries})."""
+        series = {}
+        candles = {}
+        magic, n = cls.HEADER.unpack_from(data, 0)
+        if magic not in (cls.MAGIC, cls.MAGIC_V1):
+            raise ValueError("formato desconocido")
+        pos = cls.HEADER.size
+        for _ in range(n):
+            raw_sym, capacity, count = cls.SERIES_HEADER.unpack_from(data, pos)
+            pos += cls.SERIES_HEADER.size
+            if count > capacity or pos + 16 * count > len(data):
+                raise ValueError("serie truncada")
+            precios = array("d", data[pos:pos + 8 * count])
+            pos += 8 * count
+            tiempos = array("d", data[pos:pos + 8 * count])
+            pos += 8 * count
+            sym = raw_sym.rstrip(b"\0").decode()
+            serie = series[sym] = PriceSeries(capacity)
+            for p, t in zip(precios, tiempos):
+                serie.append(p, t)
+            if magic == cls.MAGIC_V1:
+                # El formato viejo no tenía velas: se arman con lo que hay
+                for p, t in zip(precios, tiempos):
+                    cls._fold(candles, sym, p, t)
+        if magic == cls.MAGIC_V1:
+            return series, candles
+        (n_velas,) = cls.CANDLES_HEADER.unpack_from(data, pos)
+        pos += cls.CANDLES_HEADER.size
+        for _ in range(n_velas):
+            raw_sym, raw_res, capacity, count = cls.CANDLE_HEADER.unpack_from(data, pos)
+            pos += cls.CANDLE_HEADER.size
+            resolucion = raw_res.rstrip(b"\0").decode()
+            if resolucion not in CANDLE_RESOLUTIONS or count > capacity or pos + 40 * count > len(data):
+                raise ValueError("velas inválidas")
+            campos = {}
+            for f in CandleSeries.FIELDS:
+                campos[f] = array("d", data[pos:pos + 8 * count])
+                pos += 8 * count
+            velas = candles[(raw_sym.rstrip(b"\0").decode(), resolucion)] = CandleSeries(CANDLE_RESOLUTIONS[resolucion][0], capacity)
+            for i in range(count):
+                velas._write(i, **{f: campos[f][i] for f in CandleSeries.FIELDS})
+            velas.head = count % capacity
+            velas.count = count
+            velas.version = next(_series_versions)
+        return series, candles
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        try:
+            self.series, self.candles = self.parse(data)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            print(f"⚠️ No se pudo leer {self.path} ({e}), se empieza un historial nuevo")
+            self.series = {}
+            self.candles = {}
+
+    def import_legacy(self, data):
+        """Pasa las listas `history` viejas de cryptos.json a los ring buffers."""
+        migradas = False
+        ahora = time.time()
+        for sym, info in data.items():
+            if isinstance(info, dict) and "history" in info:
+                historia = info.pop("history")[-PRICE_HISTORY_POINTS:]
+                if not self[sym].count:
+                    for i, price in enumerate(historia):
+                        self.append(sym, price, ahora - (len(historia) - i) * PRICE_TICK_SECONDS)
+                migradas = True
+        if migradas:
+            self.dirty = True
+            data.save()
+
+    def serialize(self):
+        partes = [self.HEADER.pack(self.MAGIC, len(self.series))]
+        for sym, serie in self.series.items():
+            partes.append(self.SERIES_HEADER.pack(sym.encode(), serie.capacity, serie.count))
+            partes.append(serie.values().tobytes())
+            partes.append(serie.timestamps().tobytes())
+        partes.append(self.CANDLES_HEADER.pack(len(self.candles)))
+        for (sym, resolucion), velas in self.candles.items():
+            partes.append(self.CANDLE_HEADER.pack(sym.encode(), resolucion.encode(), velas.capacity, velas.count))
+            for f in CandleSeries.FIELDS:
+                partes.append(velas.field(f).tobytes())
+        return b"".join(partes)
+
+    def prepare_flush(self):
+        if not self.dirty:
+            return None
+        self.dirty = False
+        data = self.serialize()
+        return lambda: self._write(data)
+
+    def _write(self, data):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+price_history = PriceHistoryStore(PRICE_HISTORY_FILE)
+price_history.import_legacy(cryptos)
+
+# ============================
+# GRÁFICOS (pool de procesos + caché)
+# ============================
+CHART_WORKERS = 2
+# "pillow" (liviano, el default) o "matplotlib" (mejor calidad, se importa recién al primer gráfico)
+CHART_RENDERER = os.getenv("CHART_RENDERER", "pillow")
+if not charts.renderer_available(CHART_RENDERER):
+    CHART_RENDERER = next((r for r in charts.RENDERERS if charts.renderer_available(r)), None)
+CHART_SIZE_SINGLE = (8, 3, 220)
+CHART_SIZE_MARKET = (10, 5, 220)
+
+chart_pool = None
+
+def _chart_worker_init():
+    """
+    Corre en cada worker apenas hace fork. Cierra lo que heredó abierto del bot (segmentos del
+    journal y del log de transacciones, la base SQLite) para que un worker no pueda escribir ahí
+    ni dejarlos abiertos. La conexión de SQLite no se cierra con close(), que puede llegar a
+    escribir la base: se cierran sus descriptores a mano.
+    """
+    for fd in (journal.fd, transaction_log.fd):
+        if fd is not None:
+            os.close(fd)
+    journal.fd = transaction_log.fd = None
+    base = os.path.abspath(DB_FILE)
+    datos = os.path.abspath(DATA_DIR) + os.sep
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return
+    for fd in fds:
+        try:
+            destino = os.readlink(f"/proc/self/fd/{fd}")
+        except OSError:
+            continue
+        if destino.startswith(base) or destino.startswith(datos):
+            os.close(int(fd))
+
+def start_chart_pool():
+    """
+    Arranca el pool de procesos para los gráficos. Con fork todos los workers se crean en el
+    primer submit, así que se hace acá, antes de que arranquen el hilo de Flask y el event loop.
+    """
+    global chart_pool
+    if CHART_RENDERER is None or "fork" not in multiprocessing.get_all_start_methods():
+        return
+    chart_pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context("fork"), initializer=_chart_worker_init)
+    chart_pool.submit(int).result()
+
+class ChartCache:
+    """
+    PNGs ya renderizados, con clave (gráfico, versión del historial, tamaño). Se guarda solo
+    la última versión de cada gráfico y tamaño, y si dos pedidos llegan juntos se renderiza una vez.
+    """
+
+    def __init__(self):
+        self.images: dict[tuple, bytes] = {}
+        self.inflight: dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.renders = 0
+
+    async def get(self, key, render, *args):
+        png = self.images.get(key)
+        if png is not None:
+            self.hits += 1
+            return png
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.create_task(self._render(key, render, args))
+        return await asyncio.shield(task)
+
+    async def _render(self, key, render, args):
+        global chart_pool
+        try:
+            png = None
+            pool = chart_pool
+            if pool is not None:
+                try:
+                    png = await asyncio.get_running_loop().run_in_executor(pool, render, *args)
+                except BrokenProcessPool:
+                    # Se murió un worker y el pool ya no sirve. No se vuelve a hacer fork con el
+                    # bot andando (hay hilos): de acá en más los gráficos se hacen en un hilo
+                    if chart_pool is pool:
+                        print("⚠️ Se cayó el pool de gráficos; se siguen renderizando en un hilo")
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        chart_pool = None
+            if png is None:
+                png = await asyncio.to_thread(render, *args)
+            self.renders += 1
+            nombre, _, size = key
+            for viejo in [k for k in self.images if k[0] == nombre and k[2] == size]:
+                del self.images[viejo]
+            self.images[key] = png
+            return png
+        finally:
+            self.inflight.pop(key, None)
+
+chart_cache = ChartCache()
+
+# Rango de /cryptostatus → (resolución, puntos, etiqueta del eje). None = puntos crudos de 5m.
+# La cantidad de puntos está acotada, así que el costo del gráfico no depende del rango.
+CRYPTO_RANGES = {
+    "24h": (None, PRICE_HISTORY_POINTS, "Tiempo (5m por punto)"),
+    "7d": ("1h", 24 * 7, "Tiempo (1h por vela)"),
+    "30d": ("1h", 24 * 30, "Tiempo (1h por vela)"),
+    "1y": ("1d", 365, "Tiempo (1d por vela)"),
+}
+
+def range_prices(sym, rango):
+    """(versión, bytes de precios) de un símbolo en el rango pedido: cierres de vela o puntos crudos."""
+    resolucion, puntos, _ = CRYPTO_RANGES[rango]
+    if resolucion is None:
+        serie = price_history[sym]
+        return serie.version, serie.values().tobytes()
+    velas = price_history.candle_series(sym, resolucion)
+    return velas.version, velas.field("close", puntos).tobytes()
+
+async def price_chart_png(sym, rango="24h"):
+    version, precios = range_prices(sym, rango)
+    key = (f"{sym}:{rango}", version, CHART_SIZE_SINGLE)
+    render = charts.RENDERERS[CHART_RENDERER][0]
+    return await chart_cache.get(key, render, sym, precios, CHART_SIZE_SINGLE, CRYPTO_RANGES[rango][2])
+
+# El gráfico y el resumen del mercado muestran las primeras monedas del registro
+MARKET_CHART_COINS = 8
+
+def market_symbols():
+    return CRYPTO_SYMBOLS[:MARKET_CHART_COINS]
+
+async def market_chart_png(rango="24h"):
+    datos = {s: range_prices(s, rango) for s in market_symbols()}
+    colores = {s: coin_registry[s]["color"] for s in datos}
+    # La "versión" del gráfico cambia si cambia cualquier serie, la lista de monedas o sus colores
+    key = (f"ALL:{rango}", tuple((s, v, colores[s]) for s, (v, _) in datos.items()), CHART_SIZE_MARKET)
+    render = charts.RENDERERS[CHART_RENDERER][1]
+    return await chart_cache.get(key, render, {s: p for s, (_, p) in datos.items()}, CHART_SIZE_MARKET, rango, CRYPTO_RANGES[rango][2], colores)
+
+async def prerender_charts():
+    """Después de cada tick deja listos los gráficos nuevos para que /cryptostatus salga del caché."""
+    if CHART_RENDERER is None:
+        return
+    trabajos = [price_chart_png(s) for s in market_symbols() if len(price_history[s]) > 1]
+    if all(len(price_history[s]) > 0 for s in market_symbols()):
+        trabajos.append(market_chart_png())
+    for resultado in await asyncio.gather(*trabajos, return_exceptions=True):
+        if isinstance(resultado, Exception):
+            print(f"Error pre-renderizando gráficos: {resultado}")
+
 # ============================
-# CRYPTOS - COMPLETO
+# ÓRDENES LÍMITE Y STOP
 # ============================
-CRYPTO_FILE = os.path.join(DATA_DIR, "cryptos.json")
+ORDERS_FILE = os.path.join(DATA_DIR, "orders.json")
+MAX_ORDERS_PER_USER = 10
+ORDER_FEE = 0.01
+
+# tipo → (lado, cuándo se dispara): "abajo" = precio <= el de la orden, "arriba" = precio >= el de la orden
+ORDER_TYPES = {
+    "limit_buy": ("buy", "abajo"),
+    "stop_sell": ("sell", "abajo"),
+    "limit_sell": ("sell", "arriba"),
+    "stop_buy": ("buy", "arriba"),
+}
+ORDER_LABELS = {
+    "limit_buy": "🟢 Compra límite",
+    "limit_sell": "🔴 Venta límite",
+    "stop_buy": "🟢 Compra stop",
+    "stop_sell": "🔴 Stop loss",
+}
 
-def load_cryptos():
-    data = load_json(CRYPTO_FILE, None)
-    if data is None or data == {}:
-        data = {
-            "RSC": {"price": 100, "history": [], "volumen_24h": 0},
-            "CTC": {"price": 200, "history": [], "volumen_24h": 0},
-            "MMC": {"price": 50, "history": [], "volumen_24h": 0},
-            "holders": {}
-        }
-        save_cryptos(data)
-    return data
+class OrderBook(PersistentStore):
+    """
+    Órdenes límite y stop en espera. Por símbolo hay dos heaps: las que se disparan cuando el
+    precio baja hasta su valor (compras límite y stop loss, max-heap) y las que se disparan
+    cuando sube (ventas límite y compras stop, min-heap). En cada tick solo se miran las
+    puntas, así que el costo depende de cuántas órdenes se ejecutan y no de cuántas esperan.
+    Al crear una orden se reservan los fondos (USD para compras, crypto para ventas): ejecutarla
+    nunca falla por saldo y cancelarla los devuelve. Cancelar solo saca la orden del índice;
+    su entrada vieja en el heap se descarta cuando llega a la punta.
+    """
 
-def save_cryptos(data):
-    save_json(CRYPTO_FILE, data)
+    def __init__(self, path):
+        self.path = path
+        self.load(load_json(path, {}))
+        self.register()
+
+    def load(self, data):
+        self.orders: dict[int, dict] = {}
+        self.by_user: dict[str, set[int]] = {}
+        self.heaps: dict[tuple[str, str], list] = {}
+        self.stale = 0
+        self.next_id = data.get("next_id", 1)
+        for orden in data.get("orders", []):
+            self._index(orden)
+
+    def replace(self, data):
+        """Reemplaza todas las órdenes (usado por /restore)."""
+        self.load(data)
+        self.dirty = True
+
+    def snapshot(self):
+        return {"next_id": self.next_id, "orders": [dict(o) for o in self.orders.values()]}
+
+    def _index(self, orden):
+        self.orders[orden["id"]] = orden
+        self.by_user.setdefault(orden["uid"], set()).add(orden["id"])
+        lado = ORDER_TYPES[orden["tipo"]][1]
+        clave = -orden["precio"] if lado == "abajo" else orden["precio"]
+        heapq.heappush(self.heaps.setdefault((orden["sym"], lado), []), (clave, orden["id"]))
+        self.next_id = max(self.next_id, orden["id"] + 1)
+
+    def _unindex(self, order_id):
+        orden = self.orders.pop(order_id)
+        ids = self.by_user[orden["uid"]]
+        ids.discard(order_id)
+        if not ids:
+            del self.by_user[orden["uid"]]
+        return orden
+
+    def _compact(self):
+        """Saca de los heaps las entradas de órdenes canceladas cuando ya son mayoría."""
+        if self.stale <= len(self.orders) + 64:
+            return
+        for heap in self.heaps.values():
+            heap[:] = [e for e in heap if e[1] in self.orders]
+            heapq.heapify(heap)
+        self.stale = 0
+
+    def user_orders(self, uid):
+        return sorted((self.orders[i] for i in self.by_user.get(uid, ())), key=lambda o: o["id"])
+
+    def place(self, uid, sym, tipo, precio, monto):
+        """
+        Crea una orden reservando los fondos; hay que llamarla con balances_lock tomado.
+        Devuelve (orden, None) o (None, mensaje de error).
+        """
+        if len(self.by_user.get(uid, ())) >= MAX_ORDERS_PER_USER:
+            return None, f"❌ Ya tenés {MAX_ORDERS_PER_USER} órdenes abiertas. Cancelá alguna con `/cancelorder`."
+        compra, lado = ORDER_TYPES[tipo]
+        actual = cryptos[sym]["price"]
+        # Una orden que ya dispara sería una operación a mercado, y el precio nunca baja de 1
+        if lado == "abajo" and not 1 <= precio < actual:
+            return None, f"❌ Para esta orden el precio tiene que estar entre 1 y {actual:,} USD (el actual, sin incluirlo)."
+        if lado == "arriba" and precio <= actual:
+            return None, f"❌ Para esta orden el precio tiene que ser mayor al actual ({actual:,} USD)."
+        compra = compra == "buy"
+        saldo = balances.get(uid, 0)
+        tenencia = cryptos["holders"].get(uid, {}).get(sym, 0)
+        if compra and saldo < monto:
+            return None, f"❌ Necesitás {fmt(monto)} USD. Tenés {fmt(saldo)} USD."
+        if not compra and tenencia < monto:
+            return None, f"❌ Tenés {tenencia:.4f} {sym}."
+        orden = {"id": self.next_id, "uid": uid, "sym": sym, "tipo": tipo, "precio": precio, "monto": monto, "creada": time.time()}
+        # La reserva y la orden van en un mismo registro del journal
+        with journal.batch():
+            if compra:
+                balances[uid] = saldo - monto
+            else:
+                set_holding(uid, sym, tenencia - monto)
+            self._index(orden)
+            journal.append("order", o=orden)
+        self.dirty = True
+        return orden, None
+
+    def cancel(self, uid, order_id):
+        """Cancela una orden del usuario y devuelve lo reservado; hay que llamarla con balances_lock tomado."""
+        orden = self.orders.get(order_id)
+        if orden is None or orden["uid"] != uid:
+            return None
+        with journal.batch():
+            self._unindex(order_id)
+            if ORDER_TYPES[orden["tipo"]][0] == "buy":
+                balances[uid] = balances.get(uid, 0) + orden["monto"]
+            else:
+                sym = orden["sym"]
+                set_holding(uid, sym, cryptos["holders"].get(uid, {}).get(sym, 0) + orden["monto"])
+            journal.append("order_close", ids=[order_id])
+        self.stale += 1
+        self._compact()
+        self.dirty = True
+        return orden
+
+    def match(self, prices):
+        """
+        Ejecuta todas las órdenes que disparan los precios nuevos, al precio del tick.
+        Junta los movimientos por usuario y escribe cada balance y cada tenencia una sola vez.
+        Devuelve las órdenes ejecutadas con "ejecutada" (precio) y "resultado" (crypto o USD recibidos).
+        """
+        ejecutadas = []
+        for (sym, lado), heap in self.heaps.items():
+            price = prices.get(sym)
+            if price is None:
+                continue
+            while heap:
+                clave, order_id = heap[0]
+                if order_id not in self.orders:
+                    heapq.heappop(heap)
+                    self.stale = max(0, self.stale - 1)
+                    continue
+                limite = -clave if lado == "abajo" else clave
+                if (price > limite) if lado == "abajo" else (price < limite):
+                    break
+                heapq.heappop(heap)
+                ejecutadas.append(self._unindex(order_id))
+        if not ejecutadas:
+            return ejecutadas
+
+        usd = {}
+        cripto = {}
+        volumen = {}
+        for orden in ejecutadas:
+            uid, sym, monto = orden["uid"], orden["sym"], orden["monto"]
+            price = prices[sym]
+            if ORDER_TYPES[orden["tipo"]][0] == "buy":
+                comision = round(monto * ORDER_FEE, 2)
+                cantidad = (monto - comision) / price
+                cripto[(uid, sym)] = cripto.get((uid, sym), 0) + cantidad
+                volumen[sym] = volumen.get(sym, 0) + monto * 0.1
+                orden["resultado"] = cantidad
+                # Los USD ya se descontaron al reservar: acá solo se deja constancia de en qué se usaron
+                log_transaction(uid, 0, f"📗 Orden #{orden['id']} ejecutada: {fmt(monto)} USD → {cantidad:.4f} {sym} a {fmt(price)} USD")
+            else:
+                bruto = monto * price
+                neto = bruto - round(bruto * ORDER_FEE, 2)
+                usd[uid] = usd.get(uid, 0) + neto
+                volumen[sym] = volumen.get(sym, 0) - bruto * 0.1
+                orden["resultado"] = neto
+                log_transaction(uid, neto, f"📕 Orden #{orden['id']} ejecutada: {monto:.4f} {sym} a {fmt(price)} USD")
+            orden["ejecutada"] = price
+
+        holders = cryptos["holders"]
+        with journal.batch():
+            for uid, delta in usd.items():
+                balances[uid] = balances.get(uid, 0) + delta
+            for (uid, sym), delta in cripto.items():
+                set_holding(uid, sym, holders.get(uid, {}).get(sym, 0) + delta)
+            journal.append("order_close", ids=[o["id"] for o in ejecutadas])
+        for sym, delta in volumen.items():
+            cryptos[sym]["volumen_24h"] = cryptos[sym].get("volumen_24h", 0) + delta
+        self.dirty = True
+        return ejecutadas
+
+    def apply_record(self, record):
+        """Reaplica un evento del journal (idempotente)."""
+        if record["k"] == "order":
+            if record["o"]["id"] not in self.orders:
+                self._index(record["o"])
+        else:
+            for order_id in record["ids"]:
+                if order_id in self.orders:
+                    self._unindex(order_id)
+                    self.stale += 1
+        self.dirty = True
+
+    def prepare_flush(self):
+        if not self.dirty:
+            return None
+        self.dirty = False
+        data = self.snapshot()
+        return lambda: save_json(self.path, data)
+
+order_book = OrderBook(ORDERS_FILE)
+
+# ============================
+# LIQUIDACIÓN DE TRADES (micro-batches)
+# ============================
+SETTLE_WINDOW_MS = 20
+SETTLE_MAX_BATCH = 1000
+TRADE_FEE = 0.01
+TRADE_DUST = 0.001   # lo que queda por debajo de esto al vender se redondea a 0
+
+class TradeSettlement:
+    """
+    /buycrypto y /sellcrypto no escriben nada: encolan el trade y esperan su resultado.
+    Un solo consumidor junta lo que llega en SETTLE_WINDOW_MS y lo liquida de una vez con
+    balances_lock tomado: cada trade se valida contra lo que van dejando los anteriores del
+    mismo batch, cada balance y cada tenencia se escribe una sola vez, el volumen de cada
+    moneda se actualiza una vez, y balances y tenencias quedan juntos en un único registro
+    del journal.
+    """
 
-cryptos = load_cryptos()
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.stats = {"trades": 0, "rechazados": 0, "batches": 0, "max_batch": 0}
+
+    async def submit(self, uid, sym, lado, cantidad):
+        """
+        Encola un trade y espera a que se liquide. lado es "buy" (cantidad en USD) o "sell"
+        (cantidad en crypto); cantidad None = todo. Devuelve el resultado o {"error": mensaje}.
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((uid, sym, lado, cantidad, futuro))
+        return await futuro
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            await asyncio.sleep(SETTLE_WINDOW_MS / 1000)
+            while len(batch) < SETTLE_MAX_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                async with balances_lock:
+                    resultados = self.settle(batch)
+            except Exception as e:
+                print(f"Error liquidando trades: {e}")
+                resultados = [{"error": "❌ No se pudo completar la operación. Probá de nuevo."}] * len(batch)
+            for (*_, futuro), resultado in zip(batch, resultados):
+                if not futuro.done():
+                    futuro.set_result(resultado)
+
+    @staticmethod
+    def _rollback(saldos, tenencias):
+        """Vuelve balances y tenencias a los valores dados sin pasar por el journal (el batch no se escribió)."""
+        suspendido, journal.suspended = journal.suspended, True
+        try:
+            for uid, saldo in saldos.items():
+                if saldo is None:
+                    balances.pop(uid, None)
+                elif balances.get(uid) != saldo:
+                    balances[uid] = saldo
+            for (uid, sym), tenencia in tenencias.items():
+                if cryptos["holders"].get(uid, {}).get(sym, 0) != tenencia:
+                    set_holding(uid, sym, tenencia)
+        finally:
+            journal.suspended = suspendido
+
+    def settle(self, batch):
+        """Liquida un batch (sin awaits); devuelve un resultado por trade, en el mismo orden."""
+        holders = cryptos["holders"]
+        saldos = {}
+        tenencias = {}
+        volumen = {}
+        movimientos = []
+        resultados = []
+        for uid, sym, lado, cantidad, _ in batch:
+            if sym not in coin_registry:
+                resultados.append({"error": "❌ Cripto inválida."})
+                continue
+            price = cryptos[sym]["price"]
+            saldo = saldos.get(uid, balances.get(uid, 0))
+            tenencia = tenencias.get((uid, sym), holders.get(uid, {}).get(sym, 0))
+            if lado == "buy":
+                gasto = saldo if cantidad is None else cantidad
+                if gasto <= 0:
+                    resultados.append({"error": "❌ No tenés USD."})
+                    continue
+                if saldo < gasto:
+                    resultados.append({"error": f"❌ Necesitás {fmt(gasto)} USD. Tenés {fmt(saldo)} USD."})
+                    continue
+                comision = round(gasto * TRADE_FEE, 2)
+                cantidad_crypto = (gasto - comision) / price
+                saldos[uid] = saldo - gasto
+                tenencias[(uid, sym)] = tenencia + cantidad_crypto
+                volumen[sym] = volumen.get(sym, 0) + gasto * 0.1
+                movimientos.append((uid, -gasto, f"🟢 Compra de {cantidad_crypto:.4f} {sym}"))
+                resultados.append({"cantidad": cantidad_crypto, "usd": gasto, "comision": comision, "precio": price, "tenencia": tenencia + cantidad_crypto})
+            else:
+                if tenencia <= 0:
+                    resultados.append({"error": f"❌ No tenés {sym}."})
+                    continue
+                vender = tenencia if cantidad is None else cantidad
+                if vender > tenencia:
+                    resultados.append({"error": f"❌ Tenés {tenencia:.4f}."})
+                    continue
+                bruto = vender * price
+                comision = round(bruto * TRADE_FEE, 2)
+                neto = bruto - comision
+                restante = tenencia - vender
+                if restante < TRADE_DUST:
+                    restante = 0
+                saldos[uid] = saldo + neto
+                tenencias[(uid, sym)] = restante
+                volumen[sym] = volumen.get(sym, 0) - bruto * 0.1
+                movimientos.append((uid, neto, f"🔴 Venta de {vender:.4f} {sym}"))
+                resultados.append({"cantidad": vender, "usd": neto, "comision": comision, "precio": price, "tenencia": restante})
+
+        # Lo de antes, para deshacer en memoria si la escritura falla a mitad de camino
+        saldos_antes = {uid: balances.get(uid) for uid in saldos}
+        tenencias_antes = {(uid, sym): holders.get(uid, {}).get(sym, 0) for uid, sym in tenencias}
+        try:
+            with journal.batch():
+                for uid, saldo in saldos.items():
+                    balances[uid] = saldo
+                for (uid, sym), tenencia in tenencias.items():
+                    set_holding(uid, sym, tenencia)
+        except Exception:
+            self._rollback(saldos_antes, tenencias_antes)
+            raise
+        for movimiento in movimientos:
+            log_transaction(*movimiento)
+        for sym, delta in volumen.items():
+            cryptos[sym]["volumen_24h"] = cryptos[sym].get("volumen_24h", 0) + delta
+        cryptos.save()
+
+        rechazados = sum(1 for r in resultados if "error" in r)
+        self.stats["trades"] += len(batch) - rechazados
+        self.stats["rechazados"] += rechazados
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        return resultados
+
+trade_settlement = TradeSettlement()
+
+async def notify_order_fills(ejecutadas):
+    """Avisa por DM a cada usuario qué órdenes suyas se ejecutaron (un mensaje por usuario)."""
+    por_usuario = {}
+    for orden in ejecutadas:
+        por_usuario.setdefault(orden["uid"], []).append(orden)
+    for uid, ordenes in por_usuario.items():
+        lineas = []
+        for o in ordenes:
+            if ORDER_TYPES[o["tipo"]][0] == "buy":
+                detalle = f"{fmt(o['monto'])} USD → **{o['resultado']:.4f} {o['sym']}**"
+            else:
+                detalle = f"{o['monto']:.4f} {o['sym']} → **{fmt(o['resultado'])} USD**"
+            lineas.append(f"`#{o['id']}` {ORDER_LABELS[o['tipo']]} **{o['sym']}** a {fmt(o['ejecutada'])} USD • {detalle}")
+        embed = discord.Embed(title="✅ Órdenes ejecutadas", description="\n".join(lineas), color=discord.Color.green())
+        try:
+            user = bot.get_user(int(uid)) or await bot.fetch_user(int(uid))
+            await user.send(embed=embed)
+        except discord.HTTPException:
+            pass  # DMs cerrados o usuario inexistente: queda igual en /history
 
 async def update_crypto_prices():
     await bot.wait_until_ready()
     while not bot.is_closed():
-        for sym in ("RSC", "CTC", "MMC"):
-            price = cryptos[sym]["price"]
-            volumen = cryptos[sym].get("volumen_24h", 0)
-            random_change = random.uniform(-0.05, 0.05)
-            demand_factor = 0
-            if volumen > 10000:
-                demand_factor = min(0.02, volumen / 500000)
-            elif volumen < -10000:
-                demand_factor = max(-0.02, volumen / 500000)
-            total_change = (random_change * 0.9) + (demand_factor * 0.1)
-            total_change = max(-0.08, min(total_change, 0.08))
-            new_price = max(1, price * (1 + total_change))
-            new_price = round(new_price, 2)
-            cryptos[sym]["volumen_24h"] = max(0, volumen * 0.8)
-            cryptos[sym]["price"] = new_price
-            cryptos[sym]["history"].append(new_price)
-            if len(cryptos[sym]["history"]) > 288:
-                cryptos[sym]["history"].pop(0)
+        market_engine.tick()
+        # Las órdenes en espera se ejecutan todas juntas contra los precios nuevos
+        async with balances_lock:
+            ejecutadas = order_book.match(crypto_prices())
+        if ejecutadas:
+            asyncio.create_task(notify_order_fills(ejecutadas))
         save_cryptos(cryptos)
+        holdings_matrix.refresh_ranking(crypto_prices())
+        asyncio.create_task(prerender_charts())
         await asyncio.sleep(300)
 
+async def coin_autocomplete(interaction: discord.Interaction, current: str):
+    current = current.upper()
+    return [
+        app_commands.Choice(name=f"{s} ({fmt(cryptos[s]['price'])} USD)", value=s)
+        for s in CRYPTO_SYMBOLS if s.startswith(current)
+    ][:25]
+
 @tree.command(name="cryptostatus", description="📊 Ver estado de las cryptos (con gráficos)")
-@app_commands.describe(coin="Criptomoneda específica (RSC, CTC, MMC) - opcional")
-async def cryptostatus(interaction: discord.Interaction, coin: Optional[str] = None):
+@app_commands.describe(coin="Criptomoneda específica - opcional", rango="Período del gráfico (24h por defecto)")
+@app_commands.autocomplete(coin=coin_autocomplete)
+@app_commands.choices(rango=[
+    app_commands.Choice(name="24 horas", value="24h"),
+    app_commands.Choice(name="7 días", value="7d"),
+    app_commands.Choice(name="30 días", value="30d"),
+    app_commands.Choice(name="1 año", value="1y"),
+])
+async def cryptostatus(interaction: discord.Interaction, coin: Optional[str] = None, rango: str = "24h"):
     if not await ensure_guild_or_reply(interaction):
         return
-    if coin and coin.upper() in ("RSC", "CTC", "MMC"):
+    if coin and coin.upper() in coin_registry:
         sym = coin.upper()
-        if plt and len(cryptos[sym]["history"]) > 1:
-            prices = cryptos[sym]["history"]
-            plt.style.use("dark_background")
-            fig, ax = plt.subplots(figsize=(8, 3))
-            ax.plot(prices, linewidth=2, color='gold')
-            ax.set_title(f"{sym} – Movimiento de precio")
-            ax.set_xlabel("Tiempo (5m por punto)")
-            ax.set_ylabel("Precio (USD)")
-            ax.fill_between(range(len(prices)), prices, alpha=0.3, color='gold')
-            ax.grid(True, alpha=0.3)
-            buf = io.BytesIO()
-            plt.tight_layout()
-            fig.savefig(buf, format="png", dpi=220)
-            buf.seek(0)
-            plt.close()
-            file = discord.File(buf, filename=f"{sym}.png")
-            embed = discord.Embed(title=f"{sym} — {cryptos[sym]['price']:,} USD", description="📊 Movimiento de precio (24h)", color=discord.Color.blue())
+        if CHART_RENDERER and len(price_history[sym]) > 1:
+            await interaction.response.defer()
+            file = discord.File(io.BytesIO(await price_chart_png(sym, rango)), filename=f"{sym}.png")
+            embed = discord.Embed(title=f"{sym} — {cryptos[sym]['price']:,} USD", description=f"📊 Movimiento de precio ({rango})", color=discord.Color.blue())
             embed.set_image(url=f"attachment://{sym}.png")
-            await interaction.response.send_message(embed=embed, file=file)
+            await interaction.followup.send(embed=embed, file=file)
         else:
             await interaction.response.send_message(f"{sym}: {cryptos[sym]['price']} USD")
         return
     
-    if plt and all(len(cryptos[s]["history"]) > 0 for s in ("RSC", "CTC", "MMC")):
-        plt.style.use("dark_background")
-        fig, ax = plt.subplots(figsize=(10, 5))
-        colors = {"RSC": "#e74c3c", "CTC": "#3498db", "MMC": "#2ecc71"}
-        for sym in ("RSC", "CTC", "MMC"):
-            prices = cryptos[sym]["history"]
-            ax.plot(prices, linewidth=2, color=colors[sym], label=sym)
-        ax.set_title("📊 Movimiento de precios - Todas las cryptos (24h)")
-        ax.set_xlabel("Tiempo (5m por punto)")
-        ax.set_ylabel("Precio (USD)")
-        ax.legend()
-        ax.grid(True, alpha=0.3)
-        buf = io.BytesIO()
-        plt.tight_layout()
-        fig.savefig(buf, format="png", dpi=220)
-        buf.seek(0)
-        plt.close()
-        file = discord.File(buf, filename="all_cryptos.png")
-        embed = discord.Embed(title="💰 Estado del Mercado Crypto", description="Movimiento de precios de las últimas 24h", color=discord.Color.blue())
-        for sym in ("RSC", "CTC", "MMC"):
+    if CHART_RENDERER and all(len(price_history[s]) > 0 for s in market_symbols()):
+        await interaction.response.defer()
+        file = discord.File(io.BytesIO(await market_chart_png(rango)), filename="all_cryptos.png")
+        embed = discord.Embed(title="💰 Estado del Mercado Crypto", description=f"Movimiento de precios ({rango})", color=discord.Color.blue())
+        for sym in market_symbols():
             embed.add_field(name=sym, value=f"{cryptos[sym]['price']:,} USD", inline=True)
         embed.set_image(url="attachment://all_cryptos.png")
-        await interaction.response.send_message(embed=embed, file=file)
+        await interaction.followup.send(embed=embed, file=file)
     else:
-        desc = "\n".join([f"**{s}** → {cryptos[s]['price']:,} USD" for s in ("RSC", "CTC", "MMC")])
+        desc = "\n".join([f"**{s}** → {cryptos[s]['price']:,} USD" for s in market_symbols()])
         await interaction.response.send_message(embed=discord.Embed(title="💰 Criptos", description=desc, color=discord.Color.blue()))
 
 @tree.command(name="buycrypto", description="🟢 Comprar cryptos (USD → crypto)")
-@app_commands.describe(coin="Criptomoneda a comprar (RSC, CTC, MMC)", cantidad="Cantidad en USD, o 'a' para gastar todo")
+@app_commands.describe(coin="Criptomoneda a comprar", cantidad="Cantidad en USD, o 'a' para gastar todo")
+@app_commands.autocomplete(coin=coin_autocomplete)
 async def buycrypto(interaction: discord.Interaction, coin: str, cantidad: str):
     if not await ensure_guild_or_reply(interaction):
         return
     uid = str(interaction.user.id)
     sym = coin.upper()
-    if sym not in ("RSC", "CTC", "MMC"):
+    if sym not in coin_registry:
         return await interaction.response.send_message("❌ Cripto inválida.", ephemeral=True)
     if cantidad.lower() == "a":
-        async with balances_lock:
-            gasto = balances.get(uid, 0)
-            if gasto <= 0:
-                return await interaction.response.send_message("❌ No tenés USD.", ephemeral=True)
+        gasto = None
     else:
         try:
             gasto = float(cantidad)
-            if gasto <= 0:
-                return await interaction.response.send_message("❌ Cantidad inválida.", ephemeral=True)
         except ValueError:
             return await interaction.response.send_message("❌ Usá un número o 'a'.", ephemeral=True)
-    comision = round(gasto * 0.01, 2)
-    gasto_real = gasto - comision
-    price = cryptos[sym]["price"]
-    cantidad_crypto = gasto_real / price
-    async with balances_lock:
-        saldo = balances.get(uid, 0)
-        if saldo < gasto:
-            return await interaction.response.send_message(f"❌ Necesitás {fmt(gasto)} USD. Tenés {fmt(saldo)} USD.", ephemeral=True)
-        balances[uid] -= gasto
-        save_json(BALANCES_FILE, balances)
-    holders = cryptos["holders"]
-    if uid not in holders:
-        holders[uid] = {"RSC": 0, "CTC": 0, "MMC": 0}
-    holders[uid][sym] += cantidad_crypto
-    save_cryptos(cryptos)
-    cryptos[sym]["volumen_24h"] = cryptos[sym].get("volumen_24h", 0) + (gasto * 0.1)
-    save_cryptos(cryptos)
-    embed = discord.Embed(title=f"🟢 Compra de {sym}", description=f"Compraste **{cantidad_crypto:.4f} {sym}**", color=discord.Color.green())
-    embed.add_field(name="💰 Gastado", value=f"{fmt(gasto)} USD", inline=True)
-    embed.add_field(name="💸 Comisión (1%)", value=f"{fmt(comision)} USD", inline=True)
-    embed.add_field(name="💎 Precio unitario", value=f"{fmt(price)} USD", inline=True)
-    embed.add_field(name="💎 Cartera", value=f"{holders[uid][sym]:.4f} {sym}", inline=False)
+        if not math.isfinite(gasto) or gasto <= 0:
+            return await interaction.response.send_message("❌ Cantidad inválida.", ephemeral=True)
+    resultado = await trade_settlement.submit(uid, sym, "buy", gasto)
+    if "error" in resultado:
+        return await interaction.response.send_message(resultado["error"], ephemeral=True)
+    embed = discord.Embed(title=f"🟢 Compra de {sym}", description=f"Compraste **{resultado['cantidad']:.4f} {sym}**", color=discord.Color.green())
+    embed.add_field(name="💰 Gastado", value=f"{fmt(resultado['usd'])} USD", inline=True)
+    embed.add_field(name="💸 Comisión (1%)", value=f"{fmt(resultado['comision'])} USD", inline=True)
+    embed.add_field(name="💎 Precio unitario", value=f"{fmt(resultado['precio'])} USD", inline=True)
+    embed.add_field(name="💎 Cartera", value=f"{resultado['tenencia']:.4f} {sym}", inline=False)
     embed.set_footer(text=interaction.user.display_name)
     await interaction.response.send_message(embed=embed)
 
 @tree.command(name="sellcrypto", description="🔴 Vender cryptos (crypto → USD)")
-@app_commands.describe(coin="Criptomoneda a vender (RSC, CTC, MMC)", cantidad="Cantidad de crypto, o 'a' para vender todo")
+@app_commands.describe(coin="Criptomoneda a vender", cantidad="Cantidad de crypto, o 'a' para vender todo")
+@app_commands.autocomplete(coin=coin_autocomplete)
 async def sellcrypto(interaction: discord.Interaction, coin: str, cantidad: str):
     if not await ensure_guild_or_reply(interaction):
         return
     uid = str(interaction.user.id)
     sym = coin.upper()
-    if sym not in ("RSC", "CTC", "MMC"):
+    if sym not in coin_registry:
         return await interaction.response.send_message("❌ Cripto inválida.", ephemeral=True)
-    holders = cryptos["holders"]
-    user_holdings = holders.get(uid, {"RSC": 0, "CTC": 0, "MMC": 0})
-    cantidad_actual = user_holdings.get(sym, 0)
-    if cantidad_actual == 0:
-        return await interaction.response.send_message(f"❌ No tenés {sym}.", ephemeral=True)
     if cantidad.lower() == "a":
-        cantidad_vender = cantidad_actual
+        cantidad_vender = None
     else:
         try:
             cantidad_vender = float(cantidad)
-            if cantidad_vender <= 0:
-                return await interaction.response.send_message("❌ Cantidad inválida.", ephemeral=True)
         except ValueError:
             return await interaction.response.send_message("❌ Usá un número o 'a'.", ephemeral=True)
-    if cantidad_vender > cantidad_actual:
-        return await interaction.response.send_message(f"❌ Tenés {cantidad_actual:.4f}.", ephemeral=True)
-    price = cryptos[sym]["price"]
-    ganancia_bruta = cantidad_vender * price
-    comision = round(ganancia_bruta * 0.01, 2)
-    ganancia_neta = ganancia_bruta - comision
-    user_holdings[sym] -= cantidad_vender
-    if user_holdings[sym] < 0.001:
-        user_holdings[sym] = 0
-    holders[uid] = user_holdings
-    save_cryptos(cryptos)
-    await safe_add(uid, ganancia_neta)
-    cryptos[sym]["volumen_24h"] = cryptos[sym].get("volumen_24h", 0) - (ganancia_bruta * 0.1)
-    save_cryptos(cryptos)
-    embed = discord.Embed(title=f"🔴 Venta de {sym}", description=f"Vendiste **{cantidad_vender:.4f} {sym}**", color=discord.Color.red())
-    embed.add_field(name="💰 Recibido", value=f"{fmt(ganancia_neta)} USD", inline=True)
-    embed.add_field(name="💸 Comisión (1%)", value=f"{fmt(comision)} USD", inline=True)
-    embed.add_field(name="💎 Precio unitario", value=f"{fmt(price)} USD", inline=True)
-    embed.add_field(name="💎 Restante", value=f"{user_holdings[sym]:.4f} {sym}", inline=False)
+        if not math.isfinite(cantidad_vender) or cantidad_vender <= 0:
+            return await interaction.response.send_message("❌ Cantidad inválida.", ephemeral=True)
+    resultado = await trade_settlement.submit(uid, sym, "sell", cantidad_vender)
+    if "error" in resultado:
+        return await interaction.response.send_message(resultado["error"], ephemeral=True)
+    embed = discord.Embed(title=f"🔴 Venta de {sym}", description=f"Vendiste **{resultado['cantidad']:.4f} {sym}**", color=discord.Color.red())
+    embed.add_field(name="💰 Recibido", value=f"{fmt(resultado['usd'])} USD", inline=True)
+    embed.add_field(name="💸 Comisión (1%)", value=f"{fmt(resultado['comision'])} USD", inline=True)
+    embed.add_field(name="💎 Precio unitario", value=f"{fmt(resultado['precio'])} USD", inline=True)
+    embed.add_field(name="💎 Restante", value=f"{resultado['tenencia']:.4f} {sym}", inline=False)
     embed.set_footer(text=interaction.user.display_name)
     await interaction.response.send_message(embed=embed)
 
+@tree.command(name="order", description="📝 Dejar una orden límite o stop que se ejecuta en el próximo tick que llegue al precio")
+@app_commands.describe(
+    coin="Criptomoneda",
+    tipo="Tipo de orden",
+    precio="Precio de disparo en USD",
+    cantidad="USD a gastar (compras) o crypto a vender (ventas); 'a' para todo",
+)
+@app_commands.choices(tipo=[
+    app_commands.Choice(name="🟢 Compra límite (cuando baje a ese precio)", value="limit_buy"),
+    app_commands.Choice(name="🔴 Venta límite (cuando suba a ese precio)", value="limit_sell"),
+    app_commands.Choice(name="🟢 Compra stop (cuando suba a ese precio)", value="stop_buy"),
+    app_commands.Choice(name="🔴 Stop loss (cuando baje a ese precio)", value="stop_sell"),
+])
+@app_commands.autocomplete(coin=coin_autocomplete)
+async def order(interaction: discord.Interaction, coin: str, tipo: str, precio: float, cantidad: str):
+    if not await ensure_guild_or_reply(interaction):
+        return
+    uid = str(interaction.user.id)
+    sym = coin.upper()
+    if sym not in coin_registry:
+        return await interaction.response.send_message("❌ Cripto inválida.", ephemeral=True)
+    precio = round(precio, 2) if math.isfinite(precio) else 0
+    if precio <= 0:
+        return await interaction.response.send_message("❌ Precio inválido.", ephemeral=True)
+    compra = ORDER_TYPES[tipo][0] == "buy"
+    async with balances_lock:
+        if cantidad.lower() == "a":
+            monto = balances.get(uid, 0) if compra else cryptos["holders"].get(uid, {}).get(sym, 0)
+        else:
+            try:
+                monto = float(cantidad)
+            except ValueError:
+                return await interaction.response.send_message("❌ Usá un número o 'a'.", ephemeral=True)
+        if not math.isfinite(monto) or monto <= 0:
+            return await interaction.response.send_message("❌ Cantidad inválida.", ephemeral=True)
+        orden, error = order_book.place(uid, sym, tipo, precio, monto)
+    if error:
+        return await interaction.response.send_message(error, ephemeral=True)
+    if compra:
+        log_transaction(uid, -monto, f"📝 Orden #{orden['id']}: reserva para {sym}")
+    reservado = f"{fmt(monto)} USD" if compra else f"{monto:.4f} {sym}"
+    embed = discord.Embed(title=f"📝 Orden #{orden['id']} creada", description=f"{ORDER_LABELS[tipo]} de **{sym}** a **{fmt(orden['precio'])} USD**", color=discord.Color.blurple())
+    embed.add_field(name="🔒 Reservado", value=reservado, inline=True)
+    embed.add_field(name="💎 Precio actual", value=f"{fmt(cryptos[sym]['price'])} USD", inline=True)
+    embed.set_footer(text="Se ejecuta en el tick de precios que la dispare • /orders para verlas")
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="orders", description="📋 Ver tus órdenes límite y stop abiertas")
+async def orders(interaction: discord.Interaction):
+    if not await ensure_guild_or_reply(interaction):
+        return
+    abiertas = order_book.user_orders(str(interaction.user.id))
+    if not abiertas:
+        return await interaction.response.send_message("📭 No tenés órdenes abiertas.", ephemeral=True)
+    lines = []
+    for o in abiertas:
+        reservado = f"{fmt(o['monto'])} USD" if ORDER_TYPES[o["tipo"]][0] == "buy" else f"{o['monto']:.4f} {o['sym']}"
+        lines.append(f"`#{o['id']}` {ORDER_LABELS[o['tipo']]} **{o['sym']}** a {fmt(o['precio'])} USD • {reservado} (<t:{int(o['creada'])}:R>)")
+    embed = discord.Embed(title="📋 Tus órdenes", description="\n".join(lines), color=discord.Color.blurple())
+    embed.set_footer(text=f"{len(abiertas)}/{MAX_ORDERS_PER_USER} • /cancelorder para cancelar")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@tree.command(name="cancelorder", description="❌ Cancelar una orden abierta y recuperar lo reservado")
+@app_commands.describe(id="Número de la orden (ver /orders)")
+async def cancelorder(interaction: discord.Interaction, id: int):
+    if not await ensure_guild_or_reply(interaction):
+        return
+    uid = str(interaction.user.id)
+    async with balances_lock:
+        orden = order_book.cancel(uid, id)
+    if orden is None:
+        return await interaction.response.send_message(f"❌ No tenés una orden abierta con el número #{id}.", ephemeral=True)
+    if ORDER_TYPES[orden["tipo"]][0] == "buy":
+        log_transaction(uid, orden["monto"], f"❌ Orden #{id} cancelada")
+        devuelto = f"{fmt(orden['monto'])} USD"
+    else:
+        devuelto = f"{orden['monto']:.4f} {orden['sym']}"
+    await interaction.response.send_message(f"✅ Orden #{id} cancelada. Se te devolvieron {devuelto}.", ephemeral=True)
+
 @tree.command(name="boughtcrypto", description="💼 Ver tu cartera de cryptos o la de otro usuario")
 @app_commands.describe(usuario="Usuario (opcional, solo admins)")
 async def boughtcrypto(interaction: discord.Interaction, usuario: Optional[discord.User] = None):
@@ -1234,10 +3502,10 @@ async def boughtcrypto(interaction: discord.Interaction, usuario: Optional[disco
         uid = str(interaction.user.id)
         titulo = "💼 Tu cartera"
     holders = cryptos["holders"]
-    u = holders.get(uid, {"RSC": 0, "CTC": 0, "MMC": 0})
+    u = holders.get(uid, {})
     lines = []
     total_valor = 0
-    for s in ("RSC", "CTC", "MMC"):
+    for s in CRYPTO_SYMBOLS:
         amt = u.get(s, 0)
         if amt > 0:
             valor = round(amt * cryptos[s]["price"], 2)
@@ -1264,14 +3532,10 @@ async def killcrypto(interaction: discord.Interaction, user: discord.User, coin:
         return await interaction.response.send_message("❌ No tenés permisos.", ephemeral=True)
     global cryptos
     sym = coin.upper()
-    if sym not in cryptos:
+    if sym not in coin_registry:
         return await interaction.response.send_message(f"❌ La crypto **{sym}** no existe.", ephemeral=True)
     uid = str(user.id)
-    if "holders" not in cryptos:
-        cryptos["holders"] = {}
-    if uid not in cryptos["holders"]:
-        cryptos["holders"][uid] = {"RSC": 0, "CTC": 0, "MMC": 0}
-    current = cryptos["holders"][uid].get(sym, 0)
+    current = cryptos.get("holders", {}).get(uid, {}).get(sym, 0)
     if action.value == "add":
         new_amount = current + amount
         msg = f"➕ Agregado **{amount} {sym}** a {user.display_name}"
@@ -1281,8 +3545,7 @@ async def killcrypto(interaction: discord.Interaction, user: discord.User, coin:
     else:
         new_amount = amount
         msg = f"🛠️ Seteado **{sym} = {amount}** para {user.display_name}"
-    cryptos["holders"][uid][sym] = new_amount
-    save_cryptos(cryptos)
+    set_holding(uid, sym, new_amount)
     embed = discord.Embed(title="⚙️ Gestión de Cryptos", color=discord.Color.red(), description=msg)
     embed.add_field(name="Usuario", value=user.display_name)
     embed.add_field(name="Coin", value=sym)
@@ -1290,7 +3553,8 @@ async def killcrypto(interaction: discord.Interaction, user: discord.User, coin:
     await interaction.response.send_message(embed=embed)
 
 @tree.command(name="setpricecrypto", description="(Admin) Establecer el precio de una crypto")
-@app_commands.describe(coin="RSC, CTC, MMC", price="Nuevo precio")
+@app_commands.describe(coin="Criptomoneda", price="Nuevo precio")
+@app_commands.autocomplete(coin=coin_autocomplete)
 async def setpricecrypto(interaction: discord.Interaction, coin: str, price: float):
     if not await ensure_guild_or_reply(interaction):
         return
@@ -1300,71 +3564,500 @@ async def setpricecrypto(interaction: discord.Interaction, coin: str, price: flo
         return await interaction.response.send_message("❌ Precio debe ser mayor a 0.", ephemeral=True)
     global cryptos
     sym = coin.upper()
-    if sym not in cryptos:
+    if sym not in coin_registry:
         return await interaction.response.send_message(f"❌ La crypto **{sym}** no existe.", ephemeral=True)
     cryptos[sym]["price"] = round(price, 2)
-    cryptos[sym]["history"].append(round(price, 2))
-    if len(cryptos[sym]["history"]) > 288:
-        cryptos[sym]["history"] = cryptos[sym]["history"][-288:]
+    price_history.append(sym, round(price, 2))
     save_cryptos(cryptos)
     embed = discord.Embed(title="💹 Precio actualizado", description=f"Precio de **{sym}**", color=discord.Color.green())
     embed.add_field(name="Nuevo precio", value=f"{cryptos[sym]['price']:,} USD")
     embed.set_footer(text=f"Actualizado por {interaction.user.display_name}")
     await interaction.response.send_message(embed=embed)
 
+@tree.command(name="coin", description="⚙️ (Admin) Agregar, configurar o quitar una criptomoneda")
+@app_commands.describe(
+    action="add | edit | remove",
+    coin="Símbolo (hasta 8 letras o números)",
+    precio_inicial="Precio con el que arranca (solo al agregar)",
+    volatilidad="Cambio máximo al azar por tick (0.05 = 5%)",
+    max_cambio="Tope del cambio total por tick (0.08 = 8%)",
+    color="Color del gráfico en hex (#rrggbb)",
+)
+@app_commands.choices(action=[
+    app_commands.Choice(name="Agregar", value="add"),
+    app_commands.Choice(name="Editar", value="edit"),
+    app_commands.Choice(name="Quitar", value="remove")
+])
+async def coin(
+    interaction: discord.Interaction,
+    action: app_commands.Choice[str],
+    coin: str,
+    precio_inicial: Optional[float] = None,
+    volatilidad: Optional[float] = None,
+    max_cambio: Optional[float] = None,
+    color: Optional[str] = None,
+):
+    if not interaction.user.guild_permissions.administrator:
+        return await interaction.response.send_message("🚫 Solo admins.", ephemeral=True)
+    sym = coin.upper()
+    if not (sym.isascii() and sym.isalnum() and len(sym) <= COIN_SYMBOL_MAX) or sym == "HOLDERS":
+        return await interaction.response.send_message(f"❌ El símbolo tiene que tener hasta {COIN_SYMBOL_MAX} letras o números.", ephemeral=True)
+    if action.value == "add" and sym in coin_registry:
+        return await interaction.response.send_message(f"❌ **{sym}** ya existe. Usá `edit`.", ephemeral=True)
+    if action.value != "add" and sym not in coin_registry:
+        return await interaction.response.send_message(f"❌ La crypto **{sym}** no existe.", ephemeral=True)
+    if precio_inicial is not None and not (math.isfinite(precio_inicial) and precio_inicial >= 1):
+        return await interaction.response.send_message("❌ El precio inicial tiene que ser al menos 1.", ephemeral=True)
+    for nombre, valor in (("volatilidad", volatilidad), ("max_cambio", max_cambio)):
+        if valor is not None and not (math.isfinite(valor) and 0 <= valor <= 1):
+            return await interaction.response.send_message(f"❌ `{nombre}` va entre 0 y 1.", ephemeral=True)
+    if color is not None:
+        color = color if color.startswith("#") else f"#{color}"
+        try:
+            int(color[1:], 16)
+        except ValueError:
+            color = ""
+        if len(color) != 7:
+            return await interaction.response.send_message("❌ Color inválido (usá #rrggbb).", ephemeral=True)
+
+    async with balances_lock:
+        if action.value == "remove":
+            tenedores = sum(1 for h in cryptos["holders"].values() if h.get(sym, 0) > 0)
+            abiertas = sum(1 for o in order_book.orders.values() if o["sym"] == sym)
+            if tenedores or abiertas:
+                return await interaction.response.send_message(
+                    f"❌ No se puede quitar **{sym}**: la tienen {tenedores} usuario(s) y hay {abiertas} orden(es) abierta(s).",
+                    ephemeral=True
+                )
+            coin_registry.remove(sym)
+            cryptos.pop(sym, None)
+            for tenencias in cryptos["holders"].values():
+                tenencias.pop(sym, None)
+            cryptos.holders_changed()
+            msg = f"🗑️ **{sym}** quitada del mercado."
+        else:
+            coin_registry.configure(sym, precio_inicial=precio_inicial, volatilidad=volatilidad, max_cambio=max_cambio, color=color)
+            msg = f"✅ **{sym}** agregada al mercado." if action.value == "add" else f"🛠️ **{sym}** actualizada."
+        sync_coins()
+        holdings_matrix.refresh_ranking(crypto_prices())
+
+    embed = discord.Embed(title="⚙️ Registro de Cryptos", color=discord.Color.blue(), description=msg)
+    if sym in coin_registry:
+        conf = coin_registry[sym]
+        embed.add_field(name="💎 Precio", value=f"{fmt(cryptos[sym]['price'])} USD")
+        embed.add_field(name="🎲 Volatilidad", value=f"{conf['volatilidad']:.2%}")
+        embed.add_field(name="🧱 Cambio máximo", value=f"{conf['max_cambio']:.2%}")
+        embed.add_field(name="🎨 Color", value=conf["color"])
+    embed.set_footer(text=f"{len(CRYPTO_SYMBOLS)} monedas en el mercado")
+    await interaction.response.send_message(embed=embed)
+
 # ============================
 # /backup y /restore
 # ============================
-@tree.command(name="backup", description="👑 (Admin) Recibir backup de balances, niveles y cryptos por DM")
-async def backup(interaction: discord.Interaction):
+BACKUP_DIR = os.path.join(DATA_DIR, "backups")
+BACKUP_STATE_FILE = os.path.join(BACKUP_DIR, "last_backup.json")
+BACKUP_KEEP = 5
+BACKUP_FORMAT_VERSION = 1
+# El tracking de cambios para los incrementales vive solo en memoria: el estado del último
+# backup guarda en qué arranque se tomó, y si el bot se reinició desde entonces el tracking
+# no cubre lo que cambió antes del reinicio, así que el próximo backup es completo
+BACKUP_SESSION = f"{int(time.time() * 1000)}-{os.getpid()}"
+
+def take_economy_snapshot(incremental):
+    """
+    Copia consistente de todos los stores. Corre en el event loop sin ningún await,
+    así ningún comando puede escribir en el medio. Solo copia referencias y dicts chicos:
+    serializar, comprimir y calcular checksums se hace después en un hilo.
+    """
+    holders = cryptos.get("holders", {})
+    if incremental:
+        # None = el usuario se borró desde el último backup
+        copia_balances = [(uid, balances.get(uid)) for uid in balances.changed_since_backup]
+        uids_niveles = levels_store.changed_since_backup
+        uids_holdings = holdings_changed_since_backup
+    else:
+        copia_balances = list(balances.items())
+        uids_niveles = levels_store.keys()
+        uids_holdings = holders.keys()
+    snapshot = {
+        "balances": copia_balances,
+        "levels": [(uid, dict(levels_store[uid])) for uid in uids_niveles if uid in levels_store],
+        "holdings": [(uid, dict(holders[uid])) for uid in uids_holdings if uid in holders],
+        "market": {sym: dict(info) for sym, info in cryptos.items() if sym != "holders"},
+        "casino": json.loads(json.dumps(casino_bankroll)),
+        "level_price": dict(level_price_store),
+        "xp_config": dict(xp_config_store),
+        "shared_accounts": json.loads(json.dumps(shared_accounts)),
+        "cooldowns": {f"{uid}:{action}": vence for (uid, action), vence in cooldowns.expiry.items() if action in cooldowns.PERSISTENT_ACTIONS},
+        "orders": order_book.snapshot(),
+        "coins": json.loads(json.dumps(coin_registry)),
+    }
+    snapshot["price_history"] = price_history.serialize()
+    return snapshot
+
+def reset_backup_tracking():
+    balances.changed_since_backup = set()
+    levels_store.changed_since_backup = set()
+    holdings_changed_since_backup.clear()
+
+def _write_ndjson_entry(zf, name, records, manifest):
+    sha = hashlib.sha256()
+    count = 0
+    size = 0
+    with zf.open(name, "w") as entry:
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+            entry.write(line)
+            sha.update(line)
+            count += 1
+            size += len(line)
+    manifest["archivos"][name] = {"sha256": sha.hexdigest(), "registros": count, "bytes": size}
+
+def _write_bytes_entry(zf, name, data, manifest):
+    zf.writestr(name, data)
+    manifest["archivos"][name] = {"sha256": hashlib.sha256(data).hexdigest(), "bytes": len(data)}
+
+def write_backup_archive(path, snapshot, manifest):
+    """Escribe el snapshot en un .zip comprimido, entrada por entrada (corre en un hilo)."""
+    tmp = f"{path}.tmp"
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        _write_ndjson_entry(zf, "balances.ndjson", ({"u": uid, "b": b} for uid, b in snapshot["balances"]), manifest)
+        _write_ndjson_entry(zf, "levels.ndjson", ({"u": uid, **entry} for uid, entry in snapshot["levels"]), manifest)
+        _write_ndjson_entry(zf, "holdings.ndjson", ({"u": uid, "h": h} for uid, h in snapshot["holdings"]), manifest)
+        for name in ("market", "casino", "level_price", "xp_config", "shared_accounts", "cooldowns", "orders", "coins"):
+            data = json.dumps(snapshot[name], ensure_ascii=False, indent=2).encode("utf-8")
+            _write_bytes_entry(zf, f"{name}.json", data, manifest)
+        _write_bytes_entry(zf, "price_history.bin", snapshot["price_history"], manifest)
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    os.replace(tmp, path)
+    prune_backups()
+    return path
+
+def prune_backups():
+    """
+    Borra cadenas enteras (un completo y los incrementales que dependen de él), de la más
+    vieja a la más nueva, mientras haya más de BACKUP_KEEP archivos. La cadena actual nunca se
+    borra, así que todo incremental que queda tiene su base.
+    """
+    cadenas = []
+    for nombre in sorted(f for f in os.listdir(BACKUP_DIR) if f.endswith(".zip")):
+        if nombre.endswith("-completo.zip") or not cadenas:
+            cadenas.append([])
+        cadenas[-1].append(nombre)
+    total = sum(len(c) for c in cadenas)
+    while len(cadenas) > 1 and total > BACKUP_KEEP:
+        vieja = cadenas.pop(0)
+        for nombre in vieja:
+            os.remove(os.path.join(BACKUP_DIR, nombre))
+        total -= len(vieja)
+
+async def create_backup(incremental=False):
+    """Genera un backup completo o incremental y devuelve (ruta, manifest)."""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    ultimo = load_json(BACKUP_STATE_FILE, {})
+    if incremental and (not ultimo.get("id") or ultimo.get("sesion") != BACKUP_SESSION):
+        incremental = False  # sin backup base en este arranque, el primero siempre es completo
+    snapshot = take_economy_snapshot(incremental)
+    reset_backup_tracking()
+    creado = time.time()
+    backup_id = datetime.fromtimestamp(creado).strftime("%Y%m%d-%H%M%S") + f"{int(creado * 1000) % 1000:03d}"
+    manifest = {
+        "formato": BACKUP_FORMAT_VERSION,
+        "id": backup_id,
+        "tipo": "incremental" if incremental else "completo",
+        "base": ultimo.get("id") if incremental else None,
+        "creado": creado,
+        "archivos": {},
+    }
+    path = os.path.join(BACKUP_DIR, f"reco-{backup_id}-{manifest['tipo']}.zip")
+    try:
+        await asyncio.to_thread(write_backup_archive, path, snapshot, manifest)
+    except Exception:
+        # Devolver los cambios al tracking para que el próximo incremental no los pierda
+        balances.changed_since_backup.update(uid for uid, _ in snapshot["balances"])
+        levels_store.changed_since_backup.update(uid for uid, _ in snapshot["levels"])
+        holdings_changed_since_backup.update(uid for uid, _ in snapshot["holdings"])
+        raise
+    save_json(BACKUP_STATE_FILE, {"id": backup_id, "creado": creado, "tipo": manifest["tipo"], "sesion": BACKUP_SESSION})
+    return path, manifest
+
+@tree.command(name="backup", description="👑 (Admin) Recibir backup de toda la economía por DM")
+@app_commands.describe(tipo="completo o incremental (solo cambios desde el último backup)")
+@app_commands.choices(tipo=[
+    app_commands.Choice(name="📦 Completo", value="completo"),
+    app_commands.Choice(name="🧩 Incremental", value="incremental")
+])
+async def backup(interaction: discord.Interaction, tipo: str = "completo"):
     if not interaction.user.guild_permissions.administrator:
         return await interaction.response.send_message("🚫 Solo admins.", ephemeral=True)
     await interaction.response.defer(ephemeral=True)
-    with open(BALANCES_FILE, "r") as f:
-        balances_data = f.read()
-    with open(LEVELS_FILE, "r") as f:
-        levels_data = f.read()
-    with open(CRYPTO_FILE, "r") as f:
-        crypto_data = f.read()
-    import io
-    balances_file = discord.File(io.BytesIO(balances_data.encode()), filename="balances.json")
-    levels_file = discord.File(io.BytesIO(levels_data.encode()), filename="levels.json")
-    crypto_file = discord.File(io.BytesIO(crypto_data.encode()), filename="cryptos.json")
     try:
-        await interaction.user.send("📦 **Backup de la economía**")
-        await interaction.user.send(file=balances_file)
-        await interaction.user.send(file=levels_file)
-        await interaction.user.send(file=crypto_file)
+        path, manifest = await create_backup(incremental=(tipo == "incremental"))
+    except Exception as e:
+        return await interaction.followup.send(f"❌ No se pudo generar el backup: {e}", ephemeral=True)
+    archivos = manifest["archivos"]
+    resumen = (
+        f"📦 **Backup {manifest['tipo']}** `{manifest['id']}`"
+        + (f" (base `{manifest['base']}`)" if manifest["base"] else "")
+        + f"\n💰 Balances: {archivos['balances.ndjson']['registros']} • ⭐ Niveles: {archivos['levels.ndjson']['registros']}"
+        + f" • 💎 Holders: {archivos['holdings.ndjson']['registros']}"
+        + f"\n🗜️ Tamaño: {fmt(os.path.getsize(path))} bytes"
+    )
+    try:
+        await interaction.user.send(resumen, file=discord.File(path, filename=os.path.basename(path)))
         await interaction.followup.send("✅ Backup enviado por DM.", ephemeral=True)
     except:
         await interaction.followup.send("❌ No puedo enviarte DM. Habilitá mensajes privados.", ephemeral=True)
 
-@tree.command(name="restore", description="👑 (Admin) Restaurar balances desde un archivo backup")
+RESTORE_MAX_BYTES = 100 * 1024 * 1024
+
+def _valid_uid(uid):
+    return isinstance(uid, str) and uid.isdigit()
+
+def _valid_amount(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def _valid_symbol(sym):
+    return isinstance(sym, str) and sym.isascii() and sym.isalnum() and sym.isupper() and len(sym) <= COIN_SYMBOL_MAX
+
+def _require(condicion, mensaje):
+    if not condicion:
+        raise ValueError(mensaje)
+
+def _validate_market(data):
+    _require(isinstance(data, dict), "market.json: se esperaba un objeto")
+    for sym, info in data.items():
+        _require(_valid_symbol(sym) and isinstance(info, dict), f"market.json: entrada inválida {sym!r}")
+        _require(_valid_amount(info.get("price")) and info["price"] > 0, f"market.json: precio inválido para {sym}")
+        _require(_valid_amount(info.get("volumen_24h", 0)), f"market.json: volumen inválido para {sym}")
+
+def _validate_coins(data):
+    _require(isinstance(data, dict) and data, "coins.json: se esperaba un objeto con al menos una moneda")
+    for sym, conf in data.items():
+        _require(_valid_symbol(sym) and isinstance(conf, dict), f"coins.json: entrada inválida {sym!r}")
+        _require(_valid_amount(conf.get("precio_inicial")) and conf["precio_inicial"] >= 1, f"coins.json: precio_inicial inválido para {sym}")
+        for campo in ("volatilidad", "max_cambio"):
+            _require(_valid_amount(conf.get(campo)) and 0 <= conf[campo] <= 1, f"coins.json: {campo} inválido para {sym}")
+        color = conf.get("color")
+        _require(isinstance(color, str) and len(color) == 7 and color[0] == "#" and all(c in "0123456789abcdefABCDEF" for c in color[1:]), f"coins.json: color inválido para {sym}")
+
+def _validate_orders(data, symbols):
+    _require(isinstance(data, dict) and isinstance(data.get("orders", []), list), "orders.json: formato inválido")
+    _require(isinstance(data.get("next_id", 1), int) and data.get("next_id", 1) >= 1, "orders.json: next_id inválido")
+    ids = set()
+    for orden in data.get("orders", []):
+        _require(isinstance(orden, dict), "orders.json: orden inválida")
+        order_id = orden.get("id")
+        _require(isinstance(order_id, int) and not isinstance(order_id, bool) and order_id >= 1 and order_id not in ids, f"orders.json: id inválido {order_id!r}")
+        ids.add(order_id)
+        _require(_valid_uid(orden.get("uid")), f"orders.json: usuario inválido en la orden #{order_id}")
+        _require(orden.get("sym") in symbols, f"orders.json: moneda desconocida en la orden #{order_id}")
+        _require(orden.get("tipo") in ORDER_TYPES, f"orders.json: tipo inválido en la orden #{order_id}")
+        for campo in ("precio", "monto", "creada"):
+            _require(_valid_amount(orden.get(campo)) and orden[campo] > 0, f"orders.json: {campo} inválido en la orden #{order_id}")
+
+def _validate_casino(data):
+    _require(isinstance(data, dict) and _valid_amount(data.get("stock", CASINO_STOCK_INICIAL)), "casino.json: formato inválido")
+    juegos = data.get("juegos", {})
+    _require(isinstance(juegos, dict) and all(isinstance(j, dict) and all(_valid_amount(v) for v in j.values()) for j in juegos.values()), "casino.json: totales por juego inválidos")
+
+def _validate_level_price(data):
+    _require(isinstance(data, dict) and _valid_amount(data.get("price")) and data["price"] > 0, "level_price.json: precio inválido")
+
+def _validate_xp_config(data):
+    _require(isinstance(data, dict) and all(_valid_amount(v) and v >= 0 for v in data.values()), "xp_config.json: formato inválido")
+
+def _validate_shared_accounts(data):
+    _require(isinstance(data, dict), "shared_accounts.json: se esperaba un objeto")
+
+def _validate_cooldowns(data):
+    _require(isinstance(data, dict), "cooldowns.json: se esperaba un objeto")
+    for key, vence in data.items():
+        uid, sep, action = key.partition(":")
+        _require(_valid_uid(uid) and sep and action and _valid_amount(vence), f"cooldowns.json: entrada inválida {key!r}")
+
+RESTORE_VALIDATORS = {
+    "market": _validate_market,
+    "casino": _validate_casino,
+    "level_price": _validate_level_price,
+    "xp_config": _validate_xp_config,
+    "shared_accounts": _validate_shared_accounts,
+    "cooldowns": _validate_cooldowns,
+    "coins": _validate_coins,
+}
+
+def _iter_verified_ndjson(zf, name, info):
+    """Parsea una entrada NDJSON línea por línea mientras calcula su checksum."""
+    sha = hashlib.sha256()
+    with zf.open(name) as entry:
+        for numero, line in enumerate(entry, start=1):
+            sha.update(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError(f"{name}: línea {numero} no es JSON válido")
+            if not isinstance(record, dict):
+                raise ValueError(f"{name}: línea {numero} no es un objeto")
+            yield record
+    if sha.hexdigest() != info.get("sha256"):
+        raise ValueError(f"{name}: checksum inválido")
+
+def _read_verified(zf, name, info):
+    if not isinstance(info, dict):
+        raise ValueError(f"{name}: entrada inválida en el manifest")
+    data = zf.read(name)
+    if hashlib.sha256(data).hexdigest() != info.get("sha256"):
+        raise ValueError(f"{name}: checksum inválido")
+    return data
+
+def stage_restore(path):
+    """
+    Valida un backup .zip y lo carga en estructuras nuevas (corre en un hilo).
+    No toca ningún store: si algo falla, la economía en memoria queda intacta.
+    """
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        if not isinstance(manifest, dict):
+            raise ValueError("manifest.json: se esperaba un objeto")
+        if manifest.get("formato") != BACKUP_FORMAT_VERSION:
+            raise ValueError(f"formato de backup no soportado: {manifest.get('formato')}")
+        archivos = manifest.get("archivos", {})
+        if not isinstance(archivos, dict) or not all(isinstance(info, dict) for info in archivos.values()):
+            raise ValueError("manifest.json: lista de archivos inválida")
+        faltantes = {"balances.ndjson", "levels.ndjson", "holdings.ndjson", "market.json"} - archivos.keys()
+        if faltantes:
+            raise ValueError(f"faltan entradas: {', '.join(sorted(faltantes))}")
+        incremental = manifest.get("tipo") == "incremental"
+        if incremental:
+            # Un incremental solo tiene sentido sobre el backup del que salió
+            actual = load_json(BACKUP_STATE_FILE, {}).get("id")
+            if not manifest.get("base") or manifest.get("base") != actual:
+                raise ValueError(
+                    f"el incremental se hizo sobre `{manifest.get('base')}`, pero el último backup aplicado o generado es `{actual}`"
+                )
+
+        staged = {"manifest": manifest, "balances": {}, "levels": {}, "holdings": {}}
+        for record in _iter_verified_ndjson(zf, "balances.ndjson", archivos["balances.ndjson"]):
+            uid, b = record.get("u"), record.get("b")
+            if not _valid_uid(uid) or not (_valid_amount(b) or (incremental and b is None)):
+                raise ValueError(f"balances.ndjson: registro inválido {record}")
+            staged["balances"][uid] = b
+        for record in _iter_verified_ndjson(zf, "levels.ndjson", archivos["levels.ndjson"]):
+            uid = record.pop("u", None)
+            if not _valid_uid(uid) or not _valid_amount(record.get("xp", 0)) or record.get("xp", 0) < 0:
+                raise ValueError(f"levels.ndjson: registro inválido para {uid}")
+            staged["levels"][uid] = record
+        for record in _iter_verified_ndjson(zf, "holdings.ndjson", archivos["holdings.ndjson"]):
+            uid, h = record.get("u"), record.get("h")
+            if not _valid_uid(uid) or not isinstance(h, dict) or not all(_valid_symbol(sym) and _valid_amount(v) and v >= 0 for sym, v in h.items()):
+                raise ValueError(f"holdings.ndjson: registro inválido para {uid}")
+            staged["holdings"][uid] = h
+        for name in ("market", "casino", "level_price", "xp_config", "shared_accounts", "cooldowns", "orders", "coins"):
+            entry = f"{name}.json"
+            if entry in archivos:
+                staged[name] = json.loads(_read_verified(zf, entry, archivos[entry]))
+        for name, validar in RESTORE_VALIDATORS.items():
+            if name in staged:
+                validar(staged[name])
+        if "orders" in staged:
+            # Las órdenes tienen que apuntar a monedas que existan después de restaurar
+            _validate_orders(staged["orders"], staged.get("coins", coin_registry).keys())
+        if "price_history.bin" in archivos:
+            staged["price_history"] = PriceHistoryStore.parse(_read_verified(zf, "price_history.bin", archivos["price_history.bin"]))
+    return staged
+
+def apply_restore(staged):
+    """
+    Cambia todos los stores por los datos ya validados. Es síncrono (sin awaits), así que
+    para el resto del bot el cambio es atómico. stage_restore validó la forma de cada entrada,
+    así que nada de lo que sigue puede fallar a mitad de camino. Quien llama debe hacer flush enseguida.
+    """
+    incremental = staged["manifest"].get("tipo") == "incremental"
+    journal.suspended = True
+    try:
+        if incremental:
+            for uid, b in staged["balances"].items():
+                if b is None:
+                    balances.pop(uid, None)
+                else:
+                    balances[uid] = b
+            levels_store.update(staged["levels"])
+            cryptos.setdefault("holders", {}).update(staged["holdings"])
+        else:
+            balances.swap_contents(staged["balances"])
+            dict.clear(levels_store)
+            dict.update(levels_store, staged["levels"])
+            cryptos["holders"] = staged["holdings"]
+        levels_store.changed_since_backup.update(staged["levels"].keys())
+        holdings_changed_since_backup.update(staged["holdings"].keys())
+        for sym, info in staged.get("market", {}).items():
+            cryptos[sym] = info
+        if "casino" in staged:
+            casino_bankroll.save(staged["casino"])
+        if "level_price" in staged:
+            level_price_store.save(staged["level_price"])
+        if "xp_config" in staged:
+            xp_config_store.save(staged["xp_config"])
+        if "shared_accounts" in staged:
+            shared_accounts.save(staged["shared_accounts"])
+        if "cooldowns" in staged:
+            cooldowns.replace(staged["cooldowns"])
+        if "orders" in staged:
+            order_book.replace(staged["orders"])
+        if "coins" in staged:
+            coin_registry.replace(staged["coins"])
+        if "price_history" in staged:
+            price_history.series, price_history.candles = staged["price_history"]
+            price_history.dirty = True
+    finally:
+        journal.suspended = False
+    levels_store.save()
+    # El incremental actualiza holders en el lugar y sin pasar por set_holding
+    cryptos.holders_changed()
+    economy_stats.rebuild()
+    sync_coins()
+    holdings_matrix.refresh_ranking(crypto_prices())
+
+@tree.command(name="restore", description="👑 (Admin) Restaurar la economía desde un backup .zip")
 async def restore(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         return await interaction.response.send_message("🚫 Solo admins.", ephemeral=True)
     await interaction.response.defer(ephemeral=True)
-    await interaction.followup.send("📤 **Subí el archivo `balances.json`** que quieras restaurar.\n*(Tenés 60 segundos para subirlo)*", ephemeral=True)
+    await interaction.followup.send("📤 **Subí el archivo `.zip`** generado por `/backup`.\n*(Tenés 60 segundos para subirlo)*", ephemeral=True)
     def check(msg):
         return msg.author == interaction.user and len(msg.attachments) > 0
     try:
         msg = await bot.wait_for("message", timeout=60, check=check)
-        archivo = msg.attachments[0]
-        if not archivo.filename.endswith(".json"):
-            return await interaction.followup.send("❌ Solo archivos .json", ephemeral=True)
-        contenido = await archivo.read()
-        import json
-        try:
-            json.loads(contenido)
-        except:
-            return await interaction.followup.send("❌ El archivo no es un JSON válido.", ephemeral=True)
-        with open(BALANCES_FILE, "wb") as f:
-            f.write(contenido)
-        global balances
-        balances = load_json(BALANCES_FILE, {})
-        await interaction.followup.send(f"✅ Balances restaurados correctamente.\n📊 Total de usuarios: {len(balances)}", ephemeral=True)
     except TimeoutError:
-        await interaction.followup.send("❌ Tiempo agotado. Volvé a intentarlo.", ephemeral=True)
+        return await interaction.followup.send("❌ Tiempo agotado. Volvé a intentarlo.", ephemeral=True)
+    archivo = msg.attachments[0]
+    if not archivo.filename.endswith(".zip"):
+        return await interaction.followup.send("❌ Solo archivos .zip generados por /backup", ephemeral=True)
+    if archivo.size > RESTORE_MAX_BYTES:
+        return await interaction.followup.send("❌ El archivo es demasiado grande.", ephemeral=True)
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    tmp = os.path.join(BACKUP_DIR, f"restore-{msg.id}.zip.tmp")
+    try:
+        await archivo.save(tmp)
+        staged = await asyncio.to_thread(stage_restore, tmp)
+    except (ValueError, KeyError, AttributeError, TypeError, struct.error, zipfile.BadZipFile) as e:
+        return await interaction.followup.send(f"❌ Backup inválido: {e}", ephemeral=True)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    # Pausa breve: los comandos que usan balances_lock esperan mientras se cambian los stores
+    async with balances_lock:
+        apply_restore(staged)
+        await flush_stores()
+    manifest = staged["manifest"]
+    # La economía en memoria es ahora la de este backup: es la base del próximo incremental
+    reset_backup_tracking()
+    save_json(BACKUP_STATE_FILE, {"id": manifest.get("id"), "creado": manifest.get("creado"), "tipo": manifest.get("tipo"), "restaurado": time.time(), "sesion": BACKUP_SESSION})
+    await interaction.followup.send(
+        f"✅ Backup {manifest.get('tipo')} `{manifest.get('id')}` restaurado.\n"
+        f"💰 Balances: {len(staged['balances'])} • ⭐ Niveles: {len(staged['levels'])} • 💎 Holders: {len(staged['holdings'])}",
+        ephemeral=True
+    )
 
 # ============================
 # /message
@@ -1407,14 +4100,16 @@ async def cobrarimpuestos(interaction: discord.Interaction):
         
         # Restar 2500 (puede quedar en negativo)
         balances[uid] -= 2500
+        log_transaction(uid, -2500, "🏛️ Impuestos")
         total_cobrado += 2500
         cobrados += 1
     
     # Guardar cambios
-    save_json(BALANCES_FILE, balances)
+    balances.save()
     
     # Dar el dinero al recaudador
     await safe_add(TAX_COLLECTOR_ID, total_cobrado)
+    log_transaction(TAX_COLLECTOR_ID, total_cobrado, "🏛️ Recaudación de impuestos")
     
     embed = discord.Embed(title="🏛️ Impuestos Cobrados", description=f"Se cobraron **{fmt(total_cobrado)} USD** a **{cobrados}** ciudadanos.", color=discord.Color.orange())
     embed.add_field(name="💰 Recibiste", value=f"{fmt(total_cobrado)} USD", inline=True)
@@ -1436,6 +4131,8 @@ class FindView(discord.ui.View):
         return str(interaction.user.id) == self.uid
 
     async def on_timeout(self):
+        casino_bankroll.record("find", self.bet, 0)
+        log_transaction(self.uid, -self.bet, "🥤 Find")
         try:
             await self.message.edit(content="⏰ Tiempo agotado.", view=None)
         except:
@@ -1468,11 +4165,13 @@ class FindView(discord.ui.View):
         if acierto:
             ganancia = self.bet * 3
             await safe_add(self.uid, ganancia)
-            update_casino_stock(-ganancia)  # Casino paga
+            casino_bankroll.record("find", self.bet, ganancia)
+            log_transaction(self.uid, ganancia - self.bet, "🥤 Find")
             note = f"🎉 **¡Encontraste la piedra!** Ganaste **{fmt(ganancia)} USD**"
             color = 0x2ecc71
         else:
-            update_casino_stock(self.bet)  # Casino gana
+            casino_bankroll.record("find", self.bet, 0)
+            log_transaction(self.uid, -self.bet, "🥤 Find")
             note = f"💸 Elegiste el vaso {chosen}, pero la piedra estaba en el {self.correct}. Perdiste la apuesta."
             color = 0xe74c3c
         embed = discord.Embed(title="🥤 Resultado — Encuentra la Piedra", description=note, color=color)
@@ -1504,8 +4203,7 @@ async def find(interaction: discord.Interaction, bet: str):
     bet_val = int(parsed)
     
     # Límite de apuesta por nivel
-    niveles_data = load_levels()
-    user_xp = niveles_data.get(uid, {}).get("xp", 0)
+    user_xp = levels_store.get_xp(uid)
     user_level = level_from_xp(user_xp)
     
     if user_level <= 199:
@@ -1533,7 +4231,7 @@ async def find(interaction: discord.Interaction, bet: str):
         if saldo_antes < bet_val:
             return await interaction.followup.send(f"❌ No tenés saldo suficiente. Tenés {fmt(saldo_antes)} USD.", ephemeral=True)
         balances[uid] -= bet_val
-        save_json(BALANCES_FILE, balances)
+        balances.save()
     
     correct = random.randint(1, 5)
     embed = discord.Embed(title="🥤 Encuentra la Piedra", description="Una piedra fue escondida bajo **1 de 5 vasos**.\nElegí con cuidado...", color=0x3498db)
@@ -1613,8 +4311,7 @@ async def roulette(interaction: discord.Interaction, bet: str, choice: str):
     uid = str(interaction.user.id)
     
     # Límite de apuesta por nivel
-    niveles_data = load_levels()
-    user_xp = niveles_data.get(uid, {}).get("xp", 0)
+    user_xp = levels_store.get_xp(uid)
     user_level = level_from_xp(user_xp)
     
     if user_level <= 199:
@@ -1642,7 +4339,7 @@ async def roulette(interaction: discord.Interaction, bet: str, choice: str):
         if saldo_antes < bet_val:
             return await interaction.response.send_message(f"❌ No tenés saldo suficiente. Tenés {fmt(saldo_antes)} USD.", ephemeral=True)
         balances[uid] -= bet_val
-        save_json(BALANCES_FILE, balances)
+        balances.save()
     
     # Calcular resultado
     wheel = random.randint(0, 36)
@@ -1666,10 +4363,12 @@ async def roulette(interaction: discord.Interaction, bet: str, choice: str):
     
     if win > 0:
         await safe_add(uid, win)
-        update_casino_stock(-win)
+        casino_bankroll.record("roulette", bet_val, win)
+        log_transaction(uid, win - bet_val, "🎡 Ruleta")
         await interaction.response.send_message(f"🎡 Resultado: {wheel} ({color}). Ganaste **{fmt(int(win))} USD**")
     else:
-        update_casino_stock(bet_val)
+        casino_bankroll.record("roulette", bet_val, 0)
+        log_transaction(uid, -bet_val, "🎡 Ruleta")
         await interaction.response.send_message(f"🎡 Resultado: {wheel} ({color}). Perdiste **{fmt(int(bet_val))} USD**")
 # ---------- Slots ----------
 @tree.command(name="slots", description="Jugá a las slots. Mínimo 1 USD")
@@ -1687,8 +4386,7 @@ async def slots(interaction: discord.Interaction, bet: str):
     uid = str(interaction.user.id)
     
     # Límite de apuesta por nivel
-    niveles_data = load_levels()
-    user_xp = niveles_data.get(uid, {}).get("xp", 0)
+    user_xp = levels_store.get_xp(uid)
     user_level = level_from_xp(user_xp)
     
     if user_level <= 199:
@@ -1716,7 +4414,7 @@ async def slots(interaction: discord.Interaction, bet: str):
         if saldo_antes < bet_val:
             return await interaction.response.send_message(f"❌ No tenés saldo suficiente. Tenés {fmt(saldo_antes)} USD.", ephemeral=True)
         balances[uid] -= bet_val
-        save_json(BALANCES_FILE, balances)
+        balances.save()
     
     # Jugar slots
     icons = ["🍒", "🍋", "🍇", "🔔", "💎", "7️⃣"]
@@ -1729,10 +4427,12 @@ async def slots(interaction: discord.Interaction, bet: str):
     
     if win > 0:
         await safe_add(uid, win)
-        update_casino_stock(-win)  # Casino paga
+        casino_bankroll.record("slots", bet_val, win)
+        log_transaction(uid, win - bet_val, "🎰 Slots")
         await interaction.response.send_message(f"🎰 {' | '.join(res)} — Ganaste **{fmt(int(win))} USD**")
     else:
-        update_casino_stock(bet_val)  # Casino gana
+        casino_bankroll.record("slots", bet_val, 0)
+        log_transaction(uid, -bet_val, "🎰 Slots")
         await interaction.response.send_message(f"🎰 {' | '.join(res)} — Perdiste **{fmt(int(bet_val))} USD**")
 # ==========================
 # BLACKJACK
@@ -1814,7 +4514,9 @@ class BlackjackView(discord.ui.View):
         await self.resolve(interaction, busted=False)
 
     async def on_timeout(self):
-        blackjack_sessions.pop(self.uid, None)
+        if blackjack_sessions.pop(self.uid, None) is not None:
+            casino_bankroll.record("blackjack", self.session["bet"], 0)
+            log_transaction(self.uid, -self.session["bet"], "🃏 Blackjack")
         try:
             await self.message.edit(content="⏰ Tiempo agotado. Mano finalizada.", view=None)
         except:
@@ -1873,6 +4575,8 @@ class BlackjackView(discord.ui.View):
                 note = "Perdiste contra el dealer."
         if payout > 0:
             await safe_add(uid, payout)
+        casino_bankroll.record("blackjack", bet, payout)
+        log_transaction(uid, payout - bet, "🃏 Blackjack")
         blackjack_sessions.pop(uid, None)
         embed = discord.Embed(title="🃏 Blackjack — Resultado", color=0x2F3136)
         embed.add_field(name="Jugador", value=f"{' '.join(session['player'])} → {pval}", inline=True)
@@ -1914,8 +4618,7 @@ async def blackjack(interaction: discord.Interaction, bet: str):
     bet_val = int(parsed)
     
     # Límite de apuesta por nivel
-    niveles_data = load_levels()
-    user_xp = niveles_data.get(uid, {}).get("xp", 0)
+    user_xp = levels_store.get_xp(uid)
     user_level = level_from_xp(user_xp)
     
     if user_level <= 199:
@@ -1943,7 +4646,7 @@ async def blackjack(interaction: discord.Interaction, bet: str):
         if saldo_antes < bet_val:
             return await interaction.response.send_message(f"❌ No tenés saldo suficiente. Tenés {fmt(saldo_antes)} USD.", ephemeral=True)
         balances[uid] -= bet_val
-        save_json(BALANCES_FILE, balances)
+        balances.save()
     
     # Preparar juego
     deck = DECK.copy()
@@ -1979,10 +4682,118 @@ async def blackjack(interaction: discord.Interaction, bet: str):
 # ============================
 # LEADERBOARDS
 # ============================
+MEMBER_NAME_TTL = 10 * 60
+MEMBER_GONE_TTL = 60 * 60
+QUERY_MEMBERS_BATCH = 100
+
+class MemberNameCache:
+    """
+    Nombres de los miembros para los leaderboards. Primero se mira el caché del gateway
+    (get_member); lo que falta se resuelve en bloque: un guild.chunk() si el servidor todavía
+    no se descargó y, si no alcanza, query_members de a 100 IDs. Los que no aparecen quedan
+    marcados como fuera del servidor (caché negativo) para no volver a buscarlos en cada consulta.
+    """
+
+    MISSING = object()
+
+    def __init__(self):
+        self.entries: dict[str, tuple[Optional[str], float]] = {}
+        self.retry_chunk_at = 0.0
+        self.swept = False
+
+    def lookup(self, guild, uid, now=None):
+        """Nombre, None si se fue del servidor o MISSING si no se sabe."""
+        member = guild.get_member(int(uid)) if guild else None
+        if member:
+            return member.display_name
+        entry = self.entries.get(uid)
+        now = time.monotonic() if now is None else now
+        if entry is None or entry[1] <= now:
+            return self.MISSING
+        return entry[0]
+
+    def store(self, uid, nombre, now=None):
+        now = time.monotonic() if now is None else now
+        self.entries[uid] = (nombre, now + (MEMBER_NAME_TTL if nombre is not None else MEMBER_GONE_TTL))
+        # Los que se fueron no ocupan lugares en el ranking de monedas
+        if nombre is None:
+            balance_rank.exclude(uid)
+        else:
+            balance_rank.include(uid, balances.get(uid, 0))
+
+    def forget(self, uid):
+        self.entries.pop(uid, None)
+
+    async def _chunk(self, guild, now):
+        if guild.chunked or now < self.retry_chunk_at:
+            return
+        try:
+            await guild.chunk()
+        except (asyncio.TimeoutError, discord.ClientException) as e:
+            print(f"No se pudo descargar la lista de miembros: {e}")
+            self.retry_chunk_at = now + MEMBER_NAME_TTL
+
+    async def sweep(self, guild):
+        """
+        Una vez, con la lista de miembros descargada: marca como fuera del servidor a todos los
+        del ranking de monedas que ya no están. Después lo mantienen on_member_join/remove.
+        """
+        if self.swept or guild is None:
+            return
+        now = time.monotonic()
+        await self._chunk(guild, now)
+        if not guild.chunked:
+            return
+        for uid in list(balance_rank.keys):
+            if guild.get_member(int(uid)) is None:
+                self.store(uid, None, now)
+        self.swept = True
+
+    async def resolve(self, guild, uids):
+        """Resuelve todos los uids de una vez; devuelve {uid: nombre o None si se fue}."""
+        now = time.monotonic()
+        faltan = [uid for uid in uids if self.lookup(guild, uid, now) is self.MISSING]
+        if faltan and not guild.chunked:
+            await self._chunk(guild, now)
+            faltan = [uid for uid in faltan if self.lookup(guild, uid) is self.MISSING]
+        if faltan and guild.chunked:
+            # Con la lista completa en caché, el que no está se fue del servidor
+            for uid in faltan:
+                self.store(uid, None, now)
+            faltan = []
+        for i in range(0, len(faltan), QUERY_MEMBERS_BATCH):
+            lote = faltan[i:i + QUERY_MEMBERS_BATCH]
+            try:
+                members = await guild.query_members(user_ids=[int(uid) for uid in lote], limit=QUERY_MEMBERS_BATCH, cache=True)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                print(f"Error buscando miembros: {e}")
+                break
+            encontrados = {str(m.id): m.display_name for m in members}
+            for uid in lote:
+                self.store(uid, encontrados.get(uid), now)
+        resultado = {}
+        for uid in uids:
+            nombre = self.lookup(guild, uid)
+            resultado[uid] = None if nombre is self.MISSING else nombre
+        return resultado
+
+member_names = MemberNameCache()
+
+@bot.event
+async def on_member_join(member):
+    uid = str(member.id)
+    member_names.forget(uid)
+    balance_rank.include(uid, balances.get(uid, 0))
+
+@bot.event
+async def on_member_remove(member):
+    member_names.store(str(member.id), None)
+
 @tree.command(name="leaderboard", description="📊 Ver ranking de monedas o cryptos")
 @app_commands.describe(tipo="coins (monedas) o crypto (criptomonedas)")
 @app_commands.choices(tipo=[
     app_commands.Choice(name="💰 Monedas", value="coins"),
+    app_commands.Choice(name="📍 Monedas (cerca mío)", value="cerca"),
     app_commands.Choice(name="💎 Cryptos", value="crypto")
 ])
 async def leaderboard(interaction: discord.Interaction, tipo: str = "coins"):
@@ -1991,50 +4802,188 @@ async def leaderboard(interaction: discord.Interaction, tipo: str = "coins"):
     await interaction.response.defer()
     if tipo == "coins":
         await leaderboard_coins(interaction)
+    elif tipo == "cerca":
+        await leaderboard_coins_cerca(interaction)
     else:
         await leaderboard_crypto(interaction)
 
-async def leaderboard_coins(interaction: discord.Interaction):
-    balances_data = load_json(BALANCES_FILE, {})
-    if not balances_data:
-        return await interaction.followup.send("😔 No hay datos de monedas todavía.", ephemeral=True)
-    usuarios_validos = []
-    for uid, money in balances_data.items():
-        if money <= 0:
-            continue
-        try:
-            if str(uid).isdigit():
-                user = interaction.guild.get_member(int(uid))
-                if user:
-                    usuarios_validos.append((uid, money, user.display_name))
-                else:
-                    try:
-                        user = await interaction.guild.fetch_member(int(uid))
-                        if user:
-                            usuarios_validos.append((uid, money, user.display_name))
-                    except:
-                        continue
-        except:
-            continue
-    if not usuarios_validos:
-        return await interaction.followup.send("😔 No hay usuarios con monedas en el servidor.", ephemeral=True)
-    usuarios_validos.sort(key=lambda x: x[1], reverse=True)
-    items_por_pagina = 15
-    paginas = []
-    for i in range(0, len(usuarios_validos), items_por_pagina):
-        paginas.append(usuarios_validos[i:i + items_por_pagina])
-    total_dinero = sum(money for _, money, _ in usuarios_validos)
-    if len(paginas) == 1:
-        embed = crear_embed_coins_simple(paginas[0], 1, 1, len(usuarios_validos), total_dinero)
+LEADERBOARD_POR_PAGINA = {"coins": 15, "crypto": 10, "levels": 15}
+LEADERBOARD_SNAPSHOT_TTL = 60
+
+def nombre_usuario(guild, uid):
+    nombre = member_names.lookup(guild, uid)
+    if isinstance(nombre, str):
+        return nombre
+    return levels_store.get(uid, {}).get("nombre") or f"Usuario {uid[:4]}"
+
+async def filas_coins(guild, inicio, cantidad):
+    while True:
+        filas = balance_rank.range(inicio, cantidad)
+        await member_names.resolve(guild, [uid for uid, _ in filas])
+        # Si alguno resultó ser ex-miembro ya salió del ranking: la página se corrió, se vuelve a leer
+        if not any(uid in balance_rank.excluded for uid, _ in filas):
+            return [(uid, money, nombre_usuario(guild, uid)) for uid, money in filas]
+
+async def construir_snapshot_crypto(guild):
+    # El orden ya viene calculado por valor en USD (LeaderboardSnapshots.get lo deja al día)
+    usuarios_crypto = [(uid, valor) for uid, valor in holdings_matrix.ranking if str(uid).isdigit()]
+    await member_names.resolve(guild, [uid for uid, _ in usuarios_crypto])
+    return usuarios_crypto, {"valor_total": sum(valor for _, valor in usuarios_crypto)}
+
+async def construir_snapshot_levels(guild):
+    uids = list(levels_store.keys())
+    xps = [levels_store[uid].get("xp", 0) for uid in uids]
+    con_nivel = [(uid, int(level), xp) for uid, xp, level in zip(uids, xps, levels_from_xp_batch(xps)) if level > 0 and str(uid).isdigit()]
+    nombres = await member_names.resolve(guild, [uid for uid, _, _ in con_nivel])
+    usuarios_niveles = [fila for fila in con_nivel if nombres[fila[0]] is not None]
+    usuarios_niveles.sort(key=lambda x: x[1], reverse=True)
+    total_niveles = sum(level for _, level, _ in usuarios_niveles)
+    stats = {
+        "total_niveles": total_niveles,
+        "nivel_mas_alto": usuarios_niveles[0][1] if usuarios_niveles else 0,
+        "promedio_nivel": total_niveles // len(usuarios_niveles) if usuarios_niveles else 0,
+    }
+    return usuarios_niveles, stats
+
+class LeaderboardSnapshots:
+    """
+    Último ranking calculado de cada tablero que no sale del índice (crypto y niveles).
+    Hay uno solo por tablero, compartido por todos los mensajes abiertos, y se recalcula
+    cuando tiene más de LEADERBOARD_SNAPSHOT_TTL segundos (niveles; la versión es la hora en
+    que se armó) o cuando hay un ranking de tenencias nuevo (crypto; la versión es la del ranking).
+    """
+
+    BUILDERS = {"crypto": construir_snapshot_crypto, "levels": construir_snapshot_levels}
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, guild, board):
+        snap = self.data.get(board)
+        if board == "crypto":
+            # Se recalcula solo si hay un ranking nuevo (un tick, o trades desde el último)
+            holdings_matrix.current_ranking(crypto_prices())
+            vencido = snap is None or snap["version"] != holdings_matrix.ranking_version
+        else:
+            vencido = snap is None or time.time() - snap["version"] >= LEADERBOARD_SNAPSHOT_TTL
+        if vencido:
+            # La versión se toma antes de armarlo: si el ranking cambia durante los awaits,
+            # el snapshot queda con la vieja y el próximo get lo rearma
+            version = holdings_matrix.ranking_version if board == "crypto" else int(time.time())
+            filas, stats = await self.BUILDERS[board](guild)
+            snap = self.data[board] = {"version": version, "filas": filas, "stats": stats}
+        return snap
+
+leaderboard_snapshots = LeaderboardSnapshots()
+
+async def render_leaderboard(guild, board, pagina):
+    """Arma una página al momento; devuelve (embed, página, total_páginas, versión)."""
+    por_pagina = LEADERBOARD_POR_PAGINA[board]
+    if board == "coins":
+        await member_names.sweep(guild)
+        snap = None
+        total = len(balance_rank)
+        version = 0
+    else:
+        snap = await leaderboard_snapshots.get(guild, board)
+        total = len(snap["filas"])
+        version = snap["version"]
+    total_paginas = max(1, (total + por_pagina - 1) // por_pagina)
+    pagina = max(0, min(pagina, total_paginas - 1))
+    inicio = pagina * por_pagina
+    if board == "coins":
+        usuarios = await filas_coins(guild, inicio, por_pagina)
+        embed = crear_embed_coins_simple(usuarios, pagina + 1, total_paginas, total, economy_stats.money_supply)
+    elif board == "crypto":
+        usuarios = [(uid, nombre_usuario(guild, uid), valor) for uid, valor in snap["filas"][inicio:inicio + por_pagina]]
+        embed = crear_embed_crypto_simple(usuarios, pagina + 1, total_paginas, total, snap["stats"]["valor_total"])
+    else:
+        usuarios = [(uid, level, xp, nombre_usuario(guild, uid)) for uid, level, xp in snap["filas"][inicio:inicio + por_pagina]]
+        stats = snap["stats"]
+        embed = crear_embed_levelboard(usuarios, pagina + 1, total_paginas, total, stats["total_niveles"], stats["nivel_mas_alto"], stats["promedio_nivel"])
+    return embed, pagina, total_paginas, version
+
+class LeaderboardButton(discord.ui.DynamicItem[discord.ui.Button], template=r"lb:(?P<board>coins|crypto|levels):(?P<accion>\w+):(?P<pagina>\d+):(?P<version>\d+)"):
+    """
+    Botón de paginado sin estado: el tablero, la página destino y la versión del snapshot van
+    en el custom_id, así el botón sigue andando después de un reinicio y no hay vistas en memoria.
+    """
+
+    ESTILOS = {
+        "primera": ("⏪", discord.ButtonStyle.secondary),
+        "anterior": ("◀", discord.ButtonStyle.primary),
+        "pagina": (None, discord.ButtonStyle.gray),
+        "siguiente": ("▶", discord.ButtonStyle.primary),
+        "ultima": ("⏩", discord.ButtonStyle.secondary),
+    }
+
+    def __init__(self, board, accion, pagina, version, label=None, disabled=False):
+        emoji_label, style = self.ESTILOS.get(accion, ("?", discord.ButtonStyle.gray))
+        super().__init__(discord.ui.Button(
+            label=label or emoji_label,
+            style=style,
+            disabled=disabled,
+            custom_id=f"lb:{board}:{accion}:{pagina}:{version}",
+        ))
+        self.board = board
+        self.pagina = pagina
+        self.version = version
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["board"], match["accion"], int(match["pagina"]), int(match["version"]))
+
+    async def callback(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        embed, pagina, total_paginas, version = await render_leaderboard(interaction.guild, self.board, self.pagina)
+        if self.version and version != self.version:
+            embed.set_footer(text=f"{embed.footer.text} • 🔄 Ranking actualizado")
+        await interaction.edit_original_response(embed=embed, view=leaderboard_view(self.board, pagina, total_paginas, version))
+
+def leaderboard_view(board, pagina, total_paginas, version):
+    view = discord.ui.View(timeout=None)
+    ultima = total_paginas - 1
+    view.add_item(LeaderboardButton(board, "primera", 0, version, disabled=pagina == 0))
+    view.add_item(LeaderboardButton(board, "anterior", max(0, pagina - 1), version, disabled=pagina == 0))
+    view.add_item(LeaderboardButton(board, "pagina", pagina, version, label=f"Página {pagina + 1}/{total_paginas}", disabled=True))
+    view.add_item(LeaderboardButton(board, "siguiente", min(ultima, pagina + 1), version, disabled=pagina == ultima))
+    view.add_item(LeaderboardButton(board, "ultima", ultima, version, disabled=pagina == ultima))
+    return view
+
+async def enviar_leaderboard(interaction: discord.Interaction, board):
+    embed, pagina, total_paginas, version = await render_leaderboard(interaction.guild, board, 0)
+    if total_paginas == 1:
         await interaction.followup.send(embed=embed)
     else:
-        view = LeaderboardCoinsSimpleView(paginas, 0, len(usuarios_validos), total_dinero)
-        embed = crear_embed_coins_simple(paginas[0], 1, len(paginas), len(usuarios_validos), total_dinero)
-        await interaction.followup.send(embed=embed, view=view)
+        await interaction.followup.send(embed=embed, view=leaderboard_view(board, pagina, total_paginas, version))
+
+async def leaderboard_coins(interaction: discord.Interaction):
+    await member_names.sweep(interaction.guild)
+    if not len(balance_rank):
+        return await interaction.followup.send("😔 No hay usuarios con monedas en el servidor.", ephemeral=True)
+    await enviar_leaderboard(interaction, "coins")
+
+async def leaderboard_coins_cerca(interaction: discord.Interaction):
+    uid = str(interaction.user.id)
+    await member_names.sweep(interaction.guild)
+    while True:
+        cerca = balance_rank.around(uid)
+        if cerca is None:
+            return await interaction.followup.send("😔 Todavía no estás en el ranking: necesitás balance positivo.", ephemeral=True)
+        inicio, filas = cerca
+        await member_names.resolve(interaction.guild, [u for u, _ in filas])
+        if not any(u in balance_rank.excluded for u, _ in filas):
+            break
+    usuarios = [(u, money, nombre_usuario(interaction.guild, u)) for u, money in filas]
+    embed = crear_embed_coins_simple(usuarios, 1, 1, len(balance_rank), economy_stats.money_supply, posicion_inicio=inicio, destacar=uid)
+    embed.title = "📍 Leaderboard - Cerca tuyo"
+    embed.set_footer(text=f"Tu posición: #{balance_rank.rank(uid)} de {len(balance_rank)}")
+    await interaction.followup.send(embed=embed)
 
-def crear_embed_coins_simple(usuarios, pagina_actual, total_paginas, total_usuarios, total_dinero):
+def crear_embed_coins_simple(usuarios, pagina_actual, total_paginas, total_usuarios, total_dinero, posicion_inicio=None, destacar=None):
     descripcion = ""
-    posicion_inicio = (pagina_actual - 1) * 15 + 1
+    if posicion_inicio is None:
+        posicion_inicio = (pagina_actual - 1) * LEADERBOARD_POR_PAGINA["coins"] + 1
     for idx, (uid, money, nombre) in enumerate(usuarios):
         posicion = posicion_inicio + idx
         medalla = ""
@@ -2048,122 +4997,28 @@ def crear_embed_coins_simple(usuarios, pagina_actual, total_paginas, total_usuar
             medalla = "🔹 "
         else:
             medalla = "• "
-        descripcion += f"{medalla} **#{posicion}** {nombre}: `{fmt(int(money))} USD`\n"
+        if uid == destacar:
+            descripcion += f"{medalla} **#{posicion} {nombre}: `{fmt(int(money))} USD`** ⬅️\n"
+        else:
+            descripcion += f"{medalla} **#{posicion}** {nombre}: `{fmt(int(money))} USD`\n"
     embed = discord.Embed(title="💰 Leaderboard - Monedas", description=descripcion or "No hay usuarios en esta página.", color=discord.Color.gold())
     embed.add_field(name="📊 Estadísticas", value=f"👥 **Usuarios activos:** {total_usuarios}\n💰 **Dinero total:** {fmt(total_dinero)} USD", inline=False)
     embed.set_footer(text=f"Página {pagina_actual}/{total_paginas} • Mostrando {len(usuarios)} usuarios")
     return embed
 
-class LeaderboardCoinsSimpleView(discord.ui.View):
-    def __init__(self, paginas, pagina_index, total_usuarios, total_dinero):
-        super().__init__(timeout=60)
-        self.paginas = paginas
-        self.pagina_index = pagina_index
-        self.total_usuarios = total_usuarios
-        self.total_dinero = total_dinero
-        self.message = None
-        self.primera.disabled = (pagina_index == 0)
-        self.anterior.disabled = (pagina_index == 0)
-        self.siguiente.disabled = (pagina_index == len(paginas) - 1)
-        self.ultima.disabled = (pagina_index == len(paginas) - 1)
-        self.pagina_actual.label = f"Página {pagina_index + 1}/{len(paginas)}"
-    @discord.ui.button(label="⏪", style=discord.ButtonStyle.secondary)
-    async def primera(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index = 0
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="◀", style=discord.ButtonStyle.primary)
-    async def anterior(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index -= 1
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="Página 1/1", style=discord.ButtonStyle.gray, disabled=True)
-    async def pagina_actual(self, interaction: discord.Interaction, button: discord.ui.Button):
-        pass
-    @discord.ui.button(label="▶", style=discord.ButtonStyle.primary)
-    async def siguiente(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index += 1
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="⏩", style=discord.ButtonStyle.secondary)
-    async def ultima(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index = len(self.paginas) - 1
-        await self.actualizar_pagina(interaction)
-    async def actualizar_pagina(self, interaction: discord.Interaction):
-        self.primera.disabled = (self.pagina_index == 0)
-        self.anterior.disabled = (self.pagina_index == 0)
-        self.siguiente.disabled = (self.pagina_index == len(self.paginas) - 1)
-        self.ultima.disabled = (self.pagina_index == len(self.paginas) - 1)
-        self.pagina_actual.label = f"Página {self.pagina_index + 1}/{len(self.paginas)}"
-        embed = crear_embed_coins_simple(self.paginas[self.pagina_index], self.pagina_index + 1, len(self.paginas), self.total_usuarios, self.total_dinero)
-        await interaction.response.edit_message(embed=embed, view=self)
-    async def on_timeout(self):
-        if self.message:
-            try:
-                for item in self.children:
-                    item.disabled = True
-                await self.message.edit(view=self)
-            except:
-                pass
-
 async def leaderboard_crypto(interaction: discord.Interaction):
-    cryptos_data = load_cryptos()
-    holders = cryptos_data.get("holders", {})
-    if not holders:
+    if not cryptos.get("holders"):
         return await interaction.followup.send("😔 No hay holders de cryptos todavía.", ephemeral=True)
-    usuarios_crypto = []
-    for uid, cryptos_dict in holders.items():
-        tiene_crypto = False
-        cryptos_detalle = []
-        for sym in ("RSC", "CTC", "MMC"):
-            cantidad = cryptos_dict.get(sym, 0)
-            if cantidad > 0:
-                tiene_crypto = True
-                cryptos_detalle.append(f"{sym}: {cantidad:.2f}")
-        if tiene_crypto:
-            try:
-                if str(uid).isdigit():
-                    user = interaction.guild.get_member(int(uid))
-                    if user:
-                        usuarios_crypto.append((uid, user.display_name, cryptos_detalle))
-                    else:
-                        try:
-                            user = await interaction.guild.fetch_member(int(uid))
-                            if user:
-                                usuarios_crypto.append((uid, user.display_name, cryptos_detalle))
-                            else:
-                                usuarios_crypto.append((uid, f"Usuario {uid[:4]}", cryptos_detalle))
-                        except:
-                            usuarios_crypto.append((uid, f"Usuario {uid[:4]}", cryptos_detalle))
-            except:
-                usuarios_crypto.append((uid, f"Usuario {uid[:4]}", cryptos_detalle))
-    if not usuarios_crypto:
+    snap = await leaderboard_snapshots.get(interaction.guild, "crypto")
+    if not snap["filas"]:
         return await interaction.followup.send("😔 No hay usuarios con cryptos en el servidor.", ephemeral=True)
-    def total_cryptos(user_data):
-        detalles = user_data[2]
-        total = 0
-        for d in detalles:
-            partes = d.split(": ")
-            if len(partes) == 2:
-                try:
-                    total += float(partes[1])
-                except:
-                    pass
-        return total
-    usuarios_crypto.sort(key=total_cryptos, reverse=True)
-    items_por_pagina = 10
-    paginas = []
-    for i in range(0, len(usuarios_crypto), items_por_pagina):
-        paginas.append(usuarios_crypto[i:i + items_por_pagina])
-    if len(paginas) == 1:
-        embed = crear_embed_crypto_simple(paginas[0], 1, 1, len(usuarios_crypto))
-        await interaction.followup.send(embed=embed)
-    else:
-        view = LeaderboardCryptoSimpleView(paginas, 0, len(usuarios_crypto))
-        embed = crear_embed_crypto_simple(paginas[0], 1, len(paginas), len(usuarios_crypto))
-        await interaction.followup.send(embed=embed, view=view)
+    await enviar_leaderboard(interaction, "crypto")
 
-def crear_embed_crypto_simple(usuarios, pagina_actual, total_paginas, total_usuarios):
+def crear_embed_crypto_simple(usuarios, pagina_actual, total_paginas, total_usuarios, valor_total):
     descripcion = ""
     posicion_inicio = (pagina_actual - 1) * 10 + 1
-    for idx, (uid, nombre, detalles) in enumerate(usuarios):
+    holders = cryptos.get("holders", {})
+    for idx, (uid, nombre, valor) in enumerate(usuarios):
         posicion = posicion_inicio + idx
         medalla = ""
         if posicion == 1:
@@ -2176,61 +5031,15 @@ def crear_embed_crypto_simple(usuarios, pagina_actual, total_paginas, total_usua
             medalla = "🔹 "
         else:
             medalla = "• "
-        crypto_text = "\n".join(detalles) if detalles else "Sin cryptos"
-        descripcion += f"{medalla} **#{posicion}** {nombre}\n`{crypto_text}`\n\n"
-    embed = discord.Embed(title="💎 Leaderboard - Tenencias de Cryptos", description=descripcion or "No hay usuarios en esta página.", color=discord.Color.blue())
-    embed.add_field(name="📊 Estadísticas", value=f"👥 **Holders activos:** {total_usuarios}", inline=False)
+        tenencias = holders.get(uid, {})
+        detalles = [f"{sym}: {tenencias.get(sym, 0):.2f}" for sym in CRYPTO_SYMBOLS if tenencias.get(sym, 0) > 0]
+        crypto_text = " | ".join(detalles) if detalles else "Sin cryptos"
+        descripcion += f"{medalla} **#{posicion}** {nombre} • ≈ `{fmt(valor)} USD`\n`{crypto_text}`\n\n"
+    embed = discord.Embed(title="💎 Leaderboard - Cryptos (valor en USD)", description=descripcion or "No hay usuarios en esta página.", color=discord.Color.blue())
+    embed.add_field(name="📊 Estadísticas", value=f"👥 **Holders activos:** {total_usuarios}\n💰 **Valor total:** ≈ {fmt(valor_total)} USD", inline=False)
     embed.set_footer(text=f"Página {pagina_actual}/{total_paginas} • Mostrando tenencias")
     return embed
 
-class LeaderboardCryptoSimpleView(discord.ui.View):
-    def __init__(self, paginas, pagina_index, total_usuarios):
-        super().__init__(timeout=60)
-        self.paginas = paginas
-        self.pagina_index = pagina_index
-        self.total_usuarios = total_usuarios
-        self.message = None
-        self.primera.disabled = (pagina_index == 0)
-        self.anterior.disabled = (pagina_index == 0)
-        self.siguiente.disabled = (pagina_index == len(paginas) - 1)
-        self.ultima.disabled = (pagina_index == len(paginas) - 1)
-        self.pagina_actual.label = f"Página {pagina_index + 1}/{len(paginas)}"
-    @discord.ui.button(label="⏪", style=discord.ButtonStyle.secondary)
-    async def primera(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index = 0
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="◀", style=discord.ButtonStyle.primary)
-    async def anterior(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index -= 1
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="Página 1/1", style=discord.ButtonStyle.gray, disabled=True)
-    async def pagina_actual(self, interaction: discord.Interaction, button: discord.ui.Button):
-        pass
-    @discord.ui.button(label="▶", style=discord.ButtonStyle.primary)
-    async def siguiente(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index += 1
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="⏩", style=discord.ButtonStyle.secondary)
-    async def ultima(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index = len(self.paginas) - 1
-        await self.actualizar_pagina(interaction)
-    async def actualizar_pagina(self, interaction: discord.Interaction):
-        self.primera.disabled = (self.pagina_index == 0)
-        self.anterior.disabled = (self.pagina_index == 0)
-        self.siguiente.disabled = (self.pagina_index == len(self.paginas) - 1)
-        self.ultima.disabled = (self.pagina_index == len(self.paginas) - 1)
-        self.pagina_actual.label = f"Página {self.pagina_index + 1}/{len(self.paginas)}"
-        embed = crear_embed_crypto_simple(self.paginas[self.pagina_index], self.pagina_index + 1, len(self.paginas), self.total_usuarios)
-        await interaction.response.edit_message(embed=embed, view=self)
-    async def on_timeout(self):
-        if self.message:
-            try:
-                for item in self.children:
-                    item.disabled = True
-                await self.message.edit(view=self)
-            except:
-                pass
-
 # ============================
 # /levelboard
 # ============================
@@ -2239,45 +5048,12 @@ async def levelboard(interaction: discord.Interaction):
     if not await ensure_guild_or_reply(interaction):
         return
     await interaction.response.defer()
-    levels_data = load_levels()
-    if not levels_data:
+    if not levels_store:
         return await interaction.followup.send("😔 No hay datos de niveles todavía.", ephemeral=True)
-    usuarios_niveles = []
-    for uid, data in levels_data.items():
-        xp = data.get("xp", 0)
-        level = level_from_xp(xp)
-        if level > 0:
-            try:
-                if str(uid).isdigit():
-                    user = interaction.guild.get_member(int(uid))
-                    if user:
-                        usuarios_niveles.append((uid, level, xp, user.display_name))
-                    else:
-                        try:
-                            user = await interaction.guild.fetch_member(int(uid))
-                            if user:
-                                usuarios_niveles.append((uid, level, xp, user.display_name))
-                        except:
-                            continue
-            except:
-                continue
-    if not usuarios_niveles:
+    snap = await leaderboard_snapshots.get(interaction.guild, "levels")
+    if not snap["filas"]:
         return await interaction.followup.send("😔 No hay usuarios con niveles en el servidor.", ephemeral=True)
-    usuarios_niveles.sort(key=lambda x: x[1], reverse=True)
-    total_niveles = sum(level for _, level, _, _ in usuarios_niveles)
-    nivel_mas_alto = usuarios_niveles[0][1]
-    promedio_nivel = total_niveles // len(usuarios_niveles) if usuarios_niveles else 0
-    items_por_pagina = 15
-    paginas = []
-    for i in range(0, len(usuarios_niveles), items_por_pagina):
-        paginas.append(usuarios_niveles[i:i + items_por_pagina])
-    if len(paginas) == 1:
-        embed = crear_embed_levelboard(paginas[0], 1, 1, len(usuarios_niveles), total_niveles, nivel_mas_alto, promedio_nivel)
-        await interaction.followup.send(embed=embed)
-    else:
-        view = LevelboardView(paginas, 0, len(usuarios_niveles), total_niveles, nivel_mas_alto, promedio_nivel)
-        embed = crear_embed_levelboard(paginas[0], 1, len(paginas), len(usuarios_niveles), total_niveles, nivel_mas_alto, promedio_nivel)
-        await interaction.followup.send(embed=embed, view=view)
+    await enviar_leaderboard(interaction, "levels")
 
 def crear_embed_levelboard(usuarios, pagina_actual, total_paginas, total_usuarios, total_niveles, nivel_mas_alto, promedio_nivel):
     descripcion = ""
@@ -2300,57 +5076,6 @@ def crear_embed_levelboard(usuarios, pagina_actual, total_paginas, total_usuario
     embed.set_footer(text=f"Página {pagina_actual}/{total_paginas} • Mostrando {len(usuarios)} usuarios")
     return embed
 
-class LevelboardView(discord.ui.View):
-    def __init__(self, paginas, pagina_index, total_usuarios, total_niveles, nivel_mas_alto, promedio_nivel):
-        super().__init__(timeout=60)
-        self.paginas = paginas
-        self.pagina_index = pagina_index
-        self.total_usuarios = total_usuarios
-        self.total_niveles = total_niveles
-        self.nivel_mas_alto = nivel_mas_alto
-        self.promedio_nivel = promedio_nivel
-        self.message = None
-        self.primera.disabled = (pagina_index == 0)
-        self.anterior.disabled = (pagina_index == 0)
-        self.siguiente.disabled = (pagina_index == len(paginas) - 1)
-        self.ultima.disabled = (pagina_index == len(paginas) - 1)
-        self.pagina_actual.label = f"Página {pagina_index + 1}/{len(paginas)}"
-    @discord.ui.button(label="⏪", style=discord.ButtonStyle.secondary)
-    async def primera(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index = 0
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="◀", style=discord.ButtonStyle.primary)
-    async def anterior(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index -= 1
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="Página 1/1", style=discord.ButtonStyle.gray, disabled=True)
-    async def pagina_actual(self, interaction: discord.Interaction, button: discord.ui.Button):
-        pass
-    @discord.ui.button(label="▶", style=discord.ButtonStyle.primary)
-    async def siguiente(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index += 1
-        await self.actualizar_pagina(interaction)
-    @discord.ui.button(label="⏩", style=discord.ButtonStyle.secondary)
-    async def ultima(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.pagina_index = len(self.paginas) - 1
-        await self.actualizar_pagina(interaction)
-    async def actualizar_pagina(self, interaction: discord.Interaction):
-        self.primera.disabled = (self.pagina_index == 0)
-        self.anterior.disabled = (self.pagina_index == 0)
-        self.siguiente.disabled = (self.pagina_index == len(self.paginas) - 1)
-        self.ultima.disabled = (self.pagina_index == len(self.paginas) - 1)
-        self.pagina_actual.label = f"Página {self.pagina_index + 1}/{len(self.paginas)}"
-        embed = crear_embed_levelboard(self.paginas[self.pagina_index], self.pagina_index + 1, len(self.paginas), self.total_usuarios, self.total_niveles, self.nivel_mas_alto, self.promedio_nivel)
-        await interaction.response.edit_message(embed=embed, view=self)
-    async def on_timeout(self):
-        if self.message:
-            try:
-                for item in self.children:
-                    item.disabled = True
-                await self.message.edit(view=self)
-            except:
-                pass
-
 # ============================
 # /setlevel
 # ============================
@@ -2369,8 +5094,7 @@ async def setlevel(interaction: discord.Interaction, usuario: discord.User, acci
     if cantidad < 0:
         return await interaction.response.send_message("❌ La cantidad no puede ser negativa.", ephemeral=True)
     uid = str(usuario.id)
-    levels_data = load_levels()
-    current_xp = levels_data.get(uid, {}).get("xp", 0)
+    current_xp = levels_store.get_xp(uid)
     current_level = level_from_xp(current_xp)
     nuevo_nivel = current_level
     if accion.value == "add":
@@ -2385,10 +5109,7 @@ async def setlevel(interaction: discord.Interaction, usuario: discord.User, acci
     nueva_xp = 0
     for lvl in range(1, nuevo_nivel + 1):
         nueva_xp += xp_required_for_level(lvl)
-    if uid not in levels_data:
-        levels_data[uid] = {}
-    levels_data[uid]["xp"] = nueva_xp
-    save_levels(levels_data)
+    levels_store.set_xp(uid, nueva_xp)
     embed = discord.Embed(title="👑 Modificación de Nivel", description=accion_texto, color=discord.Color.green())
     embed.add_field(name="📊 Nivel anterior", value=f"`{current_level}`", inline=True)
     embed.add_field(name="📈 Nivel nuevo", value=f"`{nuevo_nivel}`", inline=True)
@@ -2404,21 +5125,11 @@ async def info(interaction: discord.Interaction):
     if not await ensure_guild_or_reply(interaction):
         return
     await interaction.response.defer()
-    balances_data = load_json(BALANCES_FILE, {})
-    total_monedas = sum(balances_data.values())
-    usuarios_con_monedas = len([b for b in balances_data.values() if b > 0])
-    cryptos_data = load_cryptos()
-    holders = cryptos_data.get("holders", {})
-    total_crypto_holders = len([h for h in holders.values() if sum(h.values()) > 0])
-    levels_data = load_levels()
-    total_niveles = 0
-    usuarios_con_nivel = 0
-    for uid, data in levels_data.items():
-        xp = data.get("xp", 0)
-        level = level_from_xp(xp)
-        if level > 0:
-            total_niveles += level
-            usuarios_con_nivel += 1
+    total_monedas = economy_stats.money_supply
+    usuarios_con_monedas = economy_stats.positive_users
+    total_crypto_holders = economy_stats.crypto_holders
+    total_niveles = economy_stats.total_levels
+    usuarios_con_nivel = economy_stats.users_with_level
     precio_actual = load_level_price()
     venta = int(precio_actual * 0.70)
     embed = discord.Embed(title="📊 Información Económica", description="Estadísticas generales de la economía", color=discord.Color.blue())
@@ -2429,6 +5140,44 @@ async def info(interaction: discord.Interaction):
     embed.add_field(name="📐 Fórmula", value=f"`Precio = 0.115 × √({fmt(total_monedas)}) = {fmt(precio_actual)}`", inline=False)
     await interaction.followup.send(embed=embed)
 # ============================
+# /rank - Posición en el ranking de monedas
+# ============================
+@tree.command(name="rank", description="🏅 Ver tu posición en el ranking de monedas")
+@app_commands.describe(usuario="Usuario (opcional)")
+async def rank(interaction: discord.Interaction, usuario: Optional[discord.User] = None):
+    if not await ensure_guild_or_reply(interaction):
+        return
+    u = usuario or interaction.user
+    uid = str(u.id)
+    await interaction.response.defer()
+    await member_names.sweep(interaction.guild)
+    while True:
+        posicion = balance_rank.rank(uid)
+        if posicion is None:
+            msg = f"😔 {u.display_name} no está en el ranking." if usuario else "😔 Todavía no estás en el ranking: necesitás balance positivo."
+            return await interaction.followup.send(msg)
+        if posicion == 1:
+            break
+        arriba_uid, arriba_money = balance_rank.range(posicion - 2, 1)[0]
+        # Si el de arriba se fue del servidor sale del ranking y se vuelve a calcular
+        await member_names.resolve(interaction.guild, [arriba_uid])
+        if arriba_uid not in balance_rank.excluded:
+            break
+    bal = balances.get(uid, 0)
+    total = len(balance_rank)
+    embed = discord.Embed(title=f"🏅 Ranking — {u.display_name}", color=discord.Color.gold())
+    embed.add_field(name="📍 Posición", value=f"`#{posicion}` de {fmt(total)}", inline=True)
+    embed.add_field(name="💰 Balance", value=f"`{fmt(bal)} USD`", inline=True)
+    embed.add_field(name="📊 Top", value=f"`{posicion / total * 100:.1f}%`", inline=True)
+    if posicion > 1:
+        embed.add_field(
+            name="⬆️ Siguiente puesto",
+            value=f"{nombre_usuario(interaction.guild, arriba_uid)} con `{fmt(arriba_money)} USD` (te faltan `{fmt(arriba_money - bal)} USD`)",
+            inline=False
+        )
+    await interaction.followup.send(embed=embed)
+
+# ============================
 # /casino_stock - Ver stock del casino
 # ============================
 @tree.command(name="casino_stock", description="🏦 Ver el stock actual del casino")
@@ -2436,7 +5185,7 @@ async def casino_stock(interaction: discord.Interaction):
     if not await ensure_guild_or_reply(interaction):
         return
     
-    stock = load_casino_stock()
+    stock = casino_bankroll.stock
     
     embed = discord.Embed(
         title="🏦 Stock del Casino",
@@ -2444,6 +5193,14 @@ async def casino_stock(interaction: discord.Interaction):
         color=discord.Color.blue()
     )
     
+    for juego, totales in sorted(casino_bankroll["juegos"].items()):
+        neto = totales["apostado"] - totales["pagado"]
+        embed.add_field(
+            name=f"🎲 {juego.capitalize()}",
+            value=f"Manos: {fmt(totales['manos'])}\nApostado: {fmt(totales['apostado'])} USD\nPagado: {fmt(totales['pagado'])} USD\nNeto casino: {fmt(neto)} USD",
+            inline=True
+        )
+    
     if stock < 50000:
         embed.add_field(name="🔴 CASINO CERRADO", value="No se puede apostar hasta que el stock se recupere.", inline=False)
     elif stock < 100000:
@@ -2452,6 +5209,28 @@ async def casino_stock(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 
+# ============================
+# /levelup_queue - Estado de la cola de anuncios (Admin)
+# ============================
+@tree.command(name="levelup_queue", description="👑 (Admin) Ver el estado de la cola de anuncios de nivel")
+async def levelup_queue(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        return await interaction.response.send_message("🚫 Solo admins.", ephemeral=True)
+    stats = level_up_announcer.stats
+    embed = discord.Embed(title="📣 Cola de anuncios de nivel", color=discord.Color.blue())
+    embed.add_field(name="En cola", value=f"{fmt(level_up_announcer.depth)} en {len(level_up_announcer.pending)} canales", inline=True)
+    embed.add_field(name="Enviando", value=fmt(len(level_up_announcer.sending)), inline=True)
+    embed.add_field(name="XP pendiente", value=f"{fmt(len(xp_batcher.pending))} usuarios", inline=True)
+    embed.add_field(
+        name="Totales",
+        value=(f"Encolados: {fmt(stats['encolados'])}\nCombinados: {fmt(stats['combinados'])}\n"
+               f"Enviados: {fmt(stats['enviados'])} en {fmt(stats['embeds'])} embeds\n"
+               f"Descartados: {fmt(stats['descartados'])}\nRate limited: {fmt(stats['rate_limited'])}"),
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 # ============================
 # /add_casino_stock - Agregar stock (Admin)
 # ============================
@@ -2465,9 +5244,7 @@ async def add_casino_stock(interaction: discord.Interaction, cantidad: int):
     if cantidad <= 0:
         return await interaction.response.send_message("❌ La cantidad debe ser positiva.", ephemeral=True)
     
-    stock_actual = load_casino_stock()
-    nuevo_stock = stock_actual + cantidad
-    save_casino_stock(nuevo_stock)
+    nuevo_stock = casino_bankroll.adjust(cantidad)
     
     embed = discord.Embed(
         title="🏦 Stock del Casino Actualizado",
@@ -2489,8 +5266,7 @@ async def updatelevelprice(interaction: discord.Interaction):
     await interaction.response.defer()
     
     # Obtener dinero total
-    balances_data = load_json(BALANCES_FILE, {})
-    dinero_total = sum(balances_data.values())
+    dinero_total = economy_stats.money_supply
     
     # Calcular nuevo precio
     nuevo_precio = calcular_precio_nivel(dinero_total)
@@ -2514,13 +5290,41 @@ async def updatelevelprice(interaction: discord.Interaction):
     embed.set_footer(text=f"Actualizado por {interaction.user.display_name}")
     
     await interaction.followup.send(embed=embed)
+# ============================
+# RECUPERACIÓN DEL JOURNAL
+# ============================
+def apply_journal_record(record):
+    kind = record.get("k")
+    uid = record.get("u")
+    if kind == "batch":
+        for sub in record["r"]:
+            apply_journal_record(sub)
+    elif kind in ("debit", "credit"):
+        balances[uid] = record["b"]
+    elif kind == "delete":
+        balances.pop(uid, None)
+    elif kind == "crypto":
+        set_holding(uid, record["s"], record["h"])
+    elif kind == "level":
+        levels_store.set_xp(uid, record["xp"])
+    elif kind in ("order", "order_close"):
+        order_book.apply_record(record)
+
+journal.recover(apply_journal_record)
+economy_stats.rebuild()
+balance_rank.rebuild(balances.items())
+holdings_matrix.rebuild(cryptos.get("holders", {}))
+holdings_matrix.refresh_ranking(crypto_prices())
+
 # ============================
 # RUN
 # ============================
 if __name__ == "__main__":
-    save_json(BALANCES_FILE, balances)
-    save_json(SHARED_FILE, shared_accounts)
-    save_cryptos(cryptos)
+    shared_accounts.save()
+    cryptos.save()
+    flush_stores_sync()
+    atexit.register(flush_stores_sync)
+    start_chart_pool()
     keep_alive()
     if not TOKEN:
         print("❌ TOKEN no encontrado en variables de entorno")
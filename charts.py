@@ -0,0 +1,170 @@
+"""
+Gráficos de precios de /cryptostatus.
+
+Estas funciones corren en los procesos del pool de gráficos del bot: reciben datos planos
+(los precios como bytes de un array('d')) y devuelven el PNG ya codificado.
+Hay dos renderers: uno liviano con Pillow (el default) y otro con matplotlib, de mejor
+calidad, que se importa recién cuando se usa. matplotlib va con la API orientada a objetos
+(Figure), sin el estado global de pyplot.
+"""
+import importlib.util
+import io
+from array import array
+
+COLORS = {"RSC": "#e74c3c", "CTC": "#3498db", "MMC": "#2ecc71"}
+ETIQUETA_X = "Tiempo (5m por punto)"
+
+
+def _precios(raw):
+    valores = array("d")
+    valores.frombytes(raw)
+    return valores
+
+
+def _guardar(fig, dpi):
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format="png", dpi=dpi)
+    return buf.getvalue()
+
+
+def render_price_chart_matplotlib(sym, raw, size, etiqueta=ETIQUETA_X):
+    """Línea con área de un solo símbolo."""
+    import matplotlib.style
+    from matplotlib.figure import Figure
+
+    ancho, alto, dpi = size
+    prices = _precios(raw)
+    with matplotlib.style.context("dark_background"):
+        fig = Figure(figsize=(ancho, alto))
+        ax = fig.subplots()
+        ax.plot(prices, linewidth=2, color="gold")
+        ax.set_title(f"{sym} – Movimiento de precio")
+        ax.set_xlabel(etiqueta)
+        ax.set_ylabel("Precio (USD)")
+        ax.fill_between(range(len(prices)), prices, alpha=0.3, color="gold")
+        ax.grid(True, alpha=0.3)
+        return _guardar(fig, dpi)
+
+
+def render_market_chart_matplotlib(series, size, rango="24h", etiqueta=ETIQUETA_X, colores=None):
+    """Todas las monedas en un mismo gráfico; series es {símbolo: bytes de precios}."""
+    colores = colores or COLORS
+    import matplotlib.style
+    from matplotlib.figure import Figure
+
+    ancho, alto, dpi = size
+    with matplotlib.style.context("dark_background"):
+        fig = Figure(figsize=(ancho, alto))
+        ax = fig.subplots()
+        for sym, raw in series.items():
+            ax.plot(_precios(raw), linewidth=2, color=colores.get(sym), label=sym)
+        ax.set_title(f"📊 Movimiento de precios - Todas las cryptos ({rango})")
+        ax.set_xlabel(etiqueta)
+        ax.set_ylabel("Precio (USD)")
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+        return _guardar(fig, dpi)
+
+
+# ---------- Pillow ----------
+FONDO = (0, 0, 0)
+GRILLA = (255, 255, 255, 60)
+TEXTO = (230, 230, 230, 255)
+DORADO = (255, 215, 0)
+
+
+def _hex(color):
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _lienzo(size):
+    from PIL import Image, ImageDraw, ImageFont
+
+    ancho, alto, dpi = size
+    escala = dpi / 100
+    # Lienzo RGB con Draw en modo "RGBA": así los colores con alpha se mezclan con el fondo
+    img = Image.new("RGB", (int(ancho * dpi), int(alto * dpi)), FONDO)
+    fuentes = (ImageFont.load_default(size=int(14 * escala)), ImageFont.load_default(size=int(11 * escala)))
+    return img, ImageDraw.Draw(img, "RGBA"), escala, fuentes
+
+
+def _ejes(draw, img, escala, fuentes, titulo, lo, hi, etiqueta):
+    """Dibuja título, grilla y etiquetas; devuelve la caja (x0, y0, x1, y1) del área del gráfico."""
+    titulo_font, font = fuentes
+    w, h = img.size
+    caja = (int(80 * escala), int(40 * escala), w - int(20 * escala), h - int(35 * escala))
+    x0, y0, x1, y1 = caja
+    draw.text(((x0 + x1) / 2, 12 * escala), titulo, fill=TEXTO, font=titulo_font, anchor="mt")
+    for k in range(5):
+        y = y1 - (y1 - y0) * k / 4
+        draw.line([(x0, y), (x1, y)], fill=GRILLA, width=max(1, int(escala)))
+        draw.text((x0 - 8 * escala, y), f"{lo + (hi - lo) * k / 4:,.2f}", fill=TEXTO, font=font, anchor="rm")
+    draw.rectangle(caja, outline=TEXTO, width=max(1, int(escala)))
+    draw.text(((x0 + x1) / 2, h - 6 * escala), etiqueta, fill=TEXTO, font=font, anchor="mb")
+    return caja
+
+
+def _rango(*series):
+    lo = min(min(s) for s in series)
+    hi = max(max(s) for s in series)
+    margen = (hi - lo) * 0.05 or max(abs(hi) * 0.05, 1)
+    return lo - margen, hi + margen
+
+
+def _puntos(valores, lo, hi, caja):
+    x0, y0, x1, y1 = caja
+    paso = (x1 - x0) / max(1, len(valores) - 1)
+    alto = (y1 - y0) / (hi - lo)
+    return [(x0 + i * paso, y1 - (v - lo) * alto) for i, v in enumerate(valores)]
+
+
+def _png(img):
+    from PIL import Image
+
+    # Los gráficos tienen pocos colores: con paleta el PNG sale más chico y se codifica más rápido
+    buf = io.BytesIO()
+    img.quantize(64, method=Image.Quantize.FASTOCTREE).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_price_chart_pillow(sym, raw, size, etiqueta=ETIQUETA_X):
+    prices = _precios(raw)
+    img, draw, escala, fuentes = _lienzo(size)
+    lo, hi = _rango(prices)
+    caja = _ejes(draw, img, escala, fuentes, f"{sym} - Movimiento de precio", lo, hi, etiqueta)
+    puntos = _puntos(prices, lo, hi, caja)
+    draw.polygon(puntos + [(puntos[-1][0], caja[3]), (puntos[0][0], caja[3])], fill=DORADO + (77,))
+    draw.line(puntos, fill=DORADO + (255,), width=max(1, int(2 * escala)), joint="curve")
+    return _png(img)
+
+
+def render_market_chart_pillow(series, size, rango="24h", etiqueta=ETIQUETA_X, colores=None):
+    colores = colores or COLORS
+    datos = {sym: _precios(raw) for sym, raw in series.items()}
+    img, draw, escala, fuentes = _lienzo(size)
+    lo, hi = _rango(*datos.values())
+    caja = _ejes(draw, img, escala, fuentes, f"Movimiento de precios - Todas las cryptos ({rango})", lo, hi, etiqueta)
+    for sym, prices in datos.items():
+        draw.line(_puntos(prices, lo, hi, caja), fill=_hex(colores.get(sym, "#ffffff")) + (255,), width=max(1, int(2 * escala)), joint="curve")
+    # Leyenda arriba a la derecha
+    font = fuentes[1]
+    x, y = caja[2] - 70 * escala, caja[1] + 8 * escala
+    for sym in datos:
+        draw.line([(x, y), (x + 18 * escala, y)], fill=_hex(colores.get(sym, "#ffffff")) + (255,), width=max(1, int(2 * escala)))
+        draw.text((x + 24 * escala, y), sym, fill=TEXTO, font=font, anchor="lm")
+        y += 16 * escala
+    return _png(img)
+
+
+RENDERERS = {
+    "pillow": (render_price_chart_pillow, render_market_chart_pillow),
+    "matplotlib": (render_price_chart_matplotlib, render_market_chart_matplotlib),
+}
+MODULOS = {"pillow": "PIL", "matplotlib": "matplotlib"}
+
+
+def renderer_available(nombre):
+    """Sin importar nada: solo se fija si el paquete está instalado."""
+    return nombre in RENDERERS and importlib.util.find_spec(MODULOS[nombre]) is not None
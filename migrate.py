@@ -0,0 +1,196 @@
+"""
+Migración offline de los JSON de data/ a las tablas de resona.db.
+
+    python migrate.py [--data-dir data] [--db resona.db] [--batch 50000] [--replace]
+
+Lee balances.json en streaming (nunca carga el archivo entero en memoria), inserta por lotes con
+executemany dentro de una sola transacción grande, crea los índices al final y muestra cantidad de
+filas y suma de balances del origen y de la base para verificar que no se perdió nada.
+Correrlo con el bot apagado.
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+
+CHUNK_SIZE = 1 << 20
+DEFAULT_BATCH = 50_000
+LOOKAHEAD = 64
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, balance REAL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS shared_accounts ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, user1_id INTEGER, user2_id INTEGER, balance REAL DEFAULT 0)",
+)
+INDEXES = {
+    "idx_users_balance": "CREATE INDEX idx_users_balance ON users (balance)",
+    "idx_shared_user1": "CREATE INDEX idx_shared_user1 ON shared_accounts (user1_id)",
+    "idx_shared_user2": "CREATE INDEX idx_shared_user2 ON shared_accounts (user2_id)",
+}
+USERS_SQL = "INSERT INTO users (user_id, balance) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET balance = excluded.balance"
+SHARED_SQL = "INSERT OR REPLACE INTO shared_accounts (id, user1_id, user2_id, balance) VALUES (?, ?, ?, ?)"
+
+
+def iter_json_object(path):
+    """
+    Recorre un objeto JSON de primer nivel ({"clave": valor, ...}) sin cargarlo entero:
+    lee de a bloques y decodifica cada par con raw_decode.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(CHUNK_SIZE)
+        pos = 0
+        eof = False
+
+        def skip(chars):
+            nonlocal buf, pos, eof
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                buf, pos = f.read(CHUNK_SIZE), 0
+                eof = not buf
+
+        def decode():
+            nonlocal buf, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # Un número cortado al final del bloque ("1e" de "1e3") decodifica igual:
+                    # si quedó pegado al final, pedir más datos antes de aceptarlo
+                    if eof or len(buf) - end > LOOKAHEAD:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                chunk = f.read(CHUNK_SIZE)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+
+        skip(" \t\r\n﻿")
+        if buf[pos:pos + 1] != "{":
+            raise ValueError(f"{path}: se esperaba un objeto JSON")
+        pos += 1
+        while True:
+            skip(" \t\r\n,")
+            if eof and pos >= len(buf):
+                raise ValueError(f"{path}: archivo truncado")
+            if buf[pos] == "}":
+                return
+            key = decode()
+            skip(" \t\r\n:")
+            yield key, decode()
+
+
+def iter_shared_accounts(path):
+    """Cuentas compartidas: acepta {"id": {...}} o una lista de cuentas."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data.items() if isinstance(data, dict) else enumerate(data, start=1)
+    for key, cuenta in items:
+        miembros = cuenta.get("users") or cuenta.get("members") or [cuenta.get("user1_id"), cuenta.get("user2_id")]
+        miembros = (list(miembros) + [None, None])[:2]
+        cuenta_id = int(key) if str(key).isdigit() else None
+        yield (cuenta_id, *[int(m) if m is not None else None for m in miembros], float(cuenta.get("balance", 0)))
+
+
+def load_batches(db, sql, rows, batch_size):
+    """Inserta rows por lotes de batch_size; devuelve (cantidad, suma de balances)."""
+    batch = []
+    count = 0
+    total = 0.0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.executemany(sql, batch)
+            count += len(batch)
+            total += math.fsum(r[-1] for r in batch)
+            batch.clear()
+    if batch:
+        db.executemany(sql, batch)
+        count += len(batch)
+        total += math.fsum(r[-1] for r in batch)
+    return count, total
+
+
+def user_rows(path):
+    for uid, balance in iter_json_object(path):
+        if not str(uid).isdigit():
+            print(f"⚠️ Se ignora el usuario inválido {uid!r}")
+            continue
+        yield int(uid), float(balance)
+
+
+def verify(db, table, count, total):
+    filas, suma = db.execute(f"SELECT COUNT(*), TOTAL(balance) FROM {table}").fetchone()
+    ok = filas == count and math.isclose(suma, total, rel_tol=1e-9, abs_tol=1e-6)
+    print(f"   {table}: origen {count} filas / Σ {total:,.2f} • base {filas} filas / Σ {suma:,.2f} {'✅' if ok else '❌'}")
+    return ok
+
+
+def migrate(data_dir, db_path, batch_size, replace=False):
+    db = sqlite3.connect(db_path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    # Durante la carga no hace falta fsync por transacción: si se corta, se vuelve a correr
+    db.execute("PRAGMA synchronous=OFF")
+    db.execute("PRAGMA cache_size=-65536")
+    for sql in SCHEMA:
+        db.execute(sql)
+    ocupadas = [t for t in ("users", "shared_accounts") if db.execute(f"SELECT 1 FROM {t} LIMIT 1").fetchone()]
+    if ocupadas and not replace:
+        print(f"❌ {db_path} ya tiene datos en {', '.join(ocupadas)}; usá --replace para pisarlos")
+        db.close()
+        return False
+    # Los índices se construyen al final, de una sola pasada, en vez de mantenerlos fila a fila
+    for name in INDEXES:
+        db.execute(f"DROP INDEX IF EXISTS {name}")
+
+    inicio = time.perf_counter()
+    resultados = {}
+    db.execute("BEGIN")
+    try:
+        for table in ocupadas:
+            db.execute(f"DELETE FROM {table}")
+        balances_path = os.path.join(data_dir, "balances.json")
+        if os.path.exists(balances_path):
+            resultados["users"] = load_batches(db, USERS_SQL, user_rows(balances_path), batch_size)
+        shared_path = os.path.join(data_dir, "sharedaccounts.json")
+        resultados["shared_accounts"] = load_batches(db, SHARED_SQL, iter_shared_accounts(shared_path), batch_size)
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    carga = time.perf_counter() - inicio
+
+    for sql in INDEXES.values():
+        db.execute(sql)
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("ANALYZE")
+    print(f"📥 Carga en {carga:.2f}s, índices en {time.perf_counter() - inicio - carga:.2f}s")
+
+    ok = True
+    for table, (count, total) in resultados.items():
+        ok = verify(db, table, count, total) and ok
+    db.close()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migra los JSON de data/ a SQLite")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--db", default="resona.db")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH)
+    parser.add_argument("--replace", action="store_true", help="vaciar las tablas antes de cargar")
+    args = parser.parse_args(argv)
+    return 0 if migrate(args.data_dir, args.db, args.batch, args.replace) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())